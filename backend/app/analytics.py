@@ -0,0 +1,253 @@
+"""Resúmenes de curvas de carga (S02) y cierres (S04) con NumPy.
+
+En vez de mandar ~35k filas por medidor/año al navegador, se devuelve:
+
+- energía diaria y mensual (importada/exportada),
+- demanda máxima por intervalo (energía del intervalo / duración),
+- intervalos faltantes (paso detectado como la moda entre marcas de tiempo),
+- tensiones min/máx/promedio (columnas cuyo significado en la Biblioteca de
+  Significados es "Tensión ...": L1v, L2v, L3v).
+
+S02 trae energía por intervalo; S04/S4E traen registros acumulados, así que
+ahí la energía de cada período es la diferencia entre lecturas consecutivas
+del mismo registro. Un cierre S04 viene aplanado en una fila por contrato
+(Ctr) y período tarifario (Pt): se resta dentro de cada (Ctr, Pt), nunca Pt1
+menos Pt0. El total es el del período 0 (total de todos los períodos) del
+primer contrato; el detalle por contrato/período va en "by_period".
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:  # opcional (requirements.txt lo incluye)
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None
+
+from app.significados import meaning_for
+
+# Columnas de fecha (mismo orden que parseX de tecnica.js)
+TIME_KEYS = ("Fh", "fh", "Fecha", "fecha", "ActDate", "actdate")
+# Energía activa importada / exportada (el Excel usa Ala por AIa)
+IMPORT_KEYS = ("AIa", "Ala", "AI", "AIi")
+EXPORT_KEYS = ("AEa", "AE", "AEi")
+# Calidad del intervalo (Bc != 0 => intervalo marcado)
+QUALITY_KEYS = ("Bc",)
+# Reportes de registros acumulados (cierres)
+CUMULATIVE_REPORTS = ("S04", "S4E")
+# Contrato y período tarifario de cada valor de un cierre
+CONTRACT_KEYS = ("Ctr",)
+PERIOD_KEYS = ("Pt",)
+# Tope de rangos de huecos listados (el total va igual)
+MAX_GAP_RANGES = 200
+
+_STG_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})")
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _iso(v: Any) -> Optional[str]:
+    """Fh STG (YYYYMMDDhhmmss...) o ISO -> 'YYYY-MM-DDThh:mm:ss' (hora del medidor, sin zona).
+
+    None si no es una fecha válida (p.ej. Fh="00000000000000000W" de un registro vacío).
+    """
+    if v is None:
+        return None
+    s = str(v).strip()
+    m = _STG_RE.match(s)
+    try:
+        if m:
+            return datetime.strptime(s[:14], "%Y%m%d%H%M%S").isoformat(timespec="seconds")
+        return datetime.fromisoformat(s.replace("Z", "+00:00")).replace(tzinfo=None).isoformat(timespec="seconds")
+    except ValueError:
+        return None
+
+
+def _num(v: Any) -> float:
+    if v is None:
+        return float("nan")
+    try:
+        return float(str(v).strip().replace(",", "."))
+    except ValueError:
+        return float("nan")
+
+
+def _first_key(rows: Sequence[Dict[str, Any]], keys: Sequence[str]) -> Optional[str]:
+    """Primera clave de `keys` presente (también con prefijo 'Tag.clave')."""
+    present = set()
+    for r in rows[:50]:
+        present.update(r.keys())
+    for k in keys:
+        if k in present:
+            return k
+        for p in present:
+            if p.endswith("." + k):
+                return p
+    return None
+
+
+def _column(rows: Sequence[Dict[str, Any]], key: str) -> "np.ndarray":
+    return np.fromiter((_num(r.get(key)) for r in rows), dtype=np.float64, count=len(rows))
+
+
+def _voltage_keys(rows: Sequence[Dict[str, Any]], sig: Optional[Dict[str, str]]) -> List[str]:
+    keys: List[str] = []
+    seen = set()
+    for r in rows[:50]:
+        for k in r.keys():
+            if k in seen:
+                continue
+            seen.add(k)
+            m = meaning_for(k, sig) if sig else ""
+            if (m and m.lower().startswith("tensi")) or re.fullmatch(r"(?:.*\.)?L[123]v", k):
+                keys.append(k)
+    return keys
+
+
+def _stats(x: "np.ndarray") -> Optional[Dict[str, float]]:
+    x = x[~np.isnan(x)]
+    if not x.size:
+        return None
+    return {"min": float(x.min()), "max": float(x.max()), "avg": round(float(x.mean()), 3), "n": int(x.size)}
+
+
+def _group_sum(keys: "np.ndarray", values: "np.ndarray") -> List[Tuple[str, float]]:
+    uniq, inv = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inv, weights=np.nan_to_num(values), minlength=len(uniq))
+    return [(str(u), round(float(v), 3)) for u, v in zip(uniq, sums)]
+
+
+def _register_groups(rows: Sequence[Dict[str, Any]]) -> Tuple["np.ndarray", List[Tuple[str, str]]]:
+    """Id de registro (Ctr, Pt) por fila y la lista de registros, ordenada."""
+    ckey = _first_key(rows, CONTRACT_KEYS)
+    pkey = _first_key(rows, PERIOD_KEYS)
+    labels = [
+        (str(r.get(ckey, "")) if ckey else "", str(r.get(pkey, "")) if pkey else "")
+        for r in rows
+    ]
+    uniq = sorted(set(labels), key=lambda t: (_num(t[0]), t[0], _num(t[1]), t[1]))
+    pos = {u: i for i, u in enumerate(uniq)}
+    return np.fromiter((pos[l] for l in labels), dtype=np.int64, count=len(labels)), uniq
+
+
+def _diff_by_group(v: "np.ndarray", groups: "np.ndarray") -> "np.ndarray":
+    """Diferencia con la lectura anterior del mismo registro (filas ya en orden de tiempo)."""
+    order = np.lexsort((np.arange(v.size), groups))
+    vs, gs = v[order], groups[order]
+    d = np.full(v.size, np.nan)
+    if v.size > 1:
+        step = np.diff(vs)
+        step[gs[1:] != gs[:-1]] = np.nan  # primera lectura de cada registro: sin anterior
+        d[1:] = step
+    out = np.empty_like(d)
+    out[order] = d
+    out[out < 0] = np.nan
+    return out
+
+
+def summarize(rows: Sequence[Dict[str, Any]], report_name: str, sig: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Resumen compacto de las filas de un S02/S04 (ver docstring del módulo)."""
+    out: Dict[str, Any] = {"rows": len(rows), "report_name": report_name.upper()}
+    tkey = _first_key(rows, TIME_KEYS)
+    if not rows or tkey is None:
+        out["error"] = "Sin filas con fecha (Fh) para resumir."
+        return out
+
+    iso = [_iso(r.get(tkey)) for r in rows]
+    keep = np.fromiter((s is not None for s in iso), dtype=bool, count=len(iso))
+    # filas sin fecha válida: no entran en el resumen
+    out["dropped_rows"] = int(len(iso) - keep.sum())
+    ts = np.array([s for s in iso if s is not None], dtype="datetime64[s]")
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    rows_ok = [r for r, k in zip(rows, keep) if k]
+    rows_ok = [rows_ok[i] for i in order]
+    out["period"] = {"from": str(ts[0]) if ts.size else None, "to": str(ts[-1]) if ts.size else None}
+    if ts.size == 0:
+        out["error"] = "No se pudo interpretar ninguna fecha."
+        return out
+
+    # --- paso e intervalos faltantes ---
+    secs = ts.astype(np.int64)
+    step = 0
+    if secs.size > 1:
+        diffs = np.diff(secs)
+        pos = diffs[diffs > 0]
+        if pos.size:
+            vals, counts = np.unique(pos, return_counts=True)
+            step = int(vals[np.argmax(counts)])
+    out["interval_s"] = step or None
+
+    cumulative = report_name.upper() in CUMULATIVE_REPORTS
+    if step and not cumulative:
+        diffs = np.diff(secs)
+        gap_idx = np.nonzero(diffs > step)[0]
+        missing = (diffs[gap_idx] // step - 1).astype(np.int64)
+        out["gaps"] = {
+            "missing_intervals": int(missing.sum()),
+            "expected_intervals": int((secs[-1] - secs[0]) // step + 1),
+            "ranges": [
+                {"after": str(ts[i]), "before": str(ts[i + 1]), "missing": int(n)}
+                for i, n in zip(gap_idx[:MAX_GAP_RANGES].tolist(), missing[:MAX_GAP_RANGES].tolist())
+            ],
+        }
+        qkey = _first_key(rows_ok, QUALITY_KEYS)
+        if qkey:
+            q = _column(rows_ok, qkey)
+            out["gaps"]["flagged_intervals"] = int(np.count_nonzero(np.nan_to_num(q)))
+
+    # --- energía ---
+    energy: Dict[str, Any] = {"mode": "acumulado" if cumulative else "intervalo"}
+    days = ts.astype("datetime64[D]")
+    months = ts.astype("datetime64[M]")
+    if cumulative:
+        groups, registers = _register_groups(rows_ok)
+        # total: período 0 (o el primero que haya) del primer contrato
+        main = next((i for i, (c, p) in enumerate(registers) if c == registers[0][0] and p in ("0", "")), 0)
+    for label, keys in (("import", IMPORT_KEYS), ("export", EXPORT_KEYS)):
+        k = _first_key(rows_ok, keys)
+        if k is None:
+            continue
+        v = _column(rows_ok, k)
+        by_period = None
+        if cumulative:
+            # registros acumulados: energía del período = diferencia con la lectura anterior del mismo registro
+            v = _diff_by_group(v, groups)
+            by_period = [
+                {"ctr": c or None, "pt": p or None, "total": round(float(np.nansum(v[groups == i])), 3)}
+                for i, (c, p) in enumerate(registers)
+            ]
+            sel = groups == main
+            v, vmonths = v[sel], months[sel]
+        else:
+            vmonths = months
+        energy[label] = {
+            "field": k,
+            "meaning": meaning_for(k, sig) if sig else "",
+            "total": round(float(np.nansum(v)), 3),
+            "daily": None if cumulative else [{"day": d, "value": s} for d, s in _group_sum(days, v)],
+            "monthly": [{"month": m, "value": s} for m, s in _group_sum(vmonths, v)],
+        }
+        if by_period is not None:
+            energy[label]["register"] = {"ctr": registers[main][0] or None, "pt": registers[main][1] or None}
+            energy[label]["by_period"] = by_period
+        if label == "import" and step and not cumulative and np.any(~np.isnan(v)):
+            i = int(np.nanargmax(v))
+            energy["max_demand"] = {
+                "value": round(float(v[i]) * 3600.0 / step, 3),
+                "interval_energy": float(v[i]),
+                "at": str(ts[i]),
+                "unit": "energía/h",
+            }
+    out["energy"] = energy
+
+    # --- tensiones ---
+    volts = {}
+    for k in _voltage_keys(rows_ok, sig):
+        st = _stats(_column(rows_ok, k))
+        if st:
+            volts[k] = st
+    out["voltage"] = volts
+    return out
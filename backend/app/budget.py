@@ -0,0 +1,159 @@
+"""Presupuesto de tiempo por pedido (deadline) para las llamadas al concentrador.
+
+Cada pedido interactivo arranca un presupuesto total según el reporte
+(REPORT_BUDGETS, ej. "S01=30,B03=60,*=120") acotado por el cliente con el
+header `X-Timeout-Ms` (milisegundos que el cliente está dispuesto a esperar).
+Lo que queda se reparte entre las fases — cola, login, scale, report/order,
+confirmación (S01 luego de B03) — y cada fase además tiene su tope
+(TIMEOUT_LOGIN_S, TIMEOUT_SCALE_S, TIMEOUT_POLL_S).
+
+El presupuesto vigente viaja en un ContextVar, así no hay que pasarlo por el
+broker de sesiones ni por la cola. Sin presupuesto (campañas, tareas de fondo)
+cada fase usa sólo su tope, como antes.
+
+Si se agota: 504.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app.config import get_settings
+
+T = TypeVar("T")
+
+CLIENT_HEADER = "x-timeout-ms"
+
+_CURRENT: ContextVar[Optional["Budget"]] = ContextVar("gede_budget", default=None)
+_PARSED: Dict[str, Any] = {"spec": None, "budgets": {}}
+
+
+def _parse_budgets(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, val = part.partition("=")
+        name = name.strip().upper()
+        try:
+            secs = float(val)
+        except ValueError:
+            continue
+        if name and secs > 0:
+            out[name] = secs
+    return out
+
+
+def budget_for(report_name: str) -> float:
+    """Presupuesto total (s) configurado para el reporte/orden."""
+    spec = get_settings().report_budgets
+    if _PARSED["spec"] != spec:
+        _PARSED["budgets"] = _parse_budgets(spec)
+        _PARSED["spec"] = spec
+    budgets = _PARSED["budgets"]
+    return budgets.get((report_name or "").upper(), budgets.get("*", 120.0))
+
+
+def _phase_caps() -> Dict[str, float]:
+    s = get_settings()
+    return {
+        "login": s.timeout_login_s,
+        "scale": s.timeout_scale_s,
+        "poll": s.timeout_poll_s,
+        "report": budget_for("*"),
+        "order": budget_for("*"),
+    }
+
+
+def client_deadline(request: Optional[Request]) -> Optional[float]:
+    """Deadline (time.monotonic) pedido por el cliente vía X-Timeout-Ms, o None."""
+    if request is None:
+        return None
+    raw = request.headers.get(CLIENT_HEADER)
+    if not raw:
+        return None
+    try:
+        ms = float(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Header {CLIENT_HEADER} inválido (milisegundos).")
+    return time.monotonic() + max(0.0, ms) / 1000.0
+
+
+class Budget:
+    __slots__ = ("label", "total_s", "deadline", "caps")
+
+    def __init__(self, label: str, total_s: float, deadline: Optional[float] = None):
+        now = time.monotonic()
+        self.label = label
+        self.deadline = now + total_s if deadline is None else min(now + total_s, deadline)
+        self.total_s = max(0.0, self.deadline - now)
+        self.caps = _phase_caps()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def exhausted(self, phase: str) -> HTTPException:
+        return HTTPException(
+            status_code=504,
+            detail=f"Sin tiempo para {self.label} ({phase}): se agotó el presupuesto de {self.total_s:.1f}s.",
+        )
+
+    def timeout(self, phase: str) -> float:
+        """Segundos para la fase: min(tope de la fase, lo que queda). 504 si no queda nada."""
+        rem = self.remaining()
+        if rem <= 0:
+            raise self.exhausted(phase)
+        cap = self.caps.get(phase)
+        return min(cap, rem) if cap else rem
+
+
+def start(report_name: str, request: Optional[Request] = None, deadline: Optional[float] = None) -> Budget:
+    """Presupuesto para `report_name`, acotado por el header del cliente y/o `deadline`."""
+    limits = [d for d in (client_deadline(request), deadline) if d is not None]
+    return Budget(report_name.upper(), budget_for(report_name), min(limits) if limits else None)
+
+
+def current() -> Optional[Budget]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def scope(budget: Budget) -> Iterator[Budget]:
+    token = _CURRENT.set(budget)
+    try:
+        yield budget
+    finally:
+        _CURRENT.reset(token)
+
+
+def timeout(phase: str) -> float:
+    """Timeout de la fase según el presupuesto vigente (o sólo el tope si no hay)."""
+    b = _CURRENT.get()
+    if b is not None:
+        return b.timeout(phase)
+    return _phase_caps().get(phase) or budget_for("*")
+
+
+def expired(phase: str, detail: str) -> HTTPException:
+    """Error para un timeout de httpx: 504 indicando si fue por presupuesto agotado."""
+    b = _CURRENT.get()
+    if b is not None and b.remaining() <= 0:
+        return b.exhausted(phase)
+    return HTTPException(status_code=504, detail=detail)
+
+
+async def within(aw: Awaitable[T], phase: str) -> T:
+    """Espera `aw` sin pasarse del presupuesto vigente (sin presupuesto: sin límite)."""
+    b = _CURRENT.get()
+    if b is None:
+        return await aw
+    rem = b.remaining()
+    if rem <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise b.exhausted(phase)
+    try:
+        return await asyncio.wait_for(aw, rem)
+    except asyncio.TimeoutError:
+        raise b.exhausted(phase)
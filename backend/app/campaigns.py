@@ -0,0 +1,581 @@
+"""Campañas de lectura masiva programadas (S02/S04 diarios, etc).
+
+- Programación tipo cron (5 campos: minuto hora día mes día_semana).
+- Por concentrador: ventana horaria y espaciado mínimo entre pedidos.
+- Progreso en SQLite (checkpoint por medidor/reporte): una campaña interrumpida
+  (reinicio del backend) se retoma donde quedó.
+- Resultados parseados en el mismo SQLite.
+- Con varios workers (uvicorn --workers N) cada corrida tiene dueño: el worker
+  que la "reclama" en `runs` (owner + heartbeat). Los demás no la ejecutan; si
+  el dueño deja de latir por RUN_LEASE_S, otro la retoma. Crear una corrida
+  (¿hay una activa? -> insertar) es una sola transacción BEGIN IMMEDIATE, así
+  el minuto del cron no genera una corrida por worker. Cancelar marca la
+  corrida en la base y el dueño lo ve entre medidor y medidor.
+- El SQLite (con su `_DB_LOCK`) se usa sólo desde hilos: las corrutinas de
+  la campaña llaman a los helpers sincrónicos con `asyncio.to_thread`, así un
+  endpoint o una escritura lenta no frenan el event loop.
+
+Reutiliza el mapeo medidor->concentrador de concentradores.xlsx y la lectura
+de reportes de `routers.meters`.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.config import get_settings
+from app.meter_index import MeterIndex
+from app.table import plain
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CAMPAIGNS: List[Dict[str, Any]] = [
+    {
+        "name": "diaria",
+        "enabled": True,
+        "reports": ["S02", "S04"],
+        "schedule": "30 1 * * *",
+        "lookback_days": 1,
+        "priority": 5,
+        # ventana y espaciado por defecto; se pueden pisar por concentrador
+        "window": "00:00-06:00",
+        "windows": {},
+        "min_interval_s": 5,
+        "min_interval_by_conc": {},
+        "max_attempts": 3,
+        "max_parallel_concentrators": 4,
+    }
+]
+
+# Estado en memoria (por proceso)
+_RUNNING: Dict[int, asyncio.Task] = {}
+_SCHED: Dict[str, Any] = {"task": None, "last_minute": {}}
+
+# Identidad de este proceso como dueño de corridas
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+# Sin heartbeat por este tiempo, la corrida se considera huérfana y otro worker la retoma
+RUN_LEASE_S = 300
+
+
+# ---------------------------------------------------------------------------
+# Cron
+# ---------------------------------------------------------------------------
+
+_CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]  # día_semana: 0 y 7 = domingo
+
+
+def _parse_cron_field(field: str, lo: int, hi: int) -> Optional[set]:
+    """Devuelve el set de valores permitidos; None si es '*' (sin restricción)."""
+    field = field.strip()
+    if field == "*":
+        return None
+    out: set = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+            if step <= 0:
+                raise ValueError(f"Paso inválido en cron: {field}")
+        if part in ("*", ""):
+            a, b = lo, hi
+        elif "-" in part:
+            a_s, b_s = part.split("-", 1)
+            a, b = int(a_s), int(b_s)
+        else:
+            a = b = int(part)
+        if a < lo or b > hi or a > b:
+            raise ValueError(f"Valor fuera de rango en cron: {field}")
+        out.update(range(a, b + 1, step))
+    if hi == 7 and 7 in out:
+        out.discard(7)
+        out.add(0)
+    return out
+
+
+def parse_cron(expr: str) -> List[Optional[set]]:
+    parts = (expr or "").split()
+    if len(parts) != 5:
+        raise ValueError(f"Cron inválido (se esperan 5 campos): {expr!r}")
+    return [_parse_cron_field(p, lo, hi) for p, (lo, hi) in zip(parts, _CRON_RANGES)]
+
+
+def cron_matches(expr: str, dt: datetime) -> bool:
+    minute, hour, dom, month, dow = parse_cron(expr)
+    if minute is not None and dt.minute not in minute:
+        return False
+    if hour is not None and dt.hour not in hour:
+        return False
+    if month is not None and dt.month not in month:
+        return False
+    cron_dow = (dt.weekday() + 1) % 7  # cron: 0=domingo
+    # Semántica cron clásica: si ambos (día y día_semana) están restringidos, alcanza con uno
+    if dom is not None and dow is not None:
+        return dt.day in dom or cron_dow in dow
+    if dom is not None and dt.day not in dom:
+        return False
+    if dow is not None and cron_dow not in dow:
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Ventanas horarias
+# ---------------------------------------------------------------------------
+
+def _parse_hhmm(v: str) -> int:
+    h, m = v.strip().split(":", 1)
+    return int(h) * 60 + int(m)
+
+
+def in_window(window: Optional[str], dt: datetime) -> bool:
+    """'HH:MM-HH:MM' (hora local). Soporta ventanas que cruzan medianoche."""
+    if not window:
+        return True
+    a_s, b_s = window.split("-", 1)
+    a, b = _parse_hhmm(a_s), _parse_hhmm(b_s)
+    cur = dt.hour * 60 + dt.minute
+    if a <= b:
+        return a <= cur < b
+    return cur >= a or cur < b
+
+
+# ---------------------------------------------------------------------------
+# Configuración
+# ---------------------------------------------------------------------------
+
+def load_campaigns() -> List[Dict[str, Any]]:
+    """Lee campaigns.json; si no existe usa DEFAULT_CAMPAIGNS."""
+    s = get_settings()
+    path = s.campaigns_config_path
+    items = DEFAULT_CAMPAIGNS
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            items = raw.get("campaigns", raw) if isinstance(raw, dict) else raw
+        except Exception:
+            log.exception("No se pudo leer %s; se usan campañas por defecto", path)
+            items = DEFAULT_CAMPAIGNS
+    out = []
+    for c in items:
+        merged = dict(DEFAULT_CAMPAIGNS[0])
+        merged.update(c)
+        out.append(merged)
+    return out
+
+
+def get_campaign(name: str) -> Optional[Dict[str, Any]]:
+    for c in load_campaigns():
+        if c.get("name") == name:
+            return c
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Store (SQLite)
+# ---------------------------------------------------------------------------
+
+_DB: Dict[str, Any] = {"conn": None, "path": None}
+_DB_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign TEXT NOT NULL,
+    config TEXT NOT NULL,
+    fini TEXT,
+    fend TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS run_items (
+    run_id INTEGER NOT NULL,
+    meter INTEGER NOT NULL,
+    conc_id INTEGER NOT NULL,
+    ip TEXT NOT NULL,
+    report TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (run_id, meter, report)
+);
+CREATE INDEX IF NOT EXISTS ix_run_items_status ON run_items (run_id, status);
+CREATE TABLE IF NOT EXISTS results (
+    meter INTEGER NOT NULL,
+    report TEXT NOT NULL,
+    fini TEXT NOT NULL,
+    fend TEXT NOT NULL,
+    conc_id INTEGER,
+    run_id INTEGER,
+    collected_at REAL NOT NULL,
+    data TEXT,
+    PRIMARY KEY (meter, report, fini, fend)
+);
+CREATE INDEX IF NOT EXISTS ix_results_collected ON results (collected_at);
+"""
+
+
+def _db() -> sqlite3.Connection:
+    path = get_settings().campaigns_db_path
+    if _DB["conn"] is None or _DB["path"] != path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        # bases creadas antes de que las corridas tuvieran dueño
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(runs)")}
+        for col, typ in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE runs ADD COLUMN {col} {typ}")
+        _DB["conn"] = conn
+        _DB["path"] = path
+    return _DB["conn"]
+
+
+def _execute(sql: str, params: tuple = ()) -> sqlite3.Cursor:
+    with _DB_LOCK:
+        return _db().execute(sql, params)
+
+
+def _query(sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+    with _DB_LOCK:
+        return [dict(r) for r in _db().execute(sql, params).fetchall()]
+
+
+def _create_run(campaign: Dict[str, Any], index: MeterIndex, since: Optional[float] = None) -> int:
+    """Crea la corrida y su lista de trabajo (medidor x reporte) desde el índice de concentradores.xlsx.
+
+    Si la campaña ya tiene una corrida activa (o creada desde `since`, p.ej. en este
+    mismo minuto del cron por otro worker) devuelve esa. El chequeo y el alta van en
+    una sola transacción BEGIN IMMEDIATE: entre procesos, sólo uno inserta.
+    """
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    lookback = int(campaign.get("lookback_days") or 1)
+    fini = (today - timedelta(days=lookback)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    fend = (today - timedelta(seconds=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    now = time.time()
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = conn.execute(
+                "SELECT id FROM runs WHERE campaign = ? AND (status = 'running' OR created_at >= ?) ORDER BY id DESC LIMIT 1",
+                (campaign["name"], since if since is not None else now + 1),
+            ).fetchone()
+            if active is not None:
+                conn.execute("COMMIT")
+                return int(active["id"])
+            cur = conn.execute(
+                "INSERT INTO runs (campaign, config, fini, fend, status, created_at) VALUES (?, ?, ?, ?, 'running', ?)",
+                (campaign["name"], json.dumps(campaign, ensure_ascii=False), fini, fend, now),
+            )
+            run_id = int(cur.lastrowid)
+            rows = []
+            for meter_id, conc_id in index.items():
+                ip = index.conc_to_ip.get(conc_id)
+                if not ip:
+                    continue
+                for rep in campaign.get("reports") or []:
+                    rows.append((run_id, meter_id, conc_id, ip, rep, now))
+            conn.executemany(
+                "INSERT INTO run_items (run_id, meter, conc_id, ip, report, status, updated_at) VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return run_id
+
+
+async def create_run(campaign: Dict[str, Any], index: MeterIndex, since: Optional[float] = None) -> int:
+    return await asyncio.to_thread(_create_run, campaign, index, since)
+
+
+def run_summary(run_id: int) -> Optional[Dict[str, Any]]:
+    runs = _query(
+        "SELECT id, campaign, fini, fend, status, created_at, finished_at, owner, heartbeat FROM runs WHERE id = ?", (run_id,)
+    )
+    if not runs:
+        return None
+    out = runs[0]
+    counts = _query("SELECT status, COUNT(*) AS n FROM run_items WHERE run_id = ? GROUP BY status", (run_id,))
+    out["items"] = {c["status"]: c["n"] for c in counts}
+    # activa en este worker o en otro con heartbeat reciente
+    out["active"] = run_id in _RUNNING or (
+        out["status"] == "running" and out["owner"] is not None and (out["heartbeat"] or 0) > time.time() - RUN_LEASE_S
+    )
+    return out
+
+
+def list_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    ids = _query("SELECT id FROM runs ORDER BY id DESC LIMIT ?", (limit,))
+    return [run_summary(r["id"]) for r in ids]
+
+
+def run_errors(run_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+    return _query(
+        "SELECT meter, conc_id, report, attempts, error FROM run_items WHERE run_id = ? AND status = 'failed' LIMIT ?",
+        (run_id, limit),
+    )
+
+
+def query_results(meter: Optional[int] = None, report: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    sql = "SELECT meter, report, fini, fend, conc_id, run_id, collected_at, data FROM results WHERE 1=1"
+    params: list = []
+    if meter is not None:
+        sql += " AND meter = ?"
+        params.append(meter)
+    if report:
+        sql += " AND report = ?"
+        params.append(report)
+    sql += " ORDER BY collected_at DESC LIMIT ?"
+    params.append(limit)
+    rows = _query(sql, tuple(params))
+    for r in rows:
+        try:
+            r["data"] = json.loads(r["data"]) if r["data"] is not None else None
+        except Exception:
+            pass
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Ejecución
+# ---------------------------------------------------------------------------
+
+def _conc_setting(campaign: Dict[str, Any], key_by_conc: str, key_default: str, conc_id: int) -> Any:
+    per = campaign.get(key_by_conc) or {}
+    return per.get(str(conc_id), campaign.get(key_default))
+
+
+def _claim(run_id: int) -> bool:
+    """Toma la corrida para este proceso si está libre, huérfana o ya es nuestra."""
+    now = time.time()
+    cur = _execute(
+        "UPDATE runs SET owner = ?, heartbeat = ? WHERE id = ? AND status = 'running' "
+        "AND (owner IS NULL OR owner = ? OR heartbeat IS NULL OR heartbeat < ?)",
+        (_OWNER, now, run_id, _OWNER, now - RUN_LEASE_S),
+    )
+    return cur.rowcount > 0
+
+
+def _still_ours(run_id: int) -> bool:
+    """Renueva el heartbeat; False si la cancelaron (desde cualquier worker) o la tomó otro."""
+    cur = _execute(
+        "UPDATE runs SET heartbeat = ? WHERE id = ? AND status = 'running' AND owner = ?",
+        (time.time(), run_id, _OWNER),
+    )
+    return cur.rowcount > 0
+
+
+class _RunStopped(Exception):
+    pass
+
+
+def _item_failed(run_id: int, it: Dict[str, Any], status: str, attempts: int, err: str) -> None:
+    _execute(
+        "UPDATE run_items SET status = ?, attempts = ?, error = ?, updated_at = ? WHERE run_id = ? AND meter = ? AND report = ?",
+        (status, attempts, err[:500], time.time(), run_id, it["meter"], it["report"]),
+    )
+
+
+def _item_done(run_id: int, it: Dict[str, Any], attempts: int, conc_id: int, fini: str, fend: str, data: Any) -> None:
+    body = json.dumps(plain(data), ensure_ascii=False)
+    now = time.time()
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (meter, report, fini, fend, conc_id, run_id, collected_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (it["meter"], it["report"], fini, fend, conc_id, run_id, now, body),
+            )
+            conn.execute(
+                "UPDATE run_items SET status = 'done', attempts = ?, error = NULL, updated_at = ? WHERE run_id = ? AND meter = ? AND report = ?",
+                (attempts, now, run_id, it["meter"], it["report"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+async def _wait_window(run_id: int, window: Optional[str]) -> None:
+    while not in_window(window, datetime.now()):
+        # esperar la ventana puede llevar horas: seguir latiendo (y enterarse de una cancelación)
+        if not await asyncio.to_thread(_still_ours, run_id):
+            raise _RunStopped()
+        await asyncio.sleep(60)
+
+
+async def _run_concentrator(run_id: int, campaign: Dict[str, Any], conc_id: int, ip: str, fini: str, fend: str) -> None:
+    from fastapi import HTTPException
+    from app import dispatch
+    from app.routers import meters as m
+
+    window = _conc_setting(campaign, "windows", "window", conc_id)
+    min_interval = float(_conc_setting(campaign, "min_interval_by_conc", "min_interval_s", conc_id) or 0)
+    max_attempts = int(campaign.get("max_attempts") or 1)
+    priority = int(campaign.get("priority") or 5)
+
+    items = await asyncio.to_thread(
+        _query,
+        "SELECT meter, report, attempts FROM run_items WHERE run_id = ? AND conc_id = ? AND status = 'pending' ORDER BY meter, report",
+        (run_id, conc_id),
+    )
+    last_call = 0.0
+    for it in items:
+        if not await asyncio.to_thread(_still_ours, run_id):
+            return
+        attempts = int(it["attempts"])
+        while attempts < max_attempts:
+            try:
+                await _wait_window(run_id, window)
+            except _RunStopped:
+                return
+            wait = min_interval - (time.monotonic() - last_call)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            last_call = time.monotonic()
+            attempts += 1
+            cir = "CIR" + str(it["meter"]).zfill(10)
+            try:
+                async with dispatch.slot(ip, dispatch.BACKGROUND, "campaign:" + campaign["name"]):
+                    res = await m._fetch_report(ip, cir, it["report"], priority, fini, fend)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                err = e.detail if isinstance(e, HTTPException) else str(e)
+                status = "failed" if attempts >= max_attempts else "pending"
+                await asyncio.to_thread(_item_failed, run_id, it, status, attempts, str(err))
+                continue
+            if str(it["report"]).upper() == "S01":
+                m._remember_s01(int(it["meter"]), conc_id, res["data"], "campaign")
+            await asyncio.to_thread(_item_done, run_id, it, attempts, conc_id, fini, fend, res["data"])
+            break
+
+
+async def _execute_run(run_id: int) -> None:
+    rows = await asyncio.to_thread(_query, "SELECT config, fini, fend FROM runs WHERE id = ?", (run_id,))
+    if not rows:
+        return
+    campaign = json.loads(rows[0]["config"])
+    fini, fend = rows[0]["fini"], rows[0]["fend"]
+    concs = await asyncio.to_thread(
+        _query,
+        "SELECT DISTINCT conc_id, ip FROM run_items WHERE run_id = ? AND status = 'pending'",
+        (run_id,),
+    )
+    sem = asyncio.Semaphore(max(1, int(campaign.get("max_parallel_concentrators") or 1)))
+
+    async def one(conc_id: int, ip: str) -> None:
+        async with sem:
+            await _run_concentrator(run_id, campaign, conc_id, ip, fini, fend)
+
+    try:
+        results = await asyncio.gather(*(one(c["conc_id"], c["ip"]) for c in concs), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception) and not isinstance(r, asyncio.CancelledError):
+                log.error("Campaña %s: error en concentrador: %r", run_id, r)
+        # sólo si sigue siendo nuestra y no la cancelaron mientras tanto
+        await asyncio.to_thread(
+            _execute,
+            "UPDATE runs SET status = 'finished', finished_at = ? WHERE id = ? AND status = 'running' AND owner = ?",
+            (time.time(), run_id, _OWNER),
+        )
+    finally:
+        _RUNNING.pop(run_id, None)
+
+
+async def start_run_task(run_id: int) -> None:
+    """Ejecuta la corrida en este proceso si logra reclamarla (si no, la tiene otro worker)."""
+    if run_id in _RUNNING or not await asyncio.to_thread(_claim, run_id):
+        return
+    # otra corrutina de este proceso pudo reclamarla mientras tanto
+    if run_id not in _RUNNING:
+        _RUNNING[run_id] = asyncio.get_running_loop().create_task(_execute_run(run_id))
+
+
+async def trigger(campaign: Dict[str, Any], since: Optional[float] = None) -> int:
+    """Crea y lanza una corrida; si ya hay una activa de la misma campaña, la devuelve."""
+    from app.routers import meters as m
+
+    run_id = await create_run(campaign, await m._meter_index_async(), since)
+    await start_run_task(run_id)
+    return run_id
+
+
+async def cancel_run(run_id: int) -> bool:
+    # en la base primero: si la corrida la ejecuta otro worker, la ve en su próximo medidor
+    cur = await asyncio.to_thread(
+        _execute, "UPDATE runs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'running'", (time.time(), run_id)
+    )
+    task = _RUNNING.get(run_id)
+    if task:
+        task.cancel()
+    return bool(task) or cur.rowcount > 0
+
+
+async def _resume_orphans() -> None:
+    """Retoma corridas interrumpidas (checkpoint en run_items) sin dueño vivo."""
+    for r in await asyncio.to_thread(_query, "SELECT id FROM runs WHERE status = 'running'"):
+        await start_run_task(int(r["id"]))
+
+
+async def _scheduler_loop() -> None:
+    while True:
+        try:
+            await _resume_orphans()
+        except Exception:
+            log.exception("No se pudieron retomar campañas")
+
+        now = datetime.now().replace(second=0, microsecond=0)
+        for c in await asyncio.to_thread(load_campaigns):
+            if not c.get("enabled", True) or not c.get("schedule"):
+                continue
+            if _SCHED["last_minute"].get(c["name"]) == now:
+                continue
+            try:
+                if cron_matches(c["schedule"], now):
+                    _SCHED["last_minute"][c["name"]] = now
+                    await trigger(c, since=now.timestamp())
+            except Exception:
+                log.exception("Error programando campaña %s", c.get("name"))
+        await asyncio.sleep(30)
+
+
+def start_scheduler() -> None:
+    if not get_settings().campaigns_enabled:
+        return
+    if _SCHED["task"] is None or _SCHED["task"].done():
+        _SCHED["task"] = asyncio.get_running_loop().create_task(_scheduler_loop())
+
+
+async def stop_scheduler() -> None:
+    tasks = [t for t in [_SCHED["task"], *_RUNNING.values()] if t is not None]
+    for t in tasks:
+        t.cancel()
+    # Las corridas quedan en 'running' (sin dueño) para retomarse en el próximo arranque
+    # o por otro worker
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _SCHED["task"] = None
+    try:
+        await asyncio.to_thread(_execute, "UPDATE runs SET owner = NULL WHERE owner = ? AND status = 'running'", (_OWNER,))
+    except Exception:
+        log.exception("No se pudieron liberar las corridas de este proceso")
@@ -0,0 +1,171 @@
+"""Partir ventanas largas (fini–fend) de reportes en tramos.
+
+Un S02 de varios meses es un único GET enorme que suele pasarse del
+presupuesto y falla entero con 504. Acá la ventana se parte en tramos
+(REPORT_CHUNK_DAYS, ej. "S02=1,S04=92": días por tramo según reporte) que:
+
+- corren con concurrencia acotada (REPORT_CHUNK_CONCURRENCY), cada uno con su
+  propio presupuesto y REPORT_CHUNK_RETRIES reintentos (429/503 esperan lo que
+  pide Retry-After; el resto de los 4xx no se reintenta);
+- se entregan en orden cronológico apenas están listos (un tramo no espera a
+  los posteriores), así se puede ir mostrando/streameando;
+- si alguno falla igual se devuelve el resto, junto con los rangos fallidos.
+
+Reportes sin entrada en REPORT_CHUNK_DAYS, o ventanas más cortas que un
+tramo, se leen como siempre (un solo GET).
+"""
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import get_settings
+
+Window = Tuple[str, str]
+# (índice, ventana, resultado | None, error | None)
+ChunkResult = Tuple[int, Window, Optional[Any], Optional[str]]
+
+_STG_RE = re.compile(r"^(\d{14})\d{3}([A-Z])$")
+_PARSED: Dict[str, Any] = {"spec": None, "days": {}}
+
+# Pausa antes de reintentar un tramo (se multiplica por el intento)
+RETRY_BACKOFF_S = 1.0
+# Espera máxima que se acepta de un Retry-After
+RETRY_AFTER_MAX_S = 30.0
+# Saturación (cola llena, sin sesiones libres): reintentables aunque sean 4xx
+_RETRY_STATUS = (429, 503)
+
+
+def _retry_after(e: HTTPException) -> Optional[float]:
+    """Segundos del header Retry-After (número o fecha HTTP), acotados a RETRY_AFTER_MAX_S."""
+    headers = {k.lower(): v for k, v in (getattr(e, "headers", None) or {}).items()}
+    v = (headers.get("retry-after") or "").strip()
+    if not v:
+        return None
+    try:
+        secs = float(v)
+    except ValueError:
+        try:
+            secs = (parsedate_to_datetime(v) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, secs), RETRY_AFTER_MAX_S)
+
+
+def _parse_days(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, val = part.partition("=")
+        name = name.strip().upper()
+        try:
+            days = float(val)
+        except ValueError:
+            continue
+        if name and days > 0:
+            out[name] = days
+    return out
+
+
+def chunk_days(report_name: str) -> Optional[float]:
+    """Días por tramo configurados para el reporte (None = no se parte)."""
+    spec = get_settings().report_chunk_days
+    if _PARSED["spec"] != spec:
+        _PARSED["days"] = _parse_days(spec)
+        _PARSED["spec"] = spec
+    return _PARSED["days"].get((report_name or "").upper())
+
+
+def _parse(v: str) -> Optional[datetime]:
+    """ISO 8601 (con o sin zona; sin zona = UTC) o STG-CD (YYYYMMDDhhmmssmmmW)."""
+    s = (v or "").strip()
+    m = _STG_RE.match(s)
+    try:
+        if m:
+            return datetime.strptime(m.group(1), "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _format(dt: datetime, like: str) -> str:
+    """Mismo formato que mandó el cliente (STG-CD o ISO con Z)."""
+    if _STG_RE.match(like.strip()):
+        return dt.astimezone(timezone.utc).strftime("%Y%m%d%H%M%S") + "000W"
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def plan(report_name: str, fini: Optional[str], fend: Optional[str]) -> List[Window]:
+    """Tramos de la ventana; lista vacía si no corresponde partir."""
+    days = chunk_days(report_name)
+    if not days or not fini or not fend:
+        return []
+    start, end = _parse(fini), _parse(fend)
+    if start is None or end is None or end <= start:
+        return []
+    step = timedelta(days=days)
+    if end - start <= step:
+        return []
+    if (end - start) / step > get_settings().report_chunk_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ventana demasiado larga: más de {get_settings().report_chunk_max} tramos de {days:g} días.",
+        )
+    out: List[Window] = []
+    cur = start
+    while cur <= end:
+        # tramos inclusivos como la ventana original: [cur, cur + step - 1 s]
+        last = min(cur + step - timedelta(seconds=1), end)
+        out.append((_format(cur, fini), _format(last, fend)))
+        cur += step
+    return out
+
+
+async def run(
+    windows: List[Window],
+    fetch: Callable[[str, str], Awaitable[Any]],
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+) -> AsyncIterator[ChunkResult]:
+    """Ejecuta `fetch(fini, fend)` por tramo y los entrega en orden cronológico.
+
+    Si el consumidor deja de iterar (cliente desconectado), se cancelan los tramos pendientes.
+    """
+    s = get_settings()
+    sem = asyncio.Semaphore(max(1, concurrency or s.report_chunk_concurrency))
+    attempts = 1 + max(0, s.report_chunk_retries if retries is None else retries)
+
+    async def one(win: Window) -> Tuple[Optional[Any], Optional[str]]:
+        async with sem:
+            err: Optional[str] = None
+            for attempt in range(1, attempts + 1):
+                wait = RETRY_BACKOFF_S * attempt
+                try:
+                    return await fetch(*win), None
+                except HTTPException as e:
+                    err = str(e.detail)
+                    if e.status_code in _RETRY_STATUS:
+                        # saturado: reintentar cuando lo indique el servidor
+                        after = _retry_after(e)
+                        wait = after if after is not None else wait
+                    elif 400 <= e.status_code < 500:
+                        # otro 4xx: pedido inválido, reintentar no cambia nada
+                        break
+                except Exception as e:
+                    err = str(e)
+                if attempt < attempts:
+                    await asyncio.sleep(wait)
+            return None, err
+
+    tasks = [asyncio.ensure_future(one(w)) for w in windows]
+    try:
+        for i, (win, task) in enumerate(zip(windows, tasks)):
+            res, err = await task
+            yield i, win, res, err
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -16,6 +16,58 @@ class Settings:
     gede_password: str
     concentradores_xlsx_path: str
     significados_xlsx_path: str
+    static_cache_dir: str
+    static_vendor_max_age: int
+    campaigns_enabled: bool
+    campaigns_config_path: str
+    campaigns_db_path: str
+    dispatch_slots_per_conc: int
+    dispatch_max_queue: int
+    dispatch_max_queue_background: int
+    report_coalesce_grace_s: float
+    session_backend: str
+    session_db_path: str
+    session_ttl_s: float
+    session_max: int
+    session_cache_ttl_s: float
+    gede_sessions_db_path: str
+    gede_sessions_per_conc: int
+    gede_session_wait_s: float
+    gede_session_idle_s: float
+    gede_token_ttl_s: float
+    cadena_electrica_xlsx_path: str
+    report_budgets: str
+    timeout_login_s: float
+    timeout_scale_s: float
+    timeout_poll_s: float
+    loader_threads: int
+    decode_workers: int
+    decode_inline_max_bytes: int
+    decode_max_pending: int
+    order_journal_db_path: str
+    order_journal_batch: int
+    order_journal_flush_s: float
+    live_queue_max: int
+    meter_state_max: int
+    meter_state_max_age_s: float
+    result_ttl_s: float
+    result_max: int
+    report_chunk_days: str
+    report_chunk_concurrency: int
+    report_chunk_retries: int
+    report_chunk_max: int
+    loop_monitor: bool
+    loop_beat_s: float
+    loop_block_threshold_s: float
+    loop_log_path: str
+    loop_log_max_bytes: int
+    loop_log_backups: int
+    prefetch_s01: bool
+    prefetch_ttl_s: float
+    prefetch_per_conc: int
+    order_massive_max_parallel: int
+    order_plan_ttl_s: float
+    order_plan_history_days: float
 
     @property
     def gede_base_url(self) -> str:
@@ -43,4 +95,57 @@ def get_settings() -> Settings:
         gede_password=os.getenv("GEDE_PASSWORD", "Adm1n"),
         concentradores_xlsx_path=os.getenv("CONCENTRADORES_XLSX_PATH", str(Path(__file__).resolve().parents[1] / "data" / "concentradores.xlsx")),
         significados_xlsx_path=os.getenv("SIGNIFICADOS_XLSX_PATH", str(Path(__file__).resolve().parents[1] / "data" / "Biblioteca Significados.xlsx")),
+        # relativo a backend/ (no al directorio desde el que se lanza uvicorn): coincide con .gitignore
+        static_cache_dir=str(Path(__file__).resolve().parents[1] / os.getenv("STATIC_CACHE_DIR", ".static_cache")),
+        static_vendor_max_age=int(os.getenv("STATIC_VENDOR_MAX_AGE", "604800")),
+        campaigns_enabled=os.getenv("CAMPAIGNS_ENABLED", "1").strip().lower() in ("1", "true", "yes", "si", "sí"),
+        campaigns_config_path=os.getenv("CAMPAIGNS_CONFIG_PATH", str(Path(__file__).resolve().parents[1] / "data" / "campaigns.json")),
+        campaigns_db_path=os.getenv("CAMPAIGNS_DB_PATH", str(Path(__file__).resolve().parents[1] / "data" / "campaigns.sqlite3")),
+        dispatch_slots_per_conc=int(os.getenv("DISPATCH_SLOTS_PER_CONC", "1")),
+        dispatch_max_queue=int(os.getenv("DISPATCH_MAX_QUEUE", "20")),
+        dispatch_max_queue_background=int(os.getenv("DISPATCH_MAX_QUEUE_BACKGROUND", "500")),
+        report_coalesce_grace_s=float(os.getenv("REPORT_COALESCE_GRACE_S", "3")),
+        session_backend=os.getenv("SESSION_BACKEND", "sqlite").strip().lower(),
+        session_db_path=os.getenv("SESSION_DB_PATH", str(Path(__file__).resolve().parents[1] / "data" / "sessions.sqlite3")),
+        session_ttl_s=float(os.getenv("SESSION_TTL_S", "43200")),
+        session_max=int(os.getenv("SESSION_MAX", "10000")),
+        session_cache_ttl_s=float(os.getenv("SESSION_CACHE_TTL_S", "5")),
+        gede_sessions_db_path=os.getenv("GEDE_SESSIONS_DB_PATH", str(Path(__file__).resolve().parents[1] / "data" / "gede_sessions.sqlite3")),
+        gede_sessions_per_conc=int(os.getenv("GEDE_SESSIONS_PER_CONC", "1")),
+        gede_session_wait_s=float(os.getenv("GEDE_SESSION_WAIT_S", "30")),
+        gede_session_idle_s=float(os.getenv("GEDE_SESSION_IDLE_S", "20")),
+        gede_token_ttl_s=float(os.getenv("GEDE_TOKEN_TTL_S", "600")),
+        cadena_electrica_xlsx_path=os.getenv("CADENA_ELECTRICA_XLSX_PATH", str(Path(__file__).resolve().parents[1] / "data" / "cadena_electrica_georreferenciacion.xlsx")),
+        report_budgets=os.getenv("REPORT_BUDGETS", "S01=30,B03=60,*=120"),
+        timeout_login_s=float(os.getenv("TIMEOUT_LOGIN_S", "20")),
+        timeout_scale_s=float(os.getenv("TIMEOUT_SCALE_S", "20")),
+        timeout_poll_s=float(os.getenv("TIMEOUT_POLL_S", "30")),
+        loader_threads=int(os.getenv("LOADER_THREADS", "2")),
+        decode_workers=int(os.getenv("DECODE_WORKERS", "2")),
+        decode_inline_max_bytes=int(os.getenv("DECODE_INLINE_MAX_BYTES", "262144")),
+        decode_max_pending=int(os.getenv("DECODE_MAX_PENDING", "8")),
+        order_journal_db_path=os.getenv("ORDER_JOURNAL_DB_PATH", str(Path(__file__).resolve().parents[1] / "data" / "orders.sqlite3")),
+        order_journal_batch=int(os.getenv("ORDER_JOURNAL_BATCH", "200")),
+        order_journal_flush_s=float(os.getenv("ORDER_JOURNAL_FLUSH_S", "1")),
+        live_queue_max=int(os.getenv("LIVE_QUEUE_MAX", "256")),
+        meter_state_max=int(os.getenv("METER_STATE_MAX", "100000")),
+        meter_state_max_age_s=float(os.getenv("METER_STATE_MAX_AGE_S", "300")),
+        result_ttl_s=float(os.getenv("RESULT_TTL_S", "900")),
+        result_max=int(os.getenv("RESULT_MAX", "50")),
+        report_chunk_days=os.getenv("REPORT_CHUNK_DAYS", "S02=1,S2B=1,S05=1,S5B=1,S04=92,S4E=92"),
+        report_chunk_concurrency=int(os.getenv("REPORT_CHUNK_CONCURRENCY", "2")),
+        report_chunk_retries=int(os.getenv("REPORT_CHUNK_RETRIES", "1")),
+        report_chunk_max=int(os.getenv("REPORT_CHUNK_MAX", "1000")),
+        loop_monitor=os.getenv("LOOP_MONITOR", "1").strip().lower() in ("1", "true", "yes", "si", "sí"),
+        loop_beat_s=float(os.getenv("LOOP_BEAT_S", "0.1")),
+        loop_block_threshold_s=float(os.getenv("LOOP_BLOCK_THRESHOLD_S", "0.25")),
+        loop_log_path=os.getenv("LOOP_LOG_PATH", str(Path(__file__).resolve().parents[1] / "data" / "loop_blocks.log")),
+        loop_log_max_bytes=int(os.getenv("LOOP_LOG_MAX_BYTES", "1048576")),
+        loop_log_backups=int(os.getenv("LOOP_LOG_BACKUPS", "3")),
+        prefetch_s01=os.getenv("PREFETCH_S01", "1").strip().lower() in ("1", "true", "yes", "si", "sí"),
+        prefetch_ttl_s=float(os.getenv("PREFETCH_TTL_S", "30")),
+        prefetch_per_conc=int(os.getenv("PREFETCH_PER_CONC", "1")),
+        order_massive_max_parallel=int(os.getenv("ORDER_MASSIVE_MAX_PARALLEL", "4")),
+        order_plan_ttl_s=float(os.getenv("ORDER_PLAN_TTL_S", "86400")),
+        order_plan_history_days=float(os.getenv("ORDER_PLAN_HISTORY_DAYS", "30")),
     )
@@ -0,0 +1,339 @@
+"""Decodificación de respuestas GEDE (JSON -> CSV -> XML a filas).
+
+Parsear un S02/S04 grande (XML de varios MB) lleva cientos de ms de CPU; hecho
+en el handler frena el loop para todos. `decode_async`:
+
+- payloads chicos (< DECODE_INLINE_MAX_BYTES): inline, no vale la pena el viaje;
+- grandes: en un pool de procesos (DECODE_WORKERS, 0 = todo inline), con a lo
+  sumo DECODE_MAX_PENDING pedidos en vuelo (los demás esperan turno). Si el
+  pool se cae se recrea y se reintenta una vez; si vuelve a caerse, el pedido
+  falla (`DecodeUnavailable`): un payload grande nunca se parsea en el loop.
+
+Las filas (XML, CSV o JSON lista de objetos) salen como `app.table.Table`:
+columnas internadas, valores por columna y los atributos comunes (Report,
+Cnc, Cnt) una sola vez. Del proceso vuelve esa misma tabla, así que las
+claves viajan una sola vez. Este módulo no importa FastAPI para que los
+procesos hijos arranquen livianos.
+
+Proyección: quien sólo necesita algunos campos (Eacti tras un B03, un par de
+tensiones) pasa `fields` y, si le alcanza con las primeras filas, `limit`.
+Achica lo que se arma y se devuelve (filas, columnas, la Table que vuelve del
+proceso hijo), no el parseo: el XML se lee entero igual, porque el record
+tag se elige mirando todas las hojas.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.config import get_settings
+from app.table import Table, TableBuilder
+
+log = logging.getLogger(__name__)
+
+
+class DecodeUnavailable(RuntimeError):
+    """El pool de procesos se cayó dos veces seguidas decodificando un payload grande."""
+
+_POOL: Dict[str, Any] = {"executor": None, "sem": None}
+
+
+def _try_parse_csv(text: str) -> Optional[list[dict[str, Any]]]:
+    # intenta parsear CSV con separador ',' o ';'
+    for delim in [",", ";", "	"]:
+        try:
+            f = io.StringIO(text)
+            reader = csv.DictReader(f, delimiter=delim)
+            rows = list(reader)
+            if rows and reader.fieldnames and len(reader.fieldnames) >= 2:
+                return rows
+        except Exception:
+            pass
+    return None
+
+
+
+def _keeper(fields: Optional[Iterable[str]]) -> Optional[Callable[[str], bool]]:
+    """Filtro de columnas: por nombre completo ('Cnc.Id') o de atributo ('Eacti'), sin distinguir mayúsculas."""
+    if not fields:
+        return None
+    want = {f.strip().lower() for f in fields if f and f.strip()}
+    if not want:
+        return None
+
+    seen: Dict[str, bool] = {}
+
+    def keep(col: str) -> bool:
+        # se consulta por cada atributo de cada record: memo por nombre de columna
+        hit = seen.get(col)
+        if hit is None:
+            c = col.lower()
+            hit = seen[col] = c in want or c.rsplit(".", 1)[-1] in want
+        return hit
+
+    return keep
+
+
+def _project_rows(rows: list, keep: Optional[Callable[[str], bool]], limit: Optional[int]) -> list:
+    if limit is not None:
+        rows = rows[:limit]
+    if keep is not None:
+        rows = [{k: v for k, v in r.items() if keep(k)} for r in rows]
+    return rows
+
+
+def _strip_ns(tag: str) -> str:
+    # '{ns}Tag' -> 'Tag'
+    if not tag:
+        return "Tag"
+    if tag.startswith("{") and "}" in tag:
+        return tag.split("}", 1)[1]
+    return tag
+
+def _xml_report_to_rows(
+    xml_text: str,
+    fields: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+) -> Optional[Table]:
+    """Convierte el XML de GEDE a filas/columnas.
+
+    Estrategia:
+      1) Buscar un 'record tag' (elemento hoja con atributos) repetido; si no hay repetidos,
+         elegir el elemento hoja con MÁS atributos.
+      2) Para cada record, generar una fila con:
+         - atributos del root (Report)
+         - atributos de ancestros (por ejemplo Cnc.Id, Cnt.Id)
+         - atributos del record (sin prefijo si no colisiona; si colisiona, se prefija)
+      3) Con `fields`, sólo esas columnas (los nombres no cambian: las colisiones se
+         calculan igual que sin proyección); con `limit`, sólo los primeros records.
+         El árbol se parsea y recorre entero en ambos casos (elegir el record tag
+         requiere ver todas las hojas): lo que se ahorra es armar las filas.
+    """
+    import xml.etree.ElementTree as ET
+    try:
+        root = ET.fromstring(xml_text)
+    except Exception:
+        return None
+
+    # Recolectar candidatos hoja con atributos o texto
+    leafs: list[ET.Element] = []
+    all_elems: list[ET.Element] = []
+
+    def walk(e: ET.Element):
+        all_elems.append(e)
+        children = list(e)
+        if not children:
+            leafs.append(e)
+        for ch in children:
+            walk(ch)
+
+    walk(root)
+
+    def leaf_score(e: ET.Element) -> int:
+        return len(e.attrib or {}) + (1 if (e.text or "").strip() else 0)
+
+    # Agrupar hojas por tag (sin namespace)
+    groups: dict[str, list[ET.Element]] = {}
+    for e in leafs:
+        if leaf_score(e) == 0:
+            continue
+        t = _strip_ns(e.tag)
+        groups.setdefault(t, []).append(e)
+
+    # Elegir record group
+    record_tag = None
+    record_elems: list[ET.Element] = []
+
+    # Preferir repetidos
+    best = (0, 0)  # (count, avg_attr)
+    for t, elems in groups.items():
+        if len(elems) < 2:
+            continue
+        avg_attr = sum(len(x.attrib or {}) for x in elems) / max(1, len(elems))
+        key = (len(elems), int(avg_attr))
+        if key > best:
+            best = key
+            record_tag = t
+            record_elems = elems
+
+    if not record_elems:
+        # Elegir el hoja con más atributos (o texto)
+        best_elem = None
+        best_score = -1
+        for e in leafs:
+            sc = leaf_score(e)
+            if sc > best_score:
+                best_score = sc
+                best_elem = e
+        if best_elem is None:
+            return None
+        record_tag = _strip_ns(best_elem.tag)
+        record_elems = [best_elem]
+
+    # Necesitamos ancestros: ElementTree no da parent, así que recorremos y armamos parent map
+    parent: dict[ET.Element, ET.Element] = {}
+    for e in all_elems:
+        for ch in list(e):
+            parent[ch] = e
+
+    def ancestors(e: ET.Element):
+        cur = e
+        out = []
+        while cur in parent:
+            cur = parent[cur]
+            out.append(cur)
+        return out  # desde padre hacia root
+
+    # Root attrs (Report)
+    root_attrs = {}
+    for k, v in (root.attrib or {}).items():
+        root_attrs[_strip_ns(k)] = v
+
+    keep = _keeper(fields)
+    if limit is not None:
+        record_elems = record_elems[:max(0, limit)]
+
+    # Columnas heredadas (root + ancestros): se arman una vez por padre, no por record.
+    # Se guarda la fila base ya proyectada y el conjunto completo de nombres (colisiones).
+    inherited: dict[Optional[ET.Element], tuple[dict[str, Any], set[str]]] = {}
+
+    def base_row(rec: ET.Element) -> tuple[dict[str, Any], set[str]]:
+        key = parent.get(rec)
+        hit = inherited.get(key)
+        if hit is None:
+            base = dict(root_attrs)
+            # Ancestros relevantes (hasta root)
+            for a in ancestors(rec):
+                tag = _strip_ns(a.tag)
+                for k, v in (a.attrib or {}).items():
+                    col = f"{tag}.{_strip_ns(k)}"
+                    # no pisar si existe
+                    if col not in base:
+                        base[col] = v
+            names = set(base)
+            if keep is not None:
+                base = {k: v for k, v in base.items() if keep(k)}
+            hit = inherited[key] = (base, names)
+        return hit
+
+    rows = TableBuilder()
+    for rec in record_elems:
+        base, used = base_row(rec)
+        row: dict[str, Any] = dict(base)
+
+        # Record attrs
+        names = set(used)
+        for k, v in (rec.attrib or {}).items():
+            kk = _strip_ns(k)
+            col = kk if kk not in used else f"{record_tag}.{kk}"
+            names.add(col)
+            if keep is None or keep(col):
+                row[col] = v
+
+        # Texto del record si aplica
+        t = (rec.text or "").strip()
+        if t:
+            col = "value" if "value" not in names else f"{record_tag}.value"
+            names.add(col)
+            if keep is None or keep(col):
+                row[col] = t
+
+        # También incluir el tag del record
+        if record_tag and "recordTag" not in names and (keep is None or keep("recordTag")):
+            row["recordTag"] = record_tag
+
+        rows.add(row)
+
+    table = rows.build()
+    return table if table else None
+
+
+def decode_text(raw_text: str, fields: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> Any:
+    """JSON, si no CSV, si no XML->filas. None si no se pudo interpretar.
+
+    Listas de filas (dicts) vuelven como `Table`; otro JSON, tal cual.
+    `fields` / `limit` proyectan las filas (ver `_xml_report_to_rows`).
+    """
+    keep = _keeper(fields)
+    # Intentar JSON
+    data: Any = None
+    try:
+        data = json.loads(raw_text)
+    except Exception:
+        data = None
+
+    # Intentar CSV si no es JSON
+    if data is None:
+        parsed_csv = _try_parse_csv(raw_text)
+        if parsed_csv is not None:
+            data = Table.from_rows(_project_rows(parsed_csv, keep, limit))
+
+    # Intentar XML->filas si no es JSON ni CSV
+    if data is None:
+        parsed_xml = _xml_report_to_rows(raw_text, fields, limit)
+        if parsed_xml is not None:
+            data = parsed_xml
+    elif isinstance(data, list) and data and all(isinstance(r, dict) for r in data):
+        data = Table.from_rows(_project_rows(data, keep, limit))
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Pool de procesos
+# ---------------------------------------------------------------------------
+
+def _decode_in_worker(content: bytes, encoding: Optional[str], fields: Optional[tuple], limit: Optional[int]) -> Any:
+    return decode_text(content.decode(encoding or "utf-8", errors="replace"), fields, limit)
+
+
+def _pool() -> Optional[ProcessPoolExecutor]:
+    workers = get_settings().decode_workers
+    if workers <= 0:
+        return None
+    if _POOL["executor"] is None:
+        # spawn: los hijos no heredan hilos/sockets del servidor
+        _POOL["executor"] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _POOL["sem"] = asyncio.Semaphore(max(1, get_settings().decode_max_pending))
+    return _POOL["executor"]
+
+
+async def decode_async(
+    content: bytes,
+    encoding: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+) -> Any:
+    """Decodifica `content`; si es grande, en el pool de procesos."""
+    s = get_settings()
+    fields = tuple(fields) if fields else None
+    pool = _pool() if len(content) >= s.decode_inline_max_bytes else None
+    if pool is None:
+        return decode_text(content.decode(encoding or "utf-8", errors="replace"), fields, limit)
+    for attempt in (1, 2):
+        sem = _POOL["sem"]
+        async with sem:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, _decode_in_worker, content, encoding, fields, limit)
+            except BrokenProcessPool:
+                # otro pedido pudo haberlo recreado ya: sólo se baja el pool que falló
+                if _POOL["executor"] is pool:
+                    shutdown()
+        if attempt == 1:
+            log.warning("Pool de decodificación caído; se recrea y se reintenta")
+            pool = _pool()
+            if pool is None:
+                break
+    raise DecodeUnavailable("El pool de decodificación se cayó dos veces; no se decodifica en el event loop.")
+
+
+def shutdown() -> None:
+    ex = _POOL["executor"]
+    _POOL["executor"] = None
+    _POOL["sem"] = None
+    if ex is not None:
+        ex.shutdown(wait=False, cancel_futures=True)
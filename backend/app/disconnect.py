@@ -0,0 +1,45 @@
+"""Cortar el trabajo contra el concentrador si el cliente se fue.
+
+Si el operador cierra la página mientras se espera un reporte, no tiene
+sentido seguir ocupando el slot de la cola y la sesión del concentrador:
+
+    return await disconnect.guard(request, _read_meter_report(...), "report")
+
+Mientras `aw` corre se consulta `request.is_disconnected()` cada POLL_S. Si
+el cliente se desconectó se cancela la tarea (las llamadas httpx en curso se
+cortan, el slot y el lease se liberan en sus `finally`) y se responde 499.
+"""
+import asyncio
+import time
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app import metrics
+
+T = TypeVar("T")
+
+POLL_S = 0.5
+# Código usado por nginx para "el cliente cerró la conexión"
+CLIENT_CLOSED = 499
+
+
+async def guard(request: Request, aw: Awaitable[T], endpoint: str) -> T:
+    task = asyncio.ensure_future(aw)
+    started = time.monotonic()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=POLL_S)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    metrics.incr("client_disconnect", endpoint=endpoint)
+    metrics.observe("client_disconnect_elapsed_s", time.monotonic() - started, endpoint=endpoint)
+    raise HTTPException(status_code=CLIENT_CLOSED, detail="El cliente cerró la conexión; se canceló el pedido.")
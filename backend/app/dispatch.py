@@ -0,0 +1,160 @@
+"""Cola de despacho por concentrador con carriles de prioridad.
+
+Cada concentrador (IP) tiene pocos "slots" de sesión. Antes de hablar con el
+equipo se pide un slot:
+
+    async with dispatch.slot(ip, dispatch.INTERACTIVE, user):
+        ...login / report / logout...
+
+- Carriles: INTERACTIVE (/report, /order) siempre se atiende antes que
+  BACKGROUND (masivos, campañas). No se corta una llamada en curso: el
+  interactivo pasa primero en la cola.
+- Dentro de un carril, round-robin entre usuarios (un usuario con 50 pedidos
+  no bloquea a otro con 1).
+- Si la cola del carril está llena se responde 429 con Retry-After estimado.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+from fastapi import HTTPException
+
+from app import budget
+from app.config import get_settings
+
+INTERACTIVE = 0
+BACKGROUND = 1
+LANES = (INTERACTIVE, BACKGROUND)
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class _ConcQueue:
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.active = 0
+        # carril -> usuario -> cola FIFO de futures
+        self.lanes: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {l: OrderedDict() for l in LANES}
+        # promedio móvil del tiempo de servicio (para Retry-After)
+        self.avg_service_s = 5.0
+        self.served = 0
+        self.rejected = 0
+
+    def queued(self, lane: int) -> int:
+        return sum(len(q) for q in self.lanes[lane].values())
+
+    def retry_after(self, lane: int) -> int:
+        ahead = sum(self.queued(l) for l in LANES if l <= lane) + self.active
+        return max(1, math.ceil(self.avg_service_s * ahead / self.slots))
+
+    def _next(self) -> "asyncio.Future | None":
+        for lane in LANES:
+            users = self.lanes[lane]
+            while users:
+                user, q = next(iter(users.items()))
+                fut = q.popleft()
+                # round-robin: el usuario pasa al final de su carril
+                if q:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                if not fut.done():
+                    return fut
+        return None
+
+    def dispatch(self) -> None:
+        while self.active < self.slots:
+            fut = self._next()
+            if fut is None:
+                return
+            self.active += 1
+            fut.set_result(True)
+
+    def release(self, service_s: float) -> None:
+        self.active -= 1
+        self.served += 1
+        self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * max(0.0, service_s)
+        self.dispatch()
+
+    def remove(self, lane: int, user: str, fut: asyncio.Future) -> None:
+        q = self.lanes[lane].get(user)
+        if q is None:
+            return
+        try:
+            q.remove(fut)
+        except ValueError:
+            return
+        if not q:
+            del self.lanes[lane][user]
+
+
+_QUEUES: Dict[str, _ConcQueue] = {}
+
+
+def _queue_for(key: str) -> _ConcQueue:
+    q = _QUEUES.get(key)
+    if q is None:
+        q = _ConcQueue(get_settings().dispatch_slots_per_conc)
+        _QUEUES[key] = q
+    return q
+
+
+def _max_queue(lane: int) -> int:
+    s = get_settings()
+    return s.dispatch_max_queue if lane == INTERACTIVE else s.dispatch_max_queue_background
+
+
+@asynccontextmanager
+async def slot(key: str, lane: int = INTERACTIVE, user: str = "anon") -> AsyncIterator[None]:
+    """Espera turno para usar el concentrador `key` (IP). Ver docstring del módulo."""
+    q = _queue_for(key)
+
+    if q.queued(lane) >= _max_queue(lane):
+        q.rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Concentrador {key} ocupado: demasiados pedidos en cola. Reintentar más tarde.",
+            headers={"Retry-After": str(q.retry_after(lane))},
+        )
+
+    fut: asyncio.Future = asyncio.get_running_loop().create_future()
+    q.lanes[lane].setdefault(user, deque()).append(fut)
+    q.dispatch()
+    try:
+        # la espera en cola también consume el presupuesto del pedido (504 si se agota)
+        await budget.within(fut, "cola")
+    except BaseException:
+        if fut.done() and not fut.cancelled():
+            # ya se había otorgado el slot: devolverlo
+            q.release(0.0)
+        else:
+            q.remove(lane, user, fut)
+        raise
+
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        q.release(time.monotonic() - started)
+
+
+def busy(key: str) -> bool:
+    """True si el concentrador no tiene slot libre o hay interactivos esperando."""
+    q = _QUEUES.get(key)
+    return q is not None and (q.active >= q.slots or q.queued(INTERACTIVE) > 0)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        key: {
+            "slots": q.slots,
+            "active": q.active,
+            "queued": {LANE_NAMES[l]: q.queued(l) for l in LANES},
+            "avg_service_s": round(q.avg_service_s, 3),
+            "served": q.served,
+            "rejected": q.rejected,
+        }
+        for key, q in _QUEUES.items()
+    }
@@ -0,0 +1,80 @@
+"""Eventos en vivo (estado del relé y avance de órdenes) para los WebSocket.
+
+En vez de que la página repita S01 para ver si el corte/reconexión se aplicó,
+el backend publica lo que ya sabe y el cliente lo recibe por
+/api/live/ws?meter=...&conc_id=...&batch=...:
+
+    events.publish("relay", meter=1234, conc_id=7, eacti="0", source="order")
+
+- Cada suscriptor tiene su cola acotada (LIVE_QUEUE_MAX). Si un cliente lento
+  la llena se descarta el evento más viejo: nunca se frena la orden.
+- Filtros por medidor, concentrador y/o lote (id que manda la página al
+  lanzar /order_massive); sin filtros recibe todo.
+- Eventos por proceso: con varios workers cada cliente ve los del worker al
+  que está conectado (igual que /api/metrics).
+"""
+import asyncio
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from app import metrics
+from app.config import get_settings
+
+
+class Subscriber:
+    def __init__(self, meters: Iterable[int] = (), concs: Iterable[int] = (), batches: Iterable[str] = ()):
+        self.meters: Set[int] = set(meters)
+        self.concs: Set[int] = set(concs)
+        self.batches: Set[str] = set(batches)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, get_settings().live_queue_max))
+        self.dropped = 0
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if not self.meters and not self.concs and not self.batches:
+            return True
+        return (
+            event.get("meter") in self.meters
+            or event.get("conc_id") in self.concs
+            or event.get("batch") in self.batches
+        )
+
+    def put(self, event: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            metrics.incr("live_events_dropped")
+        self.queue.put_nowait(event)
+
+
+_SUBSCRIBERS: Set[Subscriber] = set()
+
+
+def subscribe(meters: Iterable[int] = (), concs: Iterable[int] = (), batches: Iterable[str] = ()) -> Subscriber:
+    sub = Subscriber(meters, concs, batches)
+    _SUBSCRIBERS.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    _SUBSCRIBERS.discard(sub)
+
+
+def subscribers() -> int:
+    return len(_SUBSCRIBERS)
+
+
+def estado(eacti: Any) -> Optional[str]:
+    """Eacti del S01 -> texto que muestra la UI."""
+    return "Conectado" if str(eacti) == "1" else "Desconectado" if str(eacti) == "0" else None
+
+
+def publish(kind: str, meter: Optional[int] = None, conc_id: Optional[int] = None, **data: Any) -> None:
+    """Entrega `kind` (relay | order | batch) a los suscriptores interesados. No bloquea."""
+    if not _SUBSCRIBERS:
+        return
+    event = {"type": kind, "ts": time.time(), "meter": meter, "conc_id": conc_id, **data}
+    if "eacti" in data:
+        event["estado"] = estado(data["eacti"])
+    for sub in list(_SUBSCRIBERS):
+        if sub.wants(event):
+            sub.put(event)
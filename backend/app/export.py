@@ -0,0 +1,284 @@
+"""Exportación de filas de reportes a CSV / XLSX sin armar todo en memoria.
+
+- CSV: se genera y envía por partes (StreamingResponse) a medida que llegan
+  las lecturas de cada medidor.
+- XLSX: openpyxl en modo `write_only` (las filas van a un temporal en disco) y
+  el archivo final se sirve desde disco. Las filas las escribe un hilo que
+  recibe las lecturas por una cola: el loop sólo lee medidores.
+
+Encabezados: "Significado (código)" usando la Biblioteca de Significados.
+Las columnas se fijan con la primera lectura con datos (mismo reporte => mismas
+columnas); claves nuevas en lecturas posteriores no se agregan.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from app.significados import meaning_for
+from app.table import Table
+
+# (medidor, filas | None, error | None)
+ExportItem = Tuple[str, Optional[List[Dict[str, Any]]], Optional[str]]
+
+# Cada cuántas filas se manda un bloque del CSV
+CSV_FLUSH_ROWS = 1000
+# Lecturas encoladas para el hilo del XLSX (si se llena, se espera a que escriba)
+XLSX_QUEUE_ITEMS = 64
+
+# Cada cuánto se revisa, con la cola llena, si el hilo del XLSX sigue vivo
+XLSX_PUT_WAIT_S = 0.5
+# Caracteres que Excel no admite en el nombre de una hoja
+_SHEET_BAD_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+_XLSX_DONE = object()
+
+
+def report_rows(data: Any) -> List[Dict[str, Any]]:
+    """Normaliza `data` de un reporte a lista de dicts."""
+    if isinstance(data, Table):
+        return data.rows()
+    if isinstance(data, list):
+        return [r for r in data if isinstance(r, dict)]
+    if isinstance(data, dict):
+        rows = data.get("rows") if isinstance(data.get("rows"), list) else None
+        return [r for r in rows if isinstance(r, dict)] if rows is not None else [data]
+    return []
+
+
+def _cell(v: Any) -> Any:
+    if v is None or isinstance(v, (str, int, float, bool)):
+        return v
+    return json.dumps(v, ensure_ascii=False, default=str)
+
+
+def _columns(rows: List[Dict[str, Any]]) -> List[str]:
+    cols: List[str] = []
+    seen = set()
+    for r in rows:
+        for k in r.keys():
+            if k not in seen:
+                seen.add(k)
+                cols.append(k)
+    return cols
+
+
+def header_labels(cols: List[str], sig: Optional[Dict[str, str]]) -> List[str]:
+    if not sig:
+        return list(cols)
+    out = []
+    for c in cols:
+        m = meaning_for(c, sig)
+        out.append(f"{m} ({c})" if m else c)
+    return out
+
+
+class _Table:
+    """Arma encabezado y filas planas (con Medidor/Error en modo masivo)."""
+
+    def __init__(self, bulk: bool, sig: Optional[Dict[str, str]]):
+        self.bulk = bulk
+        self.sig = sig
+        self.cols: Optional[List[str]] = None
+
+    def header(self) -> List[str]:
+        labels = header_labels(self.cols or [], self.sig)
+        return (["Medidor"] + labels + ["Error"]) if self.bulk else labels
+
+    def rows(self, meter: str, rows: List[Dict[str, Any]]) -> Iterator[List[Any]]:
+        cols = self.cols or []
+        for r in rows:
+            vals = [_cell(r.get(c)) for c in cols]
+            yield ([meter] + vals + [None]) if self.bulk else vals
+
+    def error_row(self, meter: str, error: str) -> List[Any]:
+        return [meter] + [None] * len(self.cols or []) + [error]
+
+
+async def csv_stream(items: AsyncIterator[ExportItem], bulk: bool, sig: Optional[Dict[str, str]]) -> AsyncIterator[bytes]:
+    table = _Table(bulk, sig)
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    pending_errors: List[Tuple[str, str]] = []
+    first = True
+
+    def take() -> bytes:
+        nonlocal first
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        # BOM para que Excel reconozca UTF-8 (acentos)
+        if first and data:
+            first = False
+            return ("\ufeff" + data).encode("utf-8")
+        return data.encode("utf-8")
+
+    async for meter, rows, error in items:
+        if error is not None or not rows:
+            err = error or "Sin datos"
+            if table.cols is None:
+                pending_errors.append((meter, err))
+            elif bulk:
+                w.writerow(table.error_row(meter, err))
+            continue
+        if table.cols is None:
+            table.cols = _columns(rows)
+            w.writerow(table.header())
+            for m, e in pending_errors:
+                if bulk:
+                    w.writerow(table.error_row(m, e))
+            pending_errors.clear()
+        for i, row in enumerate(table.rows(meter, rows), 1):
+            w.writerow(row)
+            if i % CSV_FLUSH_ROWS == 0:
+                yield take()
+        yield take()
+
+    if table.cols is None:
+        # ninguna lectura con datos: sólo errores
+        table.cols = []
+        w.writerow(table.header())
+        for m, e in pending_errors:
+            if bulk:
+                w.writerow(table.error_row(m, e))
+    chunk = take()
+    if chunk:
+        yield chunk
+
+
+def _sheet_title(title: str) -> str:
+    """Nombre de hoja válido: sin []:*?/\\, sin comillas en los extremos, hasta 31 caracteres."""
+    t = _SHEET_BAD_CHARS.sub("_", title or "").strip().strip("'")[:31].strip()
+    return t or "Reporte"
+
+
+def _xlsx_write(q: "queue.Queue[Any]", stop: threading.Event, bulk: bool, sig: Optional[Dict[str, str]], title: str) -> Optional[str]:
+    """Hilo del XLSX: consume lecturas de `q` hasta _XLSX_DONE y guarda. None si se abortó."""
+    import openpyxl
+
+    failure: Optional[BaseException] = None
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=_sheet_title(title))
+    table = _Table(bulk, sig)
+    pending_errors: List[Tuple[str, str]] = []
+
+    while True:
+        item = q.get()
+        if stop.is_set():
+            _discard_sheet(ws)
+            return None
+        if item is _XLSX_DONE:
+            break
+        if failure is not None:
+            # seguir vaciando la cola para que el loop nunca quede esperando lugar
+            continue
+        meter, rows, error = item
+        try:
+            if error is not None or not rows:
+                err = error or "Sin datos"
+                if table.cols is None:
+                    pending_errors.append((meter, err))
+                elif bulk:
+                    ws.append(table.error_row(meter, err))
+                continue
+            if table.cols is None:
+                table.cols = _columns(rows)
+                ws.append(table.header())
+                for m, e in pending_errors:
+                    if bulk:
+                        ws.append(table.error_row(m, e))
+                pending_errors.clear()
+            for row in table.rows(meter, rows):
+                ws.append(row)
+        except Exception as e:
+            failure = e
+    if failure is not None:
+        _discard_sheet(ws)
+        raise failure
+
+    if table.cols is None:
+        table.cols = []
+        ws.append(table.header())
+        for m, e in pending_errors:
+            if bulk:
+                ws.append(table.error_row(m, e))
+
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
+def _discard_sheet(ws: Any) -> None:
+    """Libro que no se va a guardar: cerrar la hoja y borrar su temporal de openpyxl."""
+    try:
+        ws.close()
+        os.unlink(ws._writer.out)
+    except Exception:
+        pass
+
+
+async def xlsx_file(items: AsyncIterator[ExportItem], bulk: bool, sig: Optional[Dict[str, str]], title: str = "Reporte") -> str:
+    """Escribe el XLSX en un temporal (write_only) y devuelve la ruta. El llamador lo borra.
+
+    Las lecturas pasan por una cola acotada a un hilo que arma y guarda el
+    libro; si el pedido se cancela, el hilo termina sin guardar.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=XLSX_QUEUE_ITEMS)
+    stop = threading.Event()
+    writer = asyncio.ensure_future(asyncio.to_thread(_xlsx_write, q, stop, bulk, sig, title))
+
+    async def put(item: Any) -> None:
+        # nunca esperar lugar a ciegas: si el hilo terminó (falló), no va a sacar nada más
+        while True:
+            if writer.done():
+                writer.result()  # propaga el error del hilo
+                raise RuntimeError("El hilo del XLSX terminó antes de tiempo")
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+            try:
+                await asyncio.to_thread(q.put, item, True, XLSX_PUT_WAIT_S)
+                return
+            except queue.Full:
+                continue
+
+    try:
+        async for item in items:
+            await put(item)
+        await put(_XLSX_DONE)
+    except BaseException:
+        stop.set()
+        try:
+            # despierta al hilo si está esperando (con la cola llena no espera: ve `stop` al sacar)
+            q.put_nowait(_XLSX_DONE)
+        except queue.Full:
+            pass
+        raise
+    try:
+        path = await asyncio.shield(writer)
+    except asyncio.CancelledError:
+        # cancelado mientras guardaba: el archivo no lo va a servir nadie
+        writer.add_done_callback(_discard_saved)
+        raise
+    return path
+
+
+def _discard_saved(writer: "asyncio.Future[Optional[str]]") -> None:
+    if not writer.cancelled() and writer.exception() is None and writer.result():
+        try:
+            os.unlink(writer.result())
+        except OSError:
+            pass
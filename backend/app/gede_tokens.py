@@ -0,0 +1,449 @@
+"""Broker de sesiones GEDE compartido entre procesos (workers de uvicorn).
+
+Los concentradores admiten muy pocas sesiones. En vez de que cada request
+(y cada worker) haga login/logout propio, todos piden un "lease" sobre una
+sesión compartida por base_url, coordinada en un SQLite local:
+
+    async with gede_tokens.lease(base_url) as sess:
+        r = await client.get(..., headers={"Authorization": f"Bearer {sess.token}"})
+        if r.status_code in (401, 403):
+            await sess.refresh()
+
+- Tope global de sesiones por concentrador (GEDE_SESSIONS_PER_CONC) entre
+  todos los workers; si no hay lugar se espera (hasta GEDE_SESSION_WAIT_S).
+- Conteo de referencias por leases. Cada worker renueva el heartbeat de sus
+  leases desde el reaper; si un worker muere, sus leases dejan de latir y a
+  los _LEASE_STALE_S los descarta cualquier otro. Al apagar, el worker suelta
+  los suyos.
+- Renovación y logout centralizados: una sesión sin leases se cierra (logout)
+  al vencer el token, si quedó inválida (401/403) o tras GEDE_SESSION_IDLE_S
+  sin uso.
+- Si el pedido se cancela (cliente desconectado) y era el único lease, la
+  sesión se cierra enseguida: el equipo puede seguir trabajando para ese token.
+- El store (BEGIN IMMEDIATE, timeout 10 s) se usa desde un hilo, nunca desde
+  el event loop; una escritura empezada termina aunque se cancele el pedido.
+"""
+import asyncio
+import functools
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from app import budget, metrics
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+# No se entrega un token al que le quede menos que esto
+_EXPIRY_MARGIN_S = 30.0
+# Un login que no terminó en este tiempo se considera abandonado
+_LOGIN_STALE_S = 60.0
+# Un lease más viejo que esto se considera perdido (aunque su worker siga latiendo)
+_LEASE_MAX_S = 30 * 60.0
+# Un lease sin heartbeat por este tiempo es de un worker muerto (el reaper late cada <= 10 s)
+_LEASE_STALE_S = 90.0
+
+# Identidad de este proceso como dueño de leases
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS gede_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    base_url TEXT NOT NULL,
+    token TEXT,
+    state TEXT NOT NULL,            -- login | ready | dead | closing
+    scaled INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_gede_sessions_url ON gede_sessions (base_url, state);
+CREATE TABLE IF NOT EXISTS gede_leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS ix_gede_leases_session ON gede_leases (session_id);
+"""
+
+_DB: Dict[str, Any] = {"conn": None, "path": None}
+_DB_LOCK = threading.Lock()
+_REAPER: Dict[str, Any] = {"task": None}
+# reaps lanzados fuera del loop del reaper (se guarda la referencia hasta que terminan)
+_PENDING: Set[asyncio.Task] = set()
+
+
+def _db() -> sqlite3.Connection:
+    path = get_settings().gede_sessions_db_path
+    if _DB["conn"] is None or _DB["path"] != path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        # bases creadas cuando los leases se validaban por pid
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(gede_leases)")}
+        for col, typ in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE gede_leases ADD COLUMN {col} {typ}")
+        _DB["conn"] = conn
+        _DB["path"] = path
+    return _DB["conn"]
+
+
+# ---------------------------------------------------------------------------
+# Operaciones atómicas sobre el store
+# ---------------------------------------------------------------------------
+
+def _try_acquire(base_url: str, cap: int) -> Tuple[str, int, Optional[str], bool, Optional[int]]:
+    """('lease', sid, token, scaled, lease_id) | ('login', sid, None, False, None) | ('wait', 0, None, False, None)"""
+    now = time.time()
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, token, scaled FROM gede_sessions WHERE base_url = ? AND state = 'ready' AND expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT 1",
+                (base_url, now + _EXPIRY_MARGIN_S),
+            ).fetchone()
+            if row is not None:
+                sid, token, scaled = row
+                cur = conn.execute(
+                    "INSERT INTO gede_leases (session_id, pid, acquired_at, owner, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                    (sid, os.getpid(), now, _OWNER, now),
+                )
+                conn.execute("UPDATE gede_sessions SET last_used = ? WHERE id = ?", (now, sid))
+                conn.execute("COMMIT")
+                return "lease", sid, token, bool(scaled), int(cur.lastrowid)
+
+            n = conn.execute("SELECT COUNT(*) FROM gede_sessions WHERE base_url = ?", (base_url,)).fetchone()[0]
+            if n < cap:
+                cur = conn.execute(
+                    "INSERT INTO gede_sessions (base_url, state, created_at, last_used) VALUES (?, 'login', ?, ?)",
+                    (base_url, now, now),
+                )
+                conn.execute("COMMIT")
+                return "login", int(cur.lastrowid), None, False, None
+            conn.execute("COMMIT")
+            return "wait", 0, None, False, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _finish_login(sid: int, token: str, ttl_s: float) -> int:
+    now = time.time()
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE gede_sessions SET token = ?, state = 'ready', expires_at = ?, last_used = ? WHERE id = ?",
+                (token, now + ttl_s, now, sid),
+            )
+            cur = conn.execute(
+                "INSERT INTO gede_leases (session_id, pid, acquired_at, owner, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (sid, os.getpid(), now, _OWNER, now),
+            )
+            conn.execute("COMMIT")
+            return int(cur.lastrowid)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _delete_session(sid: int) -> None:
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("DELETE FROM gede_leases WHERE session_id = ?", (sid,))
+        conn.execute("DELETE FROM gede_sessions WHERE id = ?", (sid,))
+
+
+def _release(lease_id: int, sid: int) -> None:
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("DELETE FROM gede_leases WHERE id = ?", (lease_id,))
+        conn.execute("UPDATE gede_sessions SET last_used = ? WHERE id = ?", (time.time(), sid))
+
+
+def _abandon(lease_id: int, sid: int) -> bool:
+    """Pedido cancelado: si era el único lease, la sesión queda 'dead' para logout inmediato."""
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            others = conn.execute(
+                "SELECT COUNT(*) FROM gede_leases WHERE session_id = ? AND id != ?", (sid, lease_id)
+            ).fetchone()[0]
+            if not others:
+                conn.execute("UPDATE gede_sessions SET state = 'dead' WHERE id = ? AND state = 'ready'", (sid,))
+            conn.execute("COMMIT")
+            return not others
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _mark(sid: int, **fields: Any) -> None:
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    with _DB_LOCK:
+        _db().execute(f"UPDATE gede_sessions SET {sets} WHERE id = ?", (*fields.values(), sid))
+
+
+def _beat_leases() -> None:
+    """Heartbeat de los leases de este proceso."""
+    with _DB_LOCK:
+        _db().execute("UPDATE gede_leases SET heartbeat = ? WHERE owner = ?", (time.time(), _OWNER))
+
+
+def _drop_own_leases() -> int:
+    """Al apagar: suelta los leases de este proceso (las sesiones quedan para los demás o el reaper)."""
+    with _DB_LOCK:
+        return _db().execute("DELETE FROM gede_leases WHERE owner = ?", (_OWNER,)).rowcount
+
+
+def _claim_closable(idle_s: float) -> List[Tuple[int, str, Optional[str]]]:
+    """Marca 'closing' las sesiones sin leases que hay que cerrar y las devuelve."""
+    now = time.time()
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # leases perdidos (worker muerto: sin heartbeat; o demasiado viejos)
+            conn.execute(
+                "DELETE FROM gede_leases WHERE COALESCE(heartbeat, acquired_at) < ? OR acquired_at < ?",
+                (now - _LEASE_STALE_S, now - _LEASE_MAX_S),
+            )
+            # logins abandonados
+            conn.execute("DELETE FROM gede_sessions WHERE state = 'login' AND created_at < ?", (now - _LOGIN_STALE_S,))
+            rows = conn.execute(
+                "SELECT s.id, s.base_url, s.token FROM gede_sessions s "
+                "WHERE s.state IN ('ready', 'dead') "
+                "AND NOT EXISTS (SELECT 1 FROM gede_leases l WHERE l.session_id = s.id) "
+                "AND (s.state = 'dead' OR s.expires_at <= ? OR s.last_used < ?)",
+                (now + _EXPIRY_MARGIN_S, now - idle_s),
+            ).fetchall()
+            for sid, _, _ in rows:
+                conn.execute("UPDATE gede_sessions SET state = 'closing' WHERE id = ?", (sid,))
+            # cierres que otro worker dejó a medias
+            conn.execute("DELETE FROM gede_sessions WHERE state = 'closing' AND last_used < ?", (now - _LOGIN_STALE_S - idle_s,))
+            conn.execute("COMMIT")
+            return [(int(sid), url, tok) for sid, url, tok in rows]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _in_thread(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> "asyncio.Future[Any]":
+    """Operación sobre el store en un hilo (BEGIN IMMEDIATE puede esperar hasta 10 s)."""
+    return asyncio.ensure_future(asyncio.to_thread(functools.partial(fn, *args, **kwargs)))
+
+
+async def _settled(fut: "asyncio.Future[Any]") -> Any:
+    """Espera `fut`; si cancelan al que espera, deja terminar la escritura y recién ahí propaga."""
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        await asyncio.wait({fut})
+        raise
+
+
+def _result(fut: "asyncio.Future[Any]") -> Any:
+    if fut.done() and not fut.cancelled() and fut.exception() is None:
+        return fut.result()
+    return None
+
+
+async def _store(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await _settled(_in_thread(fn, *args, **kwargs))
+
+
+async def reap() -> int:
+    """Logout de las sesiones ociosas/vencidas/inválidas. Lo puede correr cualquier worker."""
+    from app.routers import meters as m
+
+    closable = await _store(_claim_closable, get_settings().gede_session_idle_s)
+    for sid, base_url, token in closable:
+        if token:
+            await m._gede_logout(base_url, token)
+        await _store(_delete_session, sid)
+    return len(closable)
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+class GedeSession:
+    """Lease sobre una sesión compartida del concentrador `base_url`."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.sid: Optional[int] = None
+        self.lease_id: Optional[int] = None
+        self.token: str = ""
+        self.scaled = False
+
+    async def _acquire(self) -> None:
+        from app.routers import meters as m
+
+        s = get_settings()
+        deadline = time.monotonic() + s.gede_session_wait_s
+        while True:
+            fut = _in_thread(_try_acquire, self.base_url, max(1, s.gede_sessions_per_conc))
+            try:
+                kind, sid, token, scaled, lease_id = await _settled(fut)
+            except asyncio.CancelledError:
+                # la transacción ya corrió: no dejar un lease sin dueño ni un login reservado
+                got = _result(fut)
+                if got is not None and got[0] == "lease":
+                    self.sid, self.lease_id = got[1], got[4]
+                elif got is not None and got[0] == "login":
+                    await _store(_delete_session, got[1])
+                raise
+            if kind == "lease":
+                self.sid, self.lease_id, self.token, self.scaled = sid, lease_id, token or "", scaled
+                return
+            if kind == "login":
+                try:
+                    token = await m._gede_login(self.base_url)
+                except BaseException:
+                    await _store(_delete_session, sid)
+                    raise
+                self.sid, self.token, self.scaled = sid, token, False
+                fut = _in_thread(_finish_login, sid, token, s.gede_token_ttl_s)
+                try:
+                    self.lease_id = await _settled(fut)
+                except asyncio.CancelledError:
+                    self.lease_id = _result(fut)
+                    raise
+                return
+            # sin lugar: cerrar lo que se pueda y reintentar
+            if await reap() == 0:
+                await asyncio.sleep(0.25)
+            b = budget.current()
+            if b is not None and b.remaining() <= 0:
+                raise b.exhausted("sesión")
+            if time.monotonic() >= deadline:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Sin sesiones libres en el concentrador ({self.base_url}). Reintentar más tarde.",
+                    headers={"Retry-After": "5"},
+                )
+
+    async def _release(self) -> None:
+        lease_id, self.lease_id = self.lease_id, None
+        if lease_id is not None and self.sid is not None:
+            await _store(_release, lease_id, self.sid)
+
+    async def refresh(self) -> str:
+        """El token fue rechazado (401/403): invalidar la sesión y obtener otra."""
+        if self.sid is not None:
+            await _store(_mark, self.sid, state="dead")
+        await self._release()
+        await self._acquire()
+        return self.token
+
+    async def ensure_scaled(self) -> None:
+        """Escala privilegios del token una sola vez (necesario para B03)."""
+        if self.scaled:
+            return
+        from app.routers import meters as m
+
+        await m._gede_scale(self.base_url, self.token)
+        self.scaled = True
+        if self.sid is not None:
+            await _store(_mark, self.sid, scaled=1)
+
+
+@asynccontextmanager
+async def lease(base_url: str) -> AsyncIterator[GedeSession]:
+    sess = GedeSession(base_url)
+    try:
+        # dentro del try: un pedido cancelado a mitad del acquire suelta lo que alcanzó a tomar
+        await sess._acquire()
+        yield sess
+    except asyncio.CancelledError:
+        # pedido abortado (cliente desconectado): el equipo puede seguir
+        # procesando con este token; si nadie más la usa, logout ya
+        if sess.lease_id is not None and sess.sid is not None and await _store(_abandon, sess.lease_id, sess.sid):
+            metrics.incr("gede_session_abandoned")
+            _spawn_reap()
+        raise
+    finally:
+        await sess._release()
+
+
+def _spawn_reap() -> None:
+    task = asyncio.get_running_loop().create_task(reap())
+    _PENDING.add(task)
+    task.add_done_callback(_PENDING.discard)
+
+
+def stats() -> List[Dict[str, Any]]:
+    now = time.time()
+    with _DB_LOCK:
+        rows = _db().execute(
+            "SELECT s.id, s.base_url, s.state, s.scaled, s.created_at, s.expires_at, s.last_used, "
+            "(SELECT COUNT(*) FROM gede_leases l WHERE l.session_id = s.id) FROM gede_sessions s ORDER BY s.base_url, s.id"
+        ).fetchall()
+    return [
+        {
+            "id": sid,
+            "base_url": url,
+            "state": state,
+            "scaled": bool(scaled),
+            "age_s": round(now - created, 1),
+            "expires_in_s": round(exp - now, 1) if exp else None,
+            "idle_s": round(now - last, 1),
+            "leases": leases,
+        }
+        for sid, url, state, scaled, created, exp, last, leases in rows
+    ]
+
+
+async def _reaper_loop() -> None:
+    while True:
+        try:
+            await _store(_beat_leases)
+        except Exception:
+            log.exception("Error renovando leases GEDE")
+        try:
+            await reap()
+        except Exception:
+            log.exception("Error cerrando sesiones GEDE ociosas")
+        await asyncio.sleep(max(1.0, min(10.0, get_settings().gede_session_idle_s / 2)))
+
+
+def start_reaper() -> None:
+    if _REAPER["task"] is None or _REAPER["task"].done():
+        _REAPER["task"] = asyncio.get_running_loop().create_task(_reaper_loop())
+
+
+async def stop_reaper() -> None:
+    task = _REAPER["task"]
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    _REAPER["task"] = None
+    # leases que quedaron tomados (pedidos cortados por el apagado): no esperar a que venzan
+    try:
+        await _store(_drop_own_leases)
+    except Exception:
+        log.exception("No se pudieron soltar los leases GEDE de este proceso")
+    # cerrar lo que quedó ocioso de este proceso
+    try:
+        await reap()
+    except Exception:
+        pass
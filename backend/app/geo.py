@@ -0,0 +1,243 @@
+"""Índice espacial de medidores georreferenciados.
+
+Fuentes:
+  - cadena_electrica_georreferenciacion.xlsx: columnas de latitud/longitud
+    (lat/latitud/latitude, lon/lng/longitud/longitude) o una columna
+    "coordenada(s)" con "lat, lon".
+  - users_tecnica.json (alta de usuarios en Técnica): campo `coordenada`.
+
+Índice: grilla uniforme (celdas de GRID_DEG grados) -> posiciones en columnas
+`array('d')` de lat/lon. El clustering se hace en el servidor con una grilla
+que depende del zoom (≈ CLUSTER_PX píxeles de pantalla por celda).
+"""
+import json
+import math
+import os
+import re
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+# Tamaño de celda del índice (~1 km)
+GRID_DEG = 0.01
+# Radio aproximado de cluster en píxeles de pantalla (teselas de 256 px)
+CLUSTER_PX = 60
+# A partir de este zoom no se agrupa: se devuelven puntos paginados
+CLUSTER_MAX_ZOOM = 17
+
+_COORD_RE = re.compile(r"(-?\d+(?:[.,]\d+)?)\s*[,; ]\s*(-?\d+(?:[.,]\d+)?)")
+
+_GEO_CACHE: Dict[str, Any] = {"key": None, "index": None}
+
+
+def parse_coord(v: Any) -> Optional[Tuple[float, float]]:
+    """'-34.60, -58.38' -> (lat, lon). None si no es una coordenada válida."""
+    if v is None:
+        return None
+    m = _COORD_RE.search(str(v))
+    if not m:
+        return None
+    try:
+        lat = float(m.group(1).replace(",", "."))
+        lon = float(m.group(2).replace(",", "."))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def _to_float(v: Any) -> Optional[float]:
+    if v is None:
+        return None
+    try:
+        return float(str(v).strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+class GeoIndex:
+    def __init__(self) -> None:
+        self.lat = array("d")
+        self.lon = array("d")
+        self.meta: List[Dict[str, Any]] = []
+        self.cells: Dict[Tuple[int, int], array] = {}
+
+    def add(self, lat: float, lon: float, meta: Dict[str, Any]) -> None:
+        i = len(self.meta)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.meta.append(meta)
+        key = (math.floor(lon / GRID_DEG), math.floor(lat / GRID_DEG))
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = array("l")
+        cell.append(i)
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def query(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> List[int]:
+        """Posiciones de los puntos dentro del bbox (ordenadas)."""
+        x0, x1 = math.floor(min_lon / GRID_DEG), math.floor(max_lon / GRID_DEG)
+        y0, y1 = math.floor(min_lat / GRID_DEG), math.floor(max_lat / GRID_DEG)
+        out: List[int] = []
+        n_cells = (x1 - x0 + 1) * (y1 - y0 + 1)
+        if n_cells > len(self.cells):
+            keys = [k for k in self.cells if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+        else:
+            keys = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self.cells]
+        lat, lon = self.lat, self.lon
+        for k in keys:
+            for i in self.cells[k]:
+                if min_lat <= lat[i] <= max_lat and min_lon <= lon[i] <= max_lon:
+                    out.append(i)
+        out.sort()
+        return out
+
+    def point(self, i: int) -> Dict[str, Any]:
+        d = dict(self.meta[i])
+        d["lat"] = self.lat[i]
+        d["lon"] = self.lon[i]
+        return d
+
+
+def _catalog_path() -> str:
+    s = get_settings()
+    return os.path.abspath(s.cadena_electrica_xlsx_path)
+
+
+def _users_path() -> str:
+    from app.routers.tecnica import USERS_JSON
+
+    return str(USERS_JSON)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _load_catalog(index: GeoIndex, path: str) -> None:
+    import openpyxl
+
+    from app.routers.meters import _parse_meter_cell
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        low = [str(h).strip().lower() if h is not None else "" for h in header]
+
+        def col(*names: str) -> Optional[int]:
+            for n in names:
+                if n in low:
+                    return low.index(n)
+            return None
+
+        c_lat = col("lat", "latitud", "latitude", "y")
+        c_lon = col("lon", "lng", "long", "longitud", "longitude", "x")
+        c_coord = col("coordenada", "coordenadas", "coord", "ubicacion", "ubicación")
+        if c_coord is None and (c_lat is None or c_lon is None):
+            return
+        c_med = col("medidor", "meter", "idmedidor", "cir")
+        c_nis = col("nis", "n.i.s", "nº nis", "numero nis")
+        c_nom = col("nombre", "name", "cliente")
+        c_conc = col("concentrador")
+
+        def val(row: tuple, c: Optional[int]) -> Any:
+            return row[c] if c is not None and c < len(row) else None
+
+        for row in rows:
+            if c_lat is not None and c_lon is not None:
+                lat, lon = _to_float(val(row, c_lat)), _to_float(val(row, c_lon))
+                ll = (lat, lon) if lat is not None and lon is not None else None
+            else:
+                ll = parse_coord(val(row, c_coord))
+            if ll is None:
+                continue
+            nis = val(row, c_nis)
+            nom = val(row, c_nom)
+            index.add(ll[0], ll[1], {
+                "meter": _parse_meter_cell(val(row, c_med)),
+                "nis": str(nis).strip() if nis is not None else None,
+                "nombre": str(nom).strip() if nom is not None else None,
+                "conc_id": _parse_meter_cell(val(row, c_conc)),
+                "source": "catalogo",
+            })
+    finally:
+        wb.close()
+
+
+def _load_users(index: GeoIndex, path: str) -> None:
+    from app.routers.meters import _parse_meter_cell
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            users = json.load(f)
+    except Exception:
+        return
+    for u in users if isinstance(users, list) else []:
+        ll = parse_coord(u.get("coordenada"))
+        if ll is None:
+            continue
+        index.add(ll[0], ll[1], {
+            "meter": _parse_meter_cell(u.get("medidor")),
+            "nis": u.get("nis") or None,
+            "nombre": u.get("nombre") or None,
+            "conc_id": None,
+            "source": "tecnica",
+        })
+
+
+def get_index() -> GeoIndex:
+    """Índice vigente; se reconstruye si cambió el catálogo o users_tecnica.json."""
+    cat, users = _catalog_path(), _users_path()
+    key = (cat, _mtime(cat), users, _mtime(users))
+    if _GEO_CACHE["index"] is not None and _GEO_CACHE["key"] == key:
+        return _GEO_CACHE["index"]
+    index = GeoIndex()
+    if key[1] is not None:
+        _load_catalog(index, cat)
+    if key[3] is not None:
+        _load_users(index, users)
+    _GEO_CACHE["key"] = key
+    _GEO_CACHE["index"] = index
+    return index
+
+
+def cluster_cell_deg(zoom: int) -> float:
+    """Tamaño de celda de cluster (grados de longitud) para el zoom dado."""
+    return 360.0 / (2 ** zoom) * (CLUSTER_PX / 256.0)
+
+
+def clusters(index: GeoIndex, ids: List[int], zoom: int) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Agrupa `ids` en celdas según zoom. Devuelve (clusters>=2, ids sueltos)."""
+    size = cluster_cell_deg(zoom)
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for i in ids:
+        key = (math.floor(index.lon[i] / size), math.floor(index.lat[i] / size))
+        groups.setdefault(key, []).append(i)
+    out: List[Dict[str, Any]] = []
+    singles: List[int] = []
+    for members in groups.values():
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        lats = [index.lat[i] for i in members]
+        lons = [index.lon[i] for i in members]
+        out.append({
+            "lat": sum(lats) / len(lats),
+            "lon": sum(lons) / len(lons),
+            "count": len(members),
+            "bbox": [min(lons), min(lats), max(lons), max(lats)],
+        })
+    out.sort(key=lambda c: -c["count"])
+    singles.sort()
+    return out, singles
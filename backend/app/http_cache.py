@@ -0,0 +1,167 @@
+"""Cache HTTP (ETag / 304 / Cache-Control) para API y frontend estático.
+
+- JSON de la API (/api/significados, /api/config): ETag fuerte + revalidación.
+- Frontend estático: Cache-Control por carpeta y variantes pre-comprimidas
+  (gzip y, si está instalado el paquete `brotli`, br) para vendor/js/css.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:  # opcional (requirements.txt lo incluye): si no está instalado, sólo se sirve gzip
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover
+    brotli = None
+
+# Carpetas del bundle que se sirven pre-comprimidas
+COMPRESSED_DIRS = ("vendor", "js", "css")
+# No vale la pena comprimir archivos muy chicos
+MIN_COMPRESS_SIZE = 1024
+# Calidad br al arrancar: 11 (la del paquete) tarda segundos por archivo grande de
+# vendor; 5 sigue comprimiendo mejor que gzip -9 y tarda una fracción
+BROTLI_QUALITY = 5
+
+
+def etag_for_values(*values: Any) -> str:
+    """ETag fuerte a partir de valores serializables (ej: config)."""
+    body = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    return etag in [t.strip().removeprefix("W/") for t in inm.split(",")]
+
+
+def cached_json(request: Request, content: Any, etag: str, cache_control: str = "no-cache") -> Response:
+    """Devuelve 304 si el cliente ya tiene la versión `etag`; si no, el JSON completo.
+
+    `no-cache` no impide cachear: obliga a revalidar, que con ETag cuesta un 304 vacío.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
+
+def _accepted_encodings(request_headers: Headers) -> set[str]:
+    out: set[str] = set()
+    for part in (request_headers.get("accept-encoding") or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        out.add(token)
+    return out
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles con Cache-Control por carpeta y variantes .br/.gz pre-generadas.
+
+    Las variantes se guardan en `cache_dir` (no se ensucia frontend/static) y se
+    regeneran si cambia el mtime/tamaño del original.
+    """
+
+    def __init__(self, *, directory: str, cache_dir: str, vendor_max_age: int = 604800, **kwargs: Any):
+        super().__init__(directory=directory, **kwargs)
+        self.cache_dir = Path(cache_dir)
+        self.vendor_max_age = vendor_max_age
+        self.precompress()
+
+    # --- Pre-compresión ---
+    def _variant_path(self, rel: str, encoding: str) -> Path:
+        ext = ".br" if encoding == "br" else ".gz"
+        return self.cache_dir / (rel + ext)
+
+    def precompress(self) -> None:
+        """Genera (o actualiza) las variantes comprimidas del bundle."""
+        root = Path(str(self.directory))
+        for d in COMPRESSED_DIRS:
+            base = root / d
+            if not base.is_dir():
+                continue
+            for f in base.rglob("*"):
+                if not f.is_file():
+                    continue
+                st = f.stat()
+                if st.st_size < MIN_COMPRESS_SIZE:
+                    continue
+                rel = f.relative_to(root).as_posix()
+                encodings = ["gzip"] + (["br"] if brotli is not None else [])
+                for enc in encodings:
+                    out = self._variant_path(rel, enc)
+                    try:
+                        if out.exists() and out.stat().st_mtime >= st.st_mtime:
+                            continue
+                        out.parent.mkdir(parents=True, exist_ok=True)
+                        raw = f.read_bytes()
+                        data = brotli.compress(raw, quality=BROTLI_QUALITY) if enc == "br" else gzip.compress(raw, compresslevel=9, mtime=0)
+                        tmp = out.with_suffix(out.suffix + ".tmp")
+                        tmp.write_bytes(data)
+                        os.replace(tmp, out)
+                        os.utime(out, (st.st_mtime, st.st_mtime))
+                    except OSError:
+                        # best-effort: si no se puede escribir, se sirve sin comprimir
+                        continue
+
+    # --- Respuesta ---
+    def _cache_control(self, rel: str) -> str:
+        top = rel.split("/", 1)[0]
+        if top == "vendor":
+            # librerías de terceros: cambian sólo con ?v=N en el HTML
+            return f"public, max-age={self.vendor_max_age}"
+        # js/css/html propios: revalidar siempre (ETag -> 304)
+        return "no-cache"
+
+    def _pick_variant(self, rel: str, stat_result: os.stat_result, request_headers: Headers) -> Optional[tuple[str, Path]]:
+        if rel.split("/", 1)[0] not in COMPRESSED_DIRS:
+            return None
+        accepted = _accepted_encodings(request_headers)
+        for enc in ("br", "gzip"):
+            if enc not in accepted:
+                continue
+            p = self._variant_path(rel, enc)
+            try:
+                if p.stat().st_mtime >= stat_result.st_mtime:
+                    return enc, p
+            except OSError:
+                continue
+        return None
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        root = os.path.realpath(str(self.directory))
+        rel = os.path.relpath(os.path.realpath(str(full_path)), root).replace(os.sep, "/")
+
+        response: Response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        variant = self._pick_variant(rel, stat_result, request_headers) if status_code == 200 else None
+        if variant is not None:
+            enc, vpath = variant
+            # mismo media_type y ETag del original (sufijo por encoding)
+            etag = response.headers["etag"]
+            response = FileResponse(str(vpath), status_code=status_code, media_type=response.media_type)
+            response.headers["content-encoding"] = enc
+            response.headers["etag"] = etag[:-1] + "-" + enc + '"' if etag.endswith('"') else etag + "-" + enc
+
+        response.headers["cache-control"] = self._cache_control(rel)
+        if rel.split("/", 1)[0] in COMPRESSED_DIRS:
+            response.headers["vary"] = "Accept-Encoding"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
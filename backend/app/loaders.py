@@ -0,0 +1,95 @@
+"""Carga de planillas (openpyxl) fuera del event loop.
+
+Abrir un XLSX con openpyxl tarda de cientos de ms a varios segundos y, hecho
+dentro de un `async def`, frena todo el servidor (incluido /api/health). Acá:
+
+- `run(fn, *args)`: ejecuta el parseo en un pool de hilos acotado
+  (LOADER_THREADS).
+- `Reloadable`: valor derivado de un archivo (índice de concentradores,
+  significados, catálogo) que se recarga cuando cambia el mtime. La recarga
+  se hace una sola vez (single-flight) y, mientras tanto, los pedidos siguen
+  usando el valor anterior. Sólo la primera carga se espera.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_POOL: Dict[str, Any] = {"executor": None}
+
+
+def _executor() -> ThreadPoolExecutor:
+    if _POOL["executor"] is None:
+        _POOL["executor"] = ThreadPoolExecutor(
+            max_workers=max(1, get_settings().loader_threads), thread_name_prefix="loader"
+        )
+    return _POOL["executor"]
+
+
+async def run(fn: Callable[..., T], *args: Any) -> T:
+    """Corre `fn(*args)` (bloqueante: disco / openpyxl) en el pool de carga."""
+    return await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class Reloadable(Generic[T]):
+    """`build(path)` cacheado por mtime, con recarga única en segundo plano."""
+
+    def __init__(self, name: str, path_fn: Callable[[], str], build: Callable[[str], T]):
+        self.name = name
+        self.path_fn = path_fn
+        self.build = build
+        self.value: Optional[T] = None
+        self.key: Any = None
+        self._lock = threading.Lock()
+        self._inflight: Optional[asyncio.Future] = None
+
+    def _key(self) -> Any:
+        path = os.path.abspath(self.path_fn())
+        return path, _mtime(path)
+
+    def _load(self, key: Any) -> T:
+        # un solo build a la vez, venga del loop (pool) o de un endpoint sync
+        with self._lock:
+            if self.value is not None and self.key == key:
+                return self.value
+            value = self.build(key[0])
+            self.value, self.key = value, key
+            return value
+
+    def get_sync(self) -> T:
+        """Para código que ya corre fuera del loop (endpoints `def`, hilos)."""
+        key = self._key()
+        if self.value is not None and self.key == key:
+            return self.value
+        return self._load(key)
+
+    async def get(self) -> T:
+        """Valor vigente. Si el archivo cambió, dispara la recarga y devuelve el anterior."""
+        key = self._key()
+        if self.value is not None and self.key == key:
+            return self.value
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(run(self._load, key))
+            self._inflight.add_done_callback(self._log_failure)
+        if self.value is not None:
+            return self.value
+        return await asyncio.shield(self._inflight)
+
+    def _log_failure(self, fut: asyncio.Future) -> None:
+        if not fut.cancelled() and fut.exception() is not None and self.value is not None:
+            log.warning("Recarga de %s falló; se sigue usando la versión anterior: %s", self.name, fut.exception())
@@ -0,0 +1,210 @@
+"""Monitor del event loop: lag y bloqueos con su stack.
+
+Cuando "se congela todo" es porque algo corre dentro del loop sin ceder
+(openpyxl, un XML grande, disco). Para saber qué:
+
+- Latido: el loop se agenda a sí mismo cada LOOP_BEAT_S. El atraso de cada
+  latido es el lag del loop (métrica `event_loop_lag_s`, máximo por segundo).
+- Vigía: un hilo aparte mira el último latido. Si el loop lleva más de
+  LOOP_BLOCK_THRESHOLD_S sin latir, toma el stack del hilo del loop en ese
+  momento (qué está corriendo). Cuando el loop vuelve se registra el bloqueo
+  con su duración: métricas `event_loop_blocked` / `event_loop_block_s` por
+  lugar del código, GET /api/debug/loop y el log rotativo LOOP_LOG_PATH.
+
+Costo: un callback cada LOOP_BEAT_S en el loop y un hilo que duerme. La
+configuración se lee una vez en `start()` y el log lo escribe el vigía (el
+loop sólo encola), así el monitor no agrega trabajo al loop que mide.
+"""
+import asyncio
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from logging.handlers import RotatingFileHandler
+from typing import Any, Deque, Dict, List, Optional
+
+from app import metrics
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_STATE: Dict[str, Any] = {
+    "loop": None,
+    "thread_id": None,
+    "handle": None,
+    "watchdog": None,
+    "stop": None,
+    "last_beat": 0.0,
+    "lag_window_max": 0.0,
+    "lag_window_start": 0.0,
+    "lag_max": 0.0,
+    "lag_last": 0.0,
+    "beats": 0,
+    # LOOP_BEAT_S / LOOP_BLOCK_THRESHOLD_S, leídos en start()
+    "beat_s": 0.0,
+    "threshold_s": 0.0,
+    # stack capturado por el vigía durante el bloqueo en curso
+    "pending": None,
+}
+_LOCK = threading.Lock()
+_BLOCKS: Deque[Dict[str, Any]] = deque(maxlen=50)
+_BY_PLACE: Counter = Counter()
+_BLOCK_LOG: Dict[str, Any] = {"logger": None}
+# bloqueos para el log rotativo: los encola el loop, los escribe el vigía
+_LOG_QUEUE: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+
+
+def _block_logger() -> logging.Logger:
+    if _BLOCK_LOG["logger"] is None:
+        s = get_settings()
+        lg = logging.getLogger("app.loopmon.blocks")
+        lg.propagate = False
+        if s.loop_log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(s.loop_log_path)), exist_ok=True)
+            h = RotatingFileHandler(s.loop_log_path, maxBytes=s.loop_log_max_bytes, backupCount=s.loop_log_backups, encoding="utf-8")
+            h.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            lg.addHandler(h)
+            lg.setLevel(logging.INFO)
+        _BLOCK_LOG["logger"] = lg
+    return _BLOCK_LOG["logger"]
+
+
+def _place(stack: traceback.StackSummary) -> Dict[str, Optional[str]]:
+    """Frame más interno de la app (dónde mirar) y frame más interno en general (qué bloquea)."""
+    where = None
+    for fr in reversed(stack):
+        if fr.filename.startswith(_APP_DIR) and not fr.filename.endswith("loopmon.py"):
+            where = f"{os.path.relpath(fr.filename, os.path.dirname(_APP_DIR))}:{fr.lineno} {fr.name}"
+            break
+    inner = f"{os.path.basename(stack[-1].filename)}:{stack[-1].lineno} {stack[-1].name}" if stack else None
+    return {"where": where or inner, "inner": inner}
+
+
+def _capture() -> None:
+    """Vigía: el loop no late hace rato => foto del stack de su hilo (una por bloqueo)."""
+    frame = sys._current_frames().get(_STATE["thread_id"])
+    if frame is None:
+        return
+    stack = traceback.extract_stack(frame)
+    with _LOCK:
+        if _STATE["pending"] is None:
+            _STATE["pending"] = {"at": time.time(), "stack": stack}
+
+
+def _record_block(duration: float) -> None:
+    with _LOCK:
+        pending, _STATE["pending"] = _STATE["pending"], None
+    stack = pending["stack"] if pending else traceback.StackSummary()
+    place = _place(stack) if pending else {"where": "(sin stack)", "inner": None}
+    item = {
+        "at": time.time() - duration,
+        "duration_s": round(duration, 3),
+        "where": place["where"],
+        "inner": place["inner"],
+        "stack": [f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in stack][-25:],
+    }
+    with _LOCK:
+        _BLOCKS.append(item)
+        _BY_PLACE[place["where"]] += 1
+    metrics.incr("event_loop_blocked", where=place["where"])
+    metrics.observe("event_loop_block_s", duration, where=place["where"])
+    _LOG_QUEUE.put((duration, place, stack if pending else None))
+
+
+def _write_logs() -> None:
+    """Vigía: escribe en el log rotativo los bloqueos encolados por el loop."""
+    while True:
+        try:
+            duration, place, stack = _LOG_QUEUE.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            _block_logger().info(
+                "loop bloqueado %.3fs en %s (%s)\n%s", duration, place["where"], place["inner"], "".join(stack.format()) if stack else ""
+            )
+        except Exception:
+            log.exception("No se pudo escribir el log de bloqueos del loop")
+
+
+def _beat(expected: float) -> None:
+    beat_s = _STATE["beat_s"]
+    now = time.monotonic()
+    lag = max(0.0, now - expected)
+    _STATE["last_beat"] = now
+    _STATE["lag_last"] = lag
+    _STATE["beats"] += 1
+    _STATE["lag_max"] = max(_STATE["lag_max"], lag)
+    _STATE["lag_window_max"] = max(_STATE["lag_window_max"], lag)
+    if now - _STATE["lag_window_start"] >= 1.0:
+        metrics.observe("event_loop_lag_s", _STATE["lag_window_max"])
+        _STATE["lag_window_max"] = 0.0
+        _STATE["lag_window_start"] = now
+    if lag >= _STATE["threshold_s"]:
+        _record_block(lag)
+    else:
+        with _LOCK:
+            _STATE["pending"] = None
+    loop = _STATE["loop"]
+    if loop is not None:
+        _STATE["handle"] = loop.call_at(now + beat_s, _beat, now + beat_s)
+
+
+def _watchdog(stop: threading.Event, beat_s: float, threshold_s: float) -> None:
+    period = min(beat_s, threshold_s / 2)
+    while not stop.wait(period):
+        since = time.monotonic() - _STATE["last_beat"]
+        # el latido debía llegar hace `since - beat`: eso es lo que lleva bloqueado
+        if since - beat_s >= threshold_s:
+            _capture()
+        _write_logs()
+    _write_logs()
+
+
+def start() -> None:
+    s = get_settings()
+    if not s.loop_monitor or _STATE["loop"] is not None:
+        return
+    loop = asyncio.get_running_loop()
+    now = time.monotonic()
+    beat_s, threshold_s = s.loop_beat_s, s.loop_block_threshold_s
+    _STATE.update(
+        loop=loop, thread_id=threading.get_ident(), last_beat=now, lag_window_start=now, pending=None,
+        beat_s=beat_s, threshold_s=threshold_s,
+    )
+    _STATE["handle"] = loop.call_at(now + beat_s, _beat, now + beat_s)
+    stop = threading.Event()
+    t = threading.Thread(target=_watchdog, args=(stop, beat_s, threshold_s), name="loop-watchdog", daemon=True)
+    _STATE.update(stop=stop, watchdog=t)
+    t.start()
+
+
+def stop() -> None:
+    handle, stop_ev = _STATE["handle"], _STATE["stop"]
+    _STATE.update(loop=None, handle=None, stop=None, watchdog=None)
+    if handle is not None:
+        handle.cancel()
+    if stop_ev is not None:
+        stop_ev.set()
+
+
+def snapshot() -> Dict[str, Any]:
+    s = get_settings()
+    with _LOCK:
+        blocks: List[Dict[str, Any]] = list(_BLOCKS)
+        top = _BY_PLACE.most_common(20)
+    return {
+        "enabled": _STATE["loop"] is not None,
+        "beat_s": s.loop_beat_s,
+        "threshold_s": s.loop_block_threshold_s,
+        "lag_last_s": round(_STATE["lag_last"], 4),
+        "lag_max_s": round(_STATE["lag_max"], 4),
+        "beats": _STATE["beats"],
+        "blocks_by_place": [{"where": w, "count": n} for w, n in top],
+        "recent_blocks": list(reversed(blocks)),
+    }
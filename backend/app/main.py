@@ -1,37 +1,90 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
 
+from app import campaigns, decode, gede_tokens, loopmon, metrics, order_journal, prefetch
 from app.config import get_settings
-from app.significados import load_significados
+from app.http_cache import CachedStaticFiles, cached_json, etag_for_values
+from app.significados import load_significados, significados_etag
 from app.routers.auth import router as auth_router
+from app.routers.campaigns import router as campaigns_router
+from app.routers.geo import router as geo_router
+from app.routers.live import router as live_router
 from app.routers.meters import router as meters_router
+from app.routers.orders import router as orders_router
 from app.routers.tecnica import router as tecnica_router
 
-app = FastAPI(title="GEDE Web Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tareas de fondo: scheduler de campañas (retoma corridas interrumpidas),
+    # cierre de sesiones GEDE ociosas, grabación por lotes de la bitácora de órdenes
+    # y monitor de bloqueos del loop
+    loopmon.start()
+    campaigns.start_scheduler()
+    gede_tokens.start_reaper()
+    order_journal.start_writer()
+    try:
+        yield
+    finally:
+        await campaigns.stop_scheduler()
+        await gede_tokens.stop_reaper()
+        await order_journal.stop_writer()
+        await prefetch.shutdown()
+        decode.shutdown()
+        loopmon.stop()
+
+
+app = FastAPI(title="GEDE Web Backend", lifespan=lifespan)
 
 # 1) API routers primero (IMPORTANTE: antes de montar el frontend estático)
 app.include_router(auth_router)
 app.include_router(meters_router)
 app.include_router(tecnica_router)
+app.include_router(campaigns_router)
+app.include_router(geo_router)
+app.include_router(orders_router)
+app.include_router(live_router)
 
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+def get_metrics():
+    # Contadores del proceso (pedidos cancelados por desconexión, etc.)
+    return metrics.snapshot()
+
+@app.get("/api/debug/loop")
+def debug_loop():
+    # Lag del event loop y bloqueos recientes con su stack (app.loopmon)
+    return loopmon.snapshot()
+
 @app.get("/api/config")
-def config():
+def config(request: Request):
     s = get_settings()
-    return {"appTitle": s.app_title, "appSubtitle": s.app_subtitle}
+    data = {"appTitle": s.app_title, "appSubtitle": s.app_subtitle}
+    return cached_json(request, data, etag_for_values(data))
 
 @app.get("/api/significados")
-def significados():
-    # Devuelve mapping {codigo: significado}
-    return load_significados()
+def significados(request: Request):
+    # Devuelve mapping {codigo: significado} (ETag por mtime + hash; 304 si no cambió)
+    mapping = load_significados()
+    return cached_json(request, mapping, significados_etag())
 
 
 # 2) Frontend estático (último para no interceptar POST /api/*)
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 FRONTEND_DIR = PROJECT_ROOT / "frontend" / "static"
-app.mount("/", StaticFiles(directory=str(FRONTEND_DIR), html=True), name="static")
+_s = get_settings()
+app.mount(
+    "/",
+    CachedStaticFiles(
+        directory=str(FRONTEND_DIR),
+        html=True,
+        cache_dir=_s.static_cache_dir,
+        vendor_max_age=_s.static_vendor_max_age,
+    ),
+    name="static",
+)
@@ -0,0 +1,116 @@
+"""Índice compacto medidor <-> concentrador (desde concentradores.xlsx).
+
+En lugar de dicts de ints de Python se usan columnas `array('q')`:
+
+  meters[i] / concs[i]   ordenado por medidor -> búsqueda binaria
+  conc_ids[j]            concentradores ordenados
+  offsets[j]:offsets[j+1] rango en `by_conc` (estilo CSR) con los medidores
+                         de conc_ids[j], ordenados
+
+Si NumPy está instalado, la resolución masiva usa `searchsorted` (una sola
+búsqueda vectorizada); si no, `bisect` por medidor.
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:  # opcional
+    import numpy as _np  # type: ignore
+except Exception:  # pragma: no cover
+    _np = None
+
+
+class MeterIndex:
+    __slots__ = ("meters", "concs", "conc_ids", "offsets", "by_conc", "conc_to_ip")
+
+    def __init__(self, meters: array, concs: array, conc_ids: array, offsets: array, by_conc: array, conc_to_ip: Dict[int, str]):
+        self.meters = meters
+        self.concs = concs
+        self.conc_ids = conc_ids
+        self.offsets = offsets
+        self.by_conc = by_conc
+        self.conc_to_ip = conc_to_ip
+
+    @classmethod
+    def empty(cls) -> "MeterIndex":
+        return cls(array("q"), array("q"), array("q"), array("q", [0]), array("q"), {})
+
+    @classmethod
+    def build(cls, pairs: Dict[int, int], conc_to_ip: Dict[int, str]) -> "MeterIndex":
+        """`pairs`: {medidor: concentrador} (el último visto gana, como antes)."""
+        items = sorted(pairs.items())
+        meters = array("q", (m for m, _ in items))
+        concs = array("q", (c for _, c in items))
+
+        # CSR: agrupar por concentrador (items ya viene ordenado por medidor).
+        # Los concentradores con IP pero sin medidores también se listan.
+        groups: Dict[int, List[int]] = {c: [] for c in conc_to_ip}
+        for m, c in items:
+            groups.setdefault(c, []).append(m)
+        conc_ids = array("q")
+        offsets = array("q", [0])
+        by_conc = array("q")
+        for c in sorted(groups):
+            conc_ids.append(c)
+            by_conc.extend(groups[c])
+            offsets.append(len(by_conc))
+        return cls(meters, concs, conc_ids, offsets, by_conc, dict(conc_to_ip))
+
+    def __len__(self) -> int:
+        return len(self.meters)
+
+    # --- medidor -> concentrador ---
+    def conc_for(self, meter_id: int) -> Optional[int]:
+        i = bisect_left(self.meters, meter_id)
+        if i < len(self.meters) and self.meters[i] == meter_id:
+            return self.concs[i]
+        return None
+
+    def resolve_many(self, meter_ids: Iterable[int]) -> List[Optional[int]]:
+        ids = list(meter_ids)
+        if not ids or not len(self.meters):
+            return [None] * len(ids)
+        if _np is not None:
+            keys = _np.frombuffer(self.meters, dtype=_np.int64)
+            vals = _np.frombuffer(self.concs, dtype=_np.int64)
+            q = _np.asarray(ids, dtype=_np.int64)
+            pos = _np.searchsorted(keys, q)
+            pos_c = _np.minimum(pos, len(keys) - 1)
+            found = keys[pos_c] == q
+            out = vals[pos_c]
+            return [int(c) if f else None for c, f in zip(out.tolist(), found.tolist())]
+        return [self.conc_for(m) for m in ids]
+
+    def items(self) -> Iterable[Tuple[int, int]]:
+        return zip(self.meters, self.concs)
+
+    # --- concentrador -> medidores (CSR) ---
+    def _conc_pos(self, conc_id: int) -> Optional[int]:
+        j = bisect_left(self.conc_ids, conc_id)
+        if j < len(self.conc_ids) and self.conc_ids[j] == conc_id:
+            return j
+        return None
+
+    def meters_of(self, conc_id: int, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        j = self._conc_pos(conc_id)
+        if j is None:
+            return []
+        a, b = self.offsets[j], self.offsets[j + 1]
+        a = min(b, a + max(0, offset))
+        if limit is not None:
+            b = min(b, a + max(0, limit))
+        return list(self.by_conc[a:b])
+
+    def meter_count(self, conc_id: int) -> int:
+        j = self._conc_pos(conc_id)
+        return 0 if j is None else self.offsets[j + 1] - self.offsets[j]
+
+    def concentrators(self) -> List[Tuple[int, Optional[str], int]]:
+        """[(conc_id, ip, cantidad_medidores)]"""
+        return [
+            (c, self.conc_to_ip.get(c), self.offsets[j + 1] - self.offsets[j])
+            for j, c in enumerate(self.conc_ids)
+        ]
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.meters, self.concs, self.conc_ids, self.offsets, self.by_conc))
@@ -0,0 +1,118 @@
+"""Último estado conocido (S01) por medidor, en memoria del proceso.
+
+Cada S01 que pasa por /api/meters (lectura, B03 individual y masivo) deja acá
+la fila decodificada (Eacti, tensiones, etc.) con su hora. Con eso:
+
+- GET /api/meters/state/{medidor} responde al instante con el estado y su
+  antigüedad; si está más viejo que max_age_s lo refresca en segundo plano
+  (stale-while-revalidate) y la respuesta lo indica con "refreshing".
+- GET /api/meters/concentrators/state resume conectados/desconectados por
+  concentrador sin consultar ningún equipo.
+
+Acotado a METER_STATE_MAX medidores (se desalojan los menos recientes).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+class MeterStateStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # medidor -> (hora, conc_id, fila S01, origen); orden = actualización (más viejo al principio)
+        self._data: "OrderedDict[int, Tuple[float, Optional[int], Dict[str, Any], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, meter: int, conc_id: Optional[int], row: Dict[str, Any], source: str, merge: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            if merge and meter in self._data:
+                row = {**self._data[meter][2], **row}
+            self._data[meter] = (now, conc_id, row, source)
+            self._data.move_to_end(meter)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, meter: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._data.get(meter)
+        if hit is None:
+            return None
+        return _entry(meter, hit)
+
+    def items(self) -> List[Tuple[int, Tuple[float, Optional[int], Dict[str, Any], str]]]:
+        with self._lock:
+            return list(self._data.items())
+
+    def count(self) -> int:
+        return len(self._data)
+
+
+def _entry(meter: int, hit: Tuple[float, Optional[int], Dict[str, Any], str]) -> Dict[str, Any]:
+    ts, conc_id, row, source = hit
+    return {
+        "meter": meter,
+        "conc_id": conc_id,
+        "eacti": eacti_of(row),
+        "updated_at": ts,
+        "age_s": round(time.time() - ts, 1),
+        "source": source,
+        "row": row,
+    }
+
+
+_STORE: Dict[str, Any] = {"store": None}
+
+
+def store() -> MeterStateStore:
+    if _STORE["store"] is None:
+        _STORE["store"] = MeterStateStore(max(1, get_settings().meter_state_max))
+    return _STORE["store"]
+
+
+def eacti_of(row: Dict[str, Any]) -> Optional[Any]:
+    if "Eacti" in row:
+        return row["Eacti"]
+    for k, v in row.items():
+        if k.lower().endswith("eacti"):
+            return v
+    return None
+
+
+def remember(meter: int, conc_id: Optional[int], row: Dict[str, Any], source: str, merge: bool = False) -> None:
+    """Guarda la fila S01 de un medidor (merge=True: fila parcial, conserva los demás campos)."""
+    store().put(meter, conc_id, dict(row), source, merge=merge)
+
+
+def remember_eacti(meter: int, conc_id: Optional[int], eacti: Any, source: str) -> None:
+    """Sólo el relé (p.ej. cuando no se pudo decodificar la fila entera); conserva el resto."""
+    store().put(meter, conc_id, {"Eacti": eacti}, source, merge=True)
+
+
+def get(meter: int) -> Optional[Dict[str, Any]]:
+    return store().get(meter)
+
+
+def summary(conc_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Por concentrador: conectados (Eacti=1), desconectados (Eacti=0), sin dato y antigüedad."""
+    now = time.time()
+    out: Dict[Optional[int], Dict[str, Any]] = {}
+    for _, (ts, cid, row, _) in store().items():
+        if conc_id is not None and cid != conc_id:
+            continue
+        s = out.setdefault(cid, {"conc_id": cid, "meters": 0, "connected": 0, "disconnected": 0, "unknown": 0, "oldest_s": 0.0, "newest_s": None})
+        s["meters"] += 1
+        e = str(eacti_of(row))
+        if e == "1":
+            s["connected"] += 1
+        elif e == "0":
+            s["disconnected"] += 1
+        else:
+            s["unknown"] += 1
+        age = round(now - ts, 1)
+        s["oldest_s"] = max(s["oldest_s"], age)
+        s["newest_s"] = age if s["newest_s"] is None else min(s["newest_s"], age)
+    return sorted(out.values(), key=lambda s: -s["meters"])
@@ -0,0 +1,46 @@
+"""Métricas simples en memoria (por proceso), expuestas en GET /api/metrics.
+
+    metrics.incr("client_disconnect", endpoint="report")
+    metrics.observe("client_disconnect_elapsed_s", 12.3, endpoint="report")
+
+Con varios workers cada proceso tiene las suyas (el JSON incluye el pid).
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[_Key, float] = {}
+# (cantidad, suma, máximo)
+_SUMMARIES: Dict[_Key, Tuple[int, float, float]] = {}
+_STARTED = time.time()
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[k] = _COUNTERS.get(k, 0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _LOCK:
+        n, total, mx = _SUMMARIES.get(k, (0, 0.0, 0.0))
+        _SUMMARIES[k] = (n + 1, total + value, max(mx, value))
+
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        counters = [{"name": k[0], "labels": dict(k[1]), "value": v} for k, v in sorted(_COUNTERS.items())]
+        summaries = [
+            {"name": k[0], "labels": dict(k[1]), "count": n, "sum": round(total, 6), "max": round(mx, 6)}
+            for k, (n, total, mx) in sorted(_SUMMARIES.items())
+        ]
+    return {"pid": os.getpid(), "uptime_s": round(time.time() - _STARTED, 1), "counters": counters, "summaries": summaries}
@@ -0,0 +1,221 @@
+"""Bitácora de órdenes B03 (corte/reconexión) en SQLite.
+
+Cada orden enviada por /api/meters/order y /order_massive deja una fila:
+medidor, concentrador, acción, cuándo, qué respondió el concentrador, el Eacti
+confirmado por el S01 posterior y las latencias.
+
+- Sólo se agregan filas (append-only).
+- Escritura por lotes: `record()` encola en memoria y una tarea de fondo
+  graba cada ORDER_JOURNAL_FLUSH_S o al juntar ORDER_JOURNAL_BATCH filas
+  (un solo INSERT ... executemany por lote, en un hilo).
+- Índices por medidor+fecha, concentrador+fecha y fecha: "última acción sobre
+  este medidor" o "cortes del concentrador X ayer" no recorren la tabla.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+_COLUMNS = (
+    "ts", "meter", "conc_id", "ip", "order_type", "action", "order_value", "source", "user",
+    "id_pet", "fini", "ffin", "status_code", "ok", "error", "eacti", "latency_ms", "confirm_ms", "total_ms",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    meter INTEGER NOT NULL,
+    conc_id INTEGER,
+    ip TEXT,
+    order_type TEXT NOT NULL,
+    action TEXT,
+    order_value INTEGER,
+    source TEXT,
+    user TEXT,
+    id_pet INTEGER,
+    fini TEXT,
+    ffin TEXT,
+    status_code INTEGER,
+    ok INTEGER NOT NULL,
+    error TEXT,
+    eacti TEXT,
+    latency_ms REAL,
+    confirm_ms REAL,
+    total_ms REAL
+);
+CREATE INDEX IF NOT EXISTS ix_orders_meter_ts ON orders (meter, ts);
+CREATE INDEX IF NOT EXISTS ix_orders_conc_ts ON orders (conc_id, ts);
+CREATE INDEX IF NOT EXISTS ix_orders_ts ON orders (ts);
+"""
+
+_DB: Dict[str, Any] = {"conn": None, "path": None}
+_DB_LOCK = threading.Lock()
+_BUFFER: List[tuple] = []
+_WRITER: Dict[str, Any] = {"task": None, "wake": None}
+
+
+def _db() -> sqlite3.Connection:
+    path = get_settings().order_journal_db_path
+    if _DB["conn"] is None or _DB["path"] != path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _DB["conn"] = conn
+        _DB["path"] = path
+    return _DB["conn"]
+
+
+def _write(rows: List[tuple]) -> None:
+    sql = f"INSERT INTO orders ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})"
+    with _DB_LOCK:
+        conn = _db()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def record(entry: Dict[str, Any]) -> None:
+    """Encola una orden para la bitácora (no bloquea)."""
+    row = dict(entry)
+    row.setdefault("ts", time.time())
+    row.setdefault("order_type", "B03")
+    row["ok"] = 1 if row.get("ok") else 0
+    if row.get("eacti") is not None:
+        row["eacti"] = str(row["eacti"])
+    _BUFFER.append(tuple(row.get(c) for c in _COLUMNS))
+    wake = _WRITER["wake"]
+    if wake is not None and len(_BUFFER) >= get_settings().order_journal_batch:
+        wake.set()
+
+
+async def flush() -> int:
+    """Graba lo pendiente. Devuelve cuántas filas escribió."""
+    if not _BUFFER:
+        return 0
+    rows = _BUFFER[:]
+    del _BUFFER[:len(rows)]
+    try:
+        await asyncio.to_thread(_write, rows)
+    except Exception:
+        # se reintenta en el próximo ciclo (conserva el orden)
+        _BUFFER[:0] = rows
+        raise
+    return len(rows)
+
+
+async def _writer_loop() -> None:
+    wake: asyncio.Event = _WRITER["wake"]
+    while True:
+        try:
+            await asyncio.wait_for(wake.wait(), timeout=get_settings().order_journal_flush_s)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+        try:
+            await flush()
+        except Exception:
+            log.exception("No se pudo grabar la bitácora de órdenes")
+
+
+def start_writer() -> None:
+    if _WRITER["task"] is None:
+        _WRITER["wake"] = asyncio.Event()
+        _WRITER["task"] = asyncio.get_running_loop().create_task(_writer_loop())
+
+
+async def stop_writer() -> None:
+    task = _WRITER["task"]
+    _WRITER["task"] = None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    try:
+        await flush()
+    except Exception:
+        log.exception("No se pudo grabar la bitácora de órdenes al cerrar")
+    _WRITER["wake"] = None
+
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+def _query(sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+    with _DB_LOCK:
+        return [dict(r) for r in _db().execute(sql, params).fetchall()]
+
+
+def last_for_meter(meter: int) -> Optional[Dict[str, Any]]:
+    rows = _query("SELECT * FROM orders WHERE meter = ? ORDER BY ts DESC LIMIT 1", (meter,))
+    return rows[0] if rows else None
+
+
+def search(
+    meter: Optional[int] = None,
+    conc_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    ok: Optional[bool] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    where, params = [], []
+    if meter is not None:
+        where.append("meter = ?")
+        params.append(meter)
+    if conc_id is not None:
+        where.append("conc_id = ?")
+        params.append(conc_id)
+    if since is not None:
+        where.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("ts < ?")
+        params.append(until)
+    if action:
+        where.append("action = ?")
+        params.append(action)
+    if ok is not None:
+        where.append("ok = ?")
+        params.append(1 if ok else 0)
+    sql = "SELECT * FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts DESC LIMIT ? OFFSET ?"
+    return _query(sql, (*params, limit, offset))
+
+
+def latency_stats(since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Por concentrador: cantidad, % ok y latencias (insumo para ajustar lotes/concurrencia)."""
+    where, params = [], []
+    if since is not None:
+        where.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("ts < ?")
+        params.append(until)
+    sql = (
+        "SELECT conc_id, COUNT(*) AS orders, SUM(ok) AS ok, "
+        "AVG(latency_ms) AS avg_latency_ms, MAX(latency_ms) AS max_latency_ms, "
+        "AVG(confirm_ms) AS avg_confirm_ms, AVG(total_ms) AS avg_total_ms "
+        "FROM orders"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY conc_id ORDER BY orders DESC"
+    return _query(sql, tuple(params))
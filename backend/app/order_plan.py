@@ -0,0 +1,185 @@
+"""Planificación de órdenes B03 masivas (corrida en seco).
+
+Antes de lanzar /order_massive con miles de medidores conviene saber cuánto
+va a tardar y si entra en la ventana de mantenimiento. `build`:
+
+- resuelve cada medidor a su concentrador (concentradores.xlsx) y separa los
+  desconocidos;
+- estima el tiempo por orden de cada concentrador con la bitácora
+  (`order_journal.latency_stats`, promedio de total_ms de los últimos
+  ORDER_PLAN_HISTORY_DAYS). Sin historial suficiente usa el promedio general
+  y, si no hay nada, DEFAULT_ORDER_S;
+- reparte los concentradores en `parallel` carriles (cada carril atiende un
+  concentrador por vez, en secuencia, como hasta ahora): el de más trabajo
+  primero al carril menos cargado (LPT). La duración estimada es la del
+  carril más largo.
+
+El plan queda guardado ORDER_PLAN_TTL_S (en memoria del proceso) y se ejecuta
+tal cual con POST /api/meters/order_massive/plan/{plan_id}/run: mismos
+medidores, mismos carriles, mismo orden. Se ejecuta una sola vez.
+"""
+import heapq
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.meter_index import MeterIndex
+
+# Segundos por orden cuando no hay historial (B03 + espera 1,5 s + S01)
+DEFAULT_ORDER_S = 6.0
+# Órdenes registradas mínimas para confiar en el promedio de un concentrador
+MIN_SAMPLES = 3
+# Planes guardados a la vez (se descartan los más viejos)
+MAX_PLANS = 20
+
+
+def _per_order(stats: List[Dict[str, Any]]) -> Tuple[Dict[int, Dict[str, Any]], float]:
+    """Segundos por orden por concentrador (con historial suficiente) y el promedio general."""
+    by_conc: Dict[int, Dict[str, Any]] = {}
+    total_ms, total_n = 0.0, 0
+    for st in stats:
+        n = int(st.get("orders") or 0)
+        avg = st.get("avg_total_ms")
+        if st.get("conc_id") is None or not n or avg is None:
+            continue
+        total_ms += float(avg) * n
+        total_n += n
+        if n >= MIN_SAMPLES:
+            by_conc[int(st["conc_id"])] = {
+                "per_order_s": float(avg) / 1000,
+                "samples": n,
+                "ok_pct": round(100.0 * int(st.get("ok") or 0) / n, 1),
+            }
+    overall = total_ms / total_n / 1000 if total_n else DEFAULT_ORDER_S
+    return by_conc, overall
+
+
+def _window_s(window: Optional[str]) -> Optional[int]:
+    """Duración de una ventana 'HH:MM-HH:MM' (puede cruzar medianoche)."""
+    if not window:
+        return None
+    try:
+        a, b = (int(h) * 60 + int(m) for h, m in (p.strip().split(":", 1) for p in window.split("-", 1)))
+    except ValueError:
+        raise ValueError(f"Ventana inválida (se espera HH:MM-HH:MM): {window!r}")
+    return ((b - a) % (24 * 60) or 24 * 60) * 60
+
+
+def build(
+    meters: List[int],
+    index: MeterIndex,
+    stats: List[Dict[str, Any]],
+    parallel: int,
+    window: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Plan para `meters` (ya deduplicados, en el orden subido). Ver docstring del módulo."""
+    known: "OrderedDict[int, List[int]]" = OrderedDict()
+    unknown: List[int] = []
+    for mid, conc_id in zip(meters, index.resolve_many(meters)):
+        if not conc_id or not index.conc_to_ip.get(conc_id):
+            unknown.append(mid)
+        else:
+            known.setdefault(conc_id, []).append(mid)
+
+    by_conc, overall = _per_order(stats)
+    concs: List[Dict[str, Any]] = []
+    for conc_id, mids in known.items():
+        hist = by_conc.get(conc_id)
+        per = hist["per_order_s"] if hist else overall
+        concs.append({
+            "conc_id": conc_id,
+            "ip": index.conc_to_ip.get(conc_id),
+            "meters": len(mids),
+            "per_order_s": round(per, 2),
+            "est_s": round(per * len(mids), 1),
+            "samples": hist["samples"] if hist else 0,
+            "ok_pct": hist["ok_pct"] if hist else None,
+            "estimate": "historial" if hist else ("promedio" if stats else "defecto"),
+        })
+
+    # LPT: concentradores de más trabajo primero, cada uno al carril menos cargado
+    lanes_n = max(1, min(parallel, len(concs) or 1))
+    heap = [(0.0, w) for w in range(lanes_n)]
+    lanes: List[List[int]] = [[] for _ in range(lanes_n)]
+    for c in sorted(concs, key=lambda c: -c["est_s"]):
+        load, w = heapq.heappop(heap)
+        c["lane"] = w
+        lanes[w].append(c["conc_id"])
+        heapq.heappush(heap, (load + c["est_s"], w))
+
+    est = {c["conc_id"]: c["est_s"] for c in concs}
+    lane_info = [
+        {"lane": w, "concentrators": ids, "meters": sum(len(known[i]) for i in ids), "est_s": round(sum(est[i] for i in ids), 1)}
+        for w, ids in enumerate(lanes)
+    ]
+    est_s = max((l["est_s"] for l in lane_info), default=0.0)
+    win_s = _window_s(window)
+    return {
+        "total": len(meters),
+        "known": len(meters) - len(unknown),
+        "unknown_count": len(unknown),
+        "unknown": unknown,
+        "parallel": lanes_n,
+        "per_order_default_s": round(overall, 2),
+        "history_days": get_settings().order_plan_history_days,
+        "est_s": est_s,
+        "est_sequential_s": round(sum(est.values()), 1),
+        "window": window or None,
+        "fits_window": None if win_s is None else est_s <= win_s,
+        "concentrators": concs,
+        "lanes": lane_info,
+        # medidores por carril, en orden de ejecución (no se devuelve: puede ser enorme)
+        "_lanes": [[mid for i in ids for mid in known[i]] for ids in lanes],
+    }
+
+
+class PlanStore:
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # plan_id -> (vence, plan); orden = creación
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, plan: Dict[str, Any]) -> str:
+        plan_id = secrets.token_urlsafe(9)
+        now = time.time()
+        with self._lock:
+            for k in [k for k, (exp, _) in self._data.items() if exp <= now]:
+                self._data.pop(k, None)
+            self._data[plan_id] = (now + self.ttl_s, plan)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return plan_id
+
+    def get(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._data.get(plan_id)
+        if hit is None or hit[0] <= time.time():
+            return None
+        return hit[1]
+
+    def take(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """Saca el plan para ejecutarlo (una sola vez)."""
+        with self._lock:
+            hit = self._data.pop(plan_id, None)
+        if hit is None or hit[0] <= time.time():
+            return None
+        return hit[1]
+
+
+_STORE: Dict[str, Any] = {"store": None}
+
+
+def store() -> PlanStore:
+    if _STORE["store"] is None:
+        _STORE["store"] = PlanStore(get_settings().order_plan_ttl_s, MAX_PLANS)
+    return _STORE["store"]
+
+
+def public(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan para responder (sin las listas internas de medidores)."""
+    return {k: v for k, v in plan.items() if not k.startswith("_")}
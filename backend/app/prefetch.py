@@ -0,0 +1,153 @@
+"""Prelectura del S01 a partir de /api/tecnica/lookup.
+
+Casi siempre, después de encontrar un cliente en Facturacion el técnico pide
+el S01 de su medidor. Si la búsqueda dio un único resultado, se lanza esa
+lectura en segundo plano y el clic encuentra el resultado listo (o en vuelo):
+
+- va por el carril BACKGROUND de app.dispatch y sólo si el concentrador está
+  libre (sin interactivos esperando) y con menos de PREFETCH_PER_CONC
+  prelecturas en curso: nunca compite con pedidos de usuarios;
+- el resultado queda PREFETCH_TTL_S segundos y se usa una sola vez
+  (`join` desde /api/meters/report S01); si la prelectura sigue en vuelo, el
+  /report la espera en vez de abrir otra sesión;
+- una nueva búsqueda del mismo usuario cancela su prelectura anterior; al
+  apagar el servidor se cancelan todas;
+- una orden B03 al medidor (`invalidate`) descarta su resultado y cancela la
+  prelectura en vuelo: el relé pudo cambiar.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+
+from app import budget, dispatch, metrics
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+# Tope de resultados guardados (se desalojan los más viejos)
+MAX_CACHED = 1000
+
+# medidor -> (vence, resultado de _read_meter_report)
+_CACHE: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+# medidor -> prelectura en curso
+_TASKS: Dict[int, asyncio.Task] = {}
+# usuario -> medidor de su última prelectura
+_BY_USER: Dict[str, int] = {}
+# IP del concentrador -> prelecturas hablando con él
+_PER_CONC: Counter = Counter()
+
+
+def _purge(now: float) -> None:
+    for k in [k for k, (exp, _) in _CACHE.items() if exp <= now]:
+        _CACHE.pop(k, None)
+
+
+def _cancel(meter_id_int: int) -> None:
+    task = _TASKS.get(meter_id_int)
+    if task is not None and not task.done():
+        task.cancel()
+        metrics.incr("prefetch", outcome="cancelled")
+
+
+async def _run(meter: str, meter_id_int: int, user: str) -> None:
+    from app.routers import meters as m
+
+    _, ip = m._resolve_conc_and_ip_for_meter(meter_id_int, await m._meter_index_async())
+    if _PER_CONC[ip] >= max(1, get_settings().prefetch_per_conc) or dispatch.busy(ip):
+        metrics.incr("prefetch", outcome="skipped_busy")
+        return
+    _PER_CONC[ip] += 1
+    try:
+        with budget.scope(budget.start("S01")):
+            res = await m._read_meter_report(meter, "S01", user=user, lane=dispatch.BACKGROUND)
+    finally:
+        _PER_CONC[ip] -= 1
+        if _PER_CONC[ip] <= 0:
+            del _PER_CONC[ip]
+    now = time.monotonic()
+    _purge(now)
+    _CACHE[meter_id_int] = (now + get_settings().prefetch_ttl_s, res)
+    while len(_CACHE) > MAX_CACHED:
+        _CACHE.popitem(last=False)
+    metrics.incr("prefetch", outcome="done")
+
+
+async def schedule(meter: Any, request: Request) -> bool:
+    """Lanza la prelectura S01 de `meter` (celda Medidor de Facturacion). True si quedó agendada."""
+    from app.routers import meters as m
+
+    if not get_settings().prefetch_s01:
+        return False
+    # celda de Excel: 142414721.0 => 142414721
+    meter_id_int = m._parse_meter_cell(meter)
+    if meter_id_int is None:
+        return False
+    user = await m._client_key(request)
+
+    prev = _BY_USER.get(user)
+    if prev is not None and prev != meter_id_int:
+        _cancel(prev)
+    _BY_USER[user] = meter_id_int
+
+    hit = _CACHE.get(meter_id_int)
+    if hit is not None and hit[0] > time.monotonic():
+        return True
+    task = _TASKS.get(meter_id_int)
+    if task is not None and not task.done():
+        return True
+
+    task = asyncio.get_running_loop().create_task(_run(str(meter_id_int), meter_id_int, user))
+    _TASKS[meter_id_int] = task
+    metrics.incr("prefetch", outcome="scheduled")
+
+    def _done(t: asyncio.Task) -> None:
+        if _TASKS.get(meter_id_int) is t:
+            _TASKS.pop(meter_id_int, None)
+        if _BY_USER.get(user) == meter_id_int:
+            _BY_USER.pop(user, None)
+        if not t.cancelled() and t.exception() is not None:
+            metrics.incr("prefetch", outcome="error")
+            log.info("Prelectura S01 de %s falló: %s", meter_id_int, getattr(t.exception(), "detail", t.exception()))
+
+    task.add_done_callback(_done)
+    return True
+
+
+def take(meter_id_int: int) -> Optional[Dict[str, Any]]:
+    """Resultado prelecturado vigente (se consume: un clic, una respuesta)."""
+    hit = _CACHE.pop(meter_id_int, None)
+    if hit is None or hit[0] <= time.monotonic():
+        return None
+    metrics.incr("prefetch", outcome="hit")
+    return hit[1]
+
+
+def invalidate(meter_id_int: int) -> None:
+    """El medidor recibió (o está recibiendo) una B03: lo prelecturado ya no vale."""
+    if _CACHE.pop(meter_id_int, None) is not None:
+        metrics.incr("prefetch", outcome="invalidated")
+    _cancel(meter_id_int)
+
+
+async def join(meter_id_int: int) -> Optional[Dict[str, Any]]:
+    """Como `take`, pero si la prelectura está en vuelo la espera. None = leer como siempre."""
+    task = _TASKS.get(meter_id_int)
+    if task is not None and not task.done():
+        # wait (no shield): si este pedido se cancela, la prelectura sigue; si ella falla, no propaga
+        await asyncio.wait({task})
+    return take(meter_id_int)
+
+
+async def shutdown() -> None:
+    tasks = [t for t in _TASKS.values() if not t.done()]
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _TASKS.clear()
+    _BY_USER.clear()
+    _CACHE.clear()
+
@@ -0,0 +1,148 @@
+"""Resultados de lecturas guardados por cursor para paginar en el servidor.
+
+Una curva de carga anual son decenas de miles de filas: mandarlas todas de una
+vez pesa varios MB y el navegador se traba armando la tabla. Con `page_size`,
+/api/meters/report guarda las filas acá y devuelve un cursor con la primera
+página; el resto se pide con GET /api/meters/report/{cursor} (orden por
+columna y filtro opcionales).
+
+- En memoria del proceso, con TTL (RESULT_TTL_S, se renueva con cada uso) y
+  tope de resultados (RESULT_MAX, se desalojan los menos usados).
+- Las filas se guardan como `app.table.Table` (por columna) y sólo se
+  materializan las de la página pedida.
+- Cada cursor recuerda las últimas vistas ordenadas/filtradas, así recorrer
+  páginas no vuelve a ordenar todo.
+- Con varios workers el cursor sólo existe en el worker que hizo la lectura
+  (igual que /api/metrics); si no está, 404 y la página vuelve a leer.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.table import Table
+
+# Vistas (orden + filtro) recordadas por cursor
+MAX_VIEWS = 4
+
+_ViewKey = Tuple[Optional[str], bool, str, Optional[str]]
+
+
+class Result:
+    def __init__(self, table: Table, meta: Dict[str, Any], raw: Optional[str]):
+        self.table = table
+        self.cols = list(table.cols)
+        self.meta = meta
+        self.raw = raw
+        self.created = time.time()
+        # (sort, desc, q, col) -> índices de filas
+        self._views: "OrderedDict[_ViewKey, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def view(self, sort: Optional[str], desc: bool, q: str, col: Optional[str]) -> List[int]:
+        key = (sort, desc, q.lower(), col)
+        with self._lock:
+            idx = self._views.get(key)
+            if idx is not None:
+                self._views.move_to_end(key)
+                return idx
+        t = self.table
+        idx = list(range(len(t)))
+        if q:
+            needle = q.lower()
+            cols = [col] if col else self.cols
+            # columnas constantes: se evalúan una vez (si coinciden, coinciden todas las filas)
+            if not any(c in t.consts and needle in _text(t.consts[c]) for c in cols):
+                texts = [[_text(v) for v in t.column(c)] for c in cols if c not in t.consts]
+                idx = [i for i in idx if any(needle in tx[i] for tx in texts)]
+        if sort:
+            vals = t.column(sort)
+            present = [i for i in idx if vals[i] not in (None, "")]
+            missing = [i for i in idx if vals[i] in (None, "")]
+            present.sort(key=lambda i: _sort_key(vals[i]), reverse=desc)
+            idx = present + missing  # vacíos siempre al final
+        with self._lock:
+            self._views[key] = idx
+            while len(self._views) > MAX_VIEWS:
+                self._views.popitem(last=False)
+        return idx
+
+
+def _text(v: Any) -> str:
+    return "" if v is None else str(v).lower()
+
+
+def _sort_key(v: Any) -> Tuple[int, Any]:
+    """Números como números (también '12,5'), el resto como texto."""
+    if isinstance(v, (int, float)):
+        return 0, v
+    s = str(v).strip()
+    try:
+        return 0, float(s.replace(",", "."))
+    except ValueError:
+        return 1, s.lower()
+
+
+class ResultStore:
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # cursor -> (vence, resultado); orden = uso (LRU al principio)
+        self._data: "OrderedDict[str, Tuple[float, Result]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result: Result) -> str:
+        cursor = secrets.token_urlsafe(12)
+        with self._lock:
+            self._purge(time.time())
+            self._data[cursor] = (time.time() + self.ttl_s, result)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return cursor
+
+    def get(self, cursor: str) -> Optional[Result]:
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(cursor)
+            if hit is None:
+                return None
+            exp, result = hit
+            if exp <= now:
+                self._data.pop(cursor, None)
+                return None
+            self._data[cursor] = (now + self.ttl_s, result)
+            self._data.move_to_end(cursor)
+            return result
+
+    def _purge(self, now: float) -> None:
+        for c in [c for c, (exp, _) in self._data.items() if exp <= now]:
+            self._data.pop(c, None)
+
+    def count(self) -> int:
+        return len(self._data)
+
+
+_STORE: Dict[str, Any] = {"store": None}
+
+
+def store() -> ResultStore:
+    if _STORE["store"] is None:
+        s = get_settings()
+        _STORE["store"] = ResultStore(s.result_ttl_s, max(1, s.result_max))
+    return _STORE["store"]
+
+
+def page(result: Result, offset: int, limit: int, sort: Optional[str] = None, desc: bool = False,
+         q: str = "", col: Optional[str] = None) -> Dict[str, Any]:
+    idx = result.view(sort, desc, q, col)
+    return {
+        "total": len(result.table),
+        "matched": len(idx),
+        "offset": offset,
+        "limit": limit,
+        "sort": sort,
+        "desc": desc,
+        "rows": result.table.take(idx[offset:offset + limit]),
+    }
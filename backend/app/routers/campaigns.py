@@ -0,0 +1,47 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app import campaigns as camp, loaders
+
+router = APIRouter(prefix="/api/campaigns", tags=["campaigns"])
+
+
+@router.get("")
+def list_campaigns():
+    """Campañas configuradas (campaigns.json o defaults) y últimas corridas."""
+    return {"campaigns": camp.load_campaigns(), "runs": camp.list_runs(limit=20)}
+
+
+@router.post("/{name}/run")
+async def run_campaign(name: str):
+    """Lanza la campaña ahora (si ya hay una corrida activa, devuelve esa)."""
+    c = await loaders.run(camp.get_campaign, name)
+    if not c:
+        raise HTTPException(status_code=404, detail=f"No existe la campaña '{name}'.")
+    run_id = await camp.trigger(c)
+    return await loaders.run(camp.run_summary, run_id)
+
+
+@router.get("/runs/{run_id}")
+def get_run(run_id: int, errors: int = 50):
+    summary = camp.run_summary(run_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail=f"No existe la corrida {run_id}.")
+    summary["errors"] = camp.run_errors(run_id, limit=errors)
+    return summary
+
+
+@router.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: int):
+    # async: la tarea de la corrida vive en el event loop (cancelarla desde el threadpool no es seguro)
+    if not await camp.cancel_run(run_id):
+        raise HTTPException(status_code=404, detail=f"La corrida {run_id} no está activa.")
+    return {"ok": True}
+
+
+@router.get("/results")
+def get_results(meter: Optional[int] = None, report: Optional[str] = None, limit: int = 50):
+    """Resultados guardados por las campañas (más recientes primero)."""
+    limit = max(1, min(limit, 1000))
+    return {"results": camp.query_results(meter=meter, report=report, limit=limit)}
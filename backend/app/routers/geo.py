@@ -0,0 +1,63 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app import geo
+
+router = APIRouter(prefix="/api/geo", tags=["geo"])
+
+MAX_POINTS_PAGE = 5000
+
+
+def _parse_bbox(bbox: Optional[str]) -> List[float]:
+    """'minLon,minLat,maxLon,maxLat' (mismo orden que Leaflet toBBoxString)."""
+    if not bbox:
+        return [-180.0, -90.0, 180.0, 90.0]
+    try:
+        parts = [float(x) for x in bbox.split(",")]
+    except ValueError:
+        parts = []
+    if len(parts) != 4:
+        raise HTTPException(status_code=400, detail="bbox inválido. Formato: minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox inválido: mínimo mayor que máximo.")
+    return parts
+
+
+@router.get("/meters")
+def geo_meters(
+    bbox: Optional[str] = None,
+    zoom: int = Query(12, ge=0, le=22),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_POINTS_PAGE),
+):
+    """Medidores georreferenciados dentro de `bbox`.
+
+    Con zoom < CLUSTER_MAX_ZOOM se agrupan en clusters (count + centroide);
+    los puntos que quedan solos y, desde CLUSTER_MAX_ZOOM, todos los puntos
+    se devuelven paginados (offset/limit).
+    """
+    box = _parse_bbox(bbox)
+    index = geo.get_index()
+    ids = index.query(*box)
+
+    if zoom < geo.CLUSTER_MAX_ZOOM:
+        clusters, singles = geo.clusters(index, ids, zoom)
+    else:
+        clusters, singles = [], ids
+
+    page = singles[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(singles) else None
+    return {
+        "bbox": box,
+        "zoom": zoom,
+        "total": len(ids),
+        "indexed": len(index),
+        "clusters": clusters,
+        "points": [index.point(i) for i in page],
+        "total_points": len(singles),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset,
+    }
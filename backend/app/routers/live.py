@@ -0,0 +1,70 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app import events
+from app.routers.meters import _normalize_cir
+
+router = APIRouter(prefix="/api/live", tags=["live"])
+
+
+def _meters(v: Optional[str]) -> List[int]:
+    """'CIR123,456' -> [123, 456] (se ignoran los inválidos)."""
+    out = []
+    for part in (v or "").split(","):
+        if part.strip():
+            try:
+                out.append(_normalize_cir(part)[1])
+            except Exception:
+                continue
+    return out
+
+
+def _ints(v: Optional[str]) -> List[int]:
+    return [int(x) for x in (v or "").split(",") if x.strip().isdigit()]
+
+
+def _strs(v: Optional[str]) -> List[str]:
+    return [x.strip() for x in (v or "").split(",") if x.strip()]
+
+
+def _hello(sub: events.Subscriber) -> dict:
+    return {"type": "hello", "meters": sorted(sub.meters), "concs": sorted(sub.concs), "batches": sorted(sub.batches)}
+
+
+@router.websocket("/ws")
+async def live_ws(ws: WebSocket, meter: Optional[str] = None, conc_id: Optional[str] = None, batch: Optional[str] = None):
+    """Eventos de relé y órdenes. Filtros: ?meter=CIR1,CIR2&conc_id=7&batch=abc (sin filtros: todo).
+
+    El cliente puede cambiar los filtros enviando {"meter": "...", "conc_id": "...", "batch": "..."}.
+    Eventos: relay (Eacti confirmado por S01), order (resultado de un B03) y
+    batch (avance de /order_massive).
+    """
+    await ws.accept()
+    sub = events.subscribe(_meters(meter), _ints(conc_id), _strs(batch))
+    await ws.send_json(_hello(sub))
+
+    async def _pump() -> None:
+        while True:
+            await ws.send_json(await sub.queue.get())
+
+    pump = asyncio.ensure_future(_pump())
+    try:
+        while True:
+            try:
+                msg = json.loads(await ws.receive_text())
+            except ValueError:
+                continue
+            if isinstance(msg, dict):
+                sub.meters = set(_meters(str(msg.get("meter") or "")))
+                sub.concs = set(_ints(str(msg.get("conc_id") or "")))
+                sub.batches = set(_strs(str(msg.get("batch") or "")))
+                await ws.send_json(_hello(sub))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        events.unsubscribe(sub)
+        pump.cancel()
+        await asyncio.gather(pump, return_exceptions=True)
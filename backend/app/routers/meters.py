@@ -1,23 +1,46 @@
-import csv
+import asyncio
 import io
+import json
+import logging
 import os
 import time
 import re
 import math
-from typing import Any, Optional, List, Dict
+from contextlib import AsyncExitStack
+from typing import Any, Optional, List, Dict, Sequence, Tuple
 
 import httpx
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 
+from app import analytics, budget, chunking, decode, disconnect, dispatch, events, gede_tokens, loaders, meter_state, order_journal, order_plan, prefetch, result_store
 from app.config import get_settings
+from app.meter_index import MeterIndex
+from app.export import csv_stream as export_csv_stream, report_rows, xlsx_file as export_xlsx_file
+from app.loaders import Reloadable
+from app.routers.auth import get_session_async
+from app.significados import load_significados_async
+from app.singleflight import SingleFlight
+from app.table import Table, plain
+
+log = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/meters", tags=["meters"])
 
-# Cache simple de tokens por concentrador (ip/base_url)
-_TOKEN_CACHE: dict[str, dict[str, Any]] = {}
-# Cache de mapeo de excel (se recarga si cambia el archivo)
-_EXCEL_CACHE: dict[str, Any] = {"mtime": None, "meter_to_conc": {}, "conc_to_ip": {}}
+# Tope de filas por página de un cursor (/report con page_size)
+MAX_PAGE_ROWS = 10_000
+# Límite de medidores por exportación (CSV/XLSX)
+MAX_EXPORT_METERS = 5000
+# Límite de medidores por consulta de /resolve
+MAX_RESOLVE_METERS = 100_000
+# Tope de columnas pedidas en /report con "fields"
+MAX_REPORT_FIELDS = 200
+# Confirmación tras un B03: del S01 sólo interesa el relé de la primera fila
+S01_CONFIRM_FIELDS = ("Eacti",)
+# Lecturas idénticas en vuelo comparten una única llamada al concentrador
+_REPORT_FLIGHTS = SingleFlight(grace_s=get_settings().report_coalesce_grace_s)
 
 
 class ReadReportIn(BaseModel):
@@ -26,6 +49,34 @@ class ReadReportIn(BaseModel):
     priority: int = Field(2, ge=0, le=9)
     fini: Optional[str] = Field(None, description="ISO 8601, ej: 2026-01-24T00:01:00Z")
     fend: Optional[str] = Field(None, description="ISO 8601, ej: 2026-01-24T23:59:00Z")
+    page_size: Optional[int] = Field(
+        None, ge=1, le=MAX_PAGE_ROWS,
+        description="Si se indica: devuelve un cursor y la primera página (resto en GET /report/{cursor})",
+    )
+    stream: bool = Field(False, description="Ventanas partidas en tramos: NDJSON a medida que llega cada tramo")
+    fields: Optional[List[str]] = Field(
+        None, max_length=MAX_REPORT_FIELDS,
+        description="Sólo estas columnas (nombre completo 'Cnc.Id' o de atributo 'Eacti'); el resto no se decodifica",
+    )
+
+
+class ExportIn(BaseModel):
+    meter: Optional[str] = Field(None, description="Un medidor (exportación simple)")
+    meters: Optional[List[str]] = Field(None, description="Lista de medidores (exportación masiva)")
+    report_name: str = Field(..., description="Ej: S02, S04")
+    priority: int = Field(2, ge=0, le=9)
+    fini: Optional[str] = Field(None, description="ISO 8601")
+    fend: Optional[str] = Field(None, description="ISO 8601")
+    format: str = Field("csv", pattern="^(csv|xlsx)$")
+    translate: bool = Field(True, description="Encabezados con la Biblioteca de Significados")
+
+
+class AnalyticsIn(BaseModel):
+    meter: str = Field(..., description="Medidor (con o sin prefijo CIR)")
+    report_name: str = Field("S02", pattern="^(?i:S02|S04)$", description="S02 (curva) o S04 (cierres)")
+    priority: int = Field(2, ge=0, le=9)
+    fini: Optional[str] = Field(None, description="ISO 8601")
+    fend: Optional[str] = Field(None, description="ISO 8601")
 
 
 class ReadOrderIn(BaseModel):
@@ -119,8 +170,14 @@ def _parse_meter_cell(v: Any) -> Optional[int]:
 
 
 
-def _load_excel_mapping():
-    '''Carga mapeo desde concentradores.xlsx.
+def _concentradores_path() -> str:
+    s = get_settings()
+    xlsx_path = getattr(s, "concentradores_xlsx_path", None) or os.path.join(os.path.dirname(__file__), "..", "..", "data", "concentradores.xlsx")
+    return os.path.abspath(xlsx_path)
+
+
+def _load_excel_mapping(xlsx_path: str) -> MeterIndex:
+    '''Carga mapeo desde concentradores.xlsx (bloqueante: se llama desde el pool de carga).
 
     Preferencia del cliente:
       - IP en fila 3
@@ -133,17 +190,9 @@ def _load_excel_mapping():
     import re as _re
     import openpyxl
 
-    s = get_settings()
-    xlsx_path = getattr(s, "concentradores_xlsx_path", None) or os.path.join(os.path.dirname(__file__), "..", "..", "data", "concentradores.xlsx")
-    xlsx_path = os.path.abspath(xlsx_path)
-
     if not os.path.exists(xlsx_path):
         raise HTTPException(status_code=500, detail=f"No se encontró el archivo de concentradores: {xlsx_path}")
 
-    mtime = os.path.getmtime(xlsx_path)
-    if _EXCEL_CACHE["mtime"] == mtime:
-        return
-
     wb = openpyxl.load_workbook(xlsx_path, data_only=True)
 
     # Defaults solicitados
@@ -238,20 +287,31 @@ def _load_excel_mapping():
                     continue
                 meter_to_conc[meter_id] = conc_id
 
-    _EXCEL_CACHE["mtime"] = mtime
-    _EXCEL_CACHE["meter_to_conc"] = meter_to_conc
-    _EXCEL_CACHE["conc_to_ip"] = conc_to_ip
+    return MeterIndex.build(meter_to_conc, conc_to_ip)
+
+
+# Índice de concentradores.xlsx (se recarga en el pool si cambia el archivo)
+_METER_INDEX: Reloadable[MeterIndex] = Reloadable("concentradores.xlsx", _concentradores_path, _load_excel_mapping)
+
+
+def _meter_index() -> MeterIndex:
+    """Índice medidor<->concentrador vigente, para código sync (endpoints `def`)."""
+    return _METER_INDEX.get_sync()
+
+
+async def _meter_index_async() -> MeterIndex:
+    """Igual que `_meter_index` pero sin bloquear el loop (sirve el anterior mientras recarga)."""
+    return await _METER_INDEX.get()
 
 
-def _resolve_conc_and_ip_for_meter(meter_id_int: int) -> tuple[int, str]:
-    _load_excel_mapping()
-    meter_to_conc = _EXCEL_CACHE["meter_to_conc"]
-    conc_to_ip = _EXCEL_CACHE["conc_to_ip"]
+def _resolve_conc_and_ip_for_meter(meter_id_int: int, index: Optional[MeterIndex] = None) -> tuple[int, str]:
+    if index is None:
+        index = _meter_index()
 
-    conc_id = meter_to_conc.get(meter_id_int)
+    conc_id = index.conc_for(meter_id_int)
     if not conc_id:
         raise HTTPException(status_code=404, detail=f"No se encontró el medidor {meter_id_int} en concentradores.xlsx.")
-    ip = conc_to_ip.get(conc_id)
+    ip = index.conc_to_ip.get(conc_id)
     if not ip:
         raise HTTPException(status_code=404, detail=f"No se encontró IP para concentrador {conc_id} en concentradores.xlsx.")
     return conc_id, ip
@@ -263,12 +323,7 @@ def _resolve_ip_for_meter(meter_id_int: int) -> str:
 
 
 async def _gede_login(base_url: str) -> str:
-    # Cache por 10 minutos
-    now = time.time()
-    cached = _TOKEN_CACHE.get(base_url)
-    if cached and cached.get("exp", 0) > now:
-        return cached["token"]
-
+    """Login HTTP contra el concentrador. El reuso/cierre de sesiones lo maneja app.gede_tokens."""
     s = get_settings()
     username = getattr(s, "gede_username", "admin")
     password = getattr(s, "gede_password", "Adm1n")
@@ -276,8 +331,11 @@ async def _gede_login(base_url: str) -> str:
     xml_body = f'<Login Username="{username}" Password="{password}"/>'
     url = base_url.rstrip("/") + "/login"
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(url, content=xml_body.encode("utf-8"), headers={"Content-Type": "application/xml"})
+    try:
+        async with httpx.AsyncClient(timeout=budget.timeout("login")) as client:
+            r = await client.post(url, content=xml_body.encode("utf-8"), headers={"Content-Type": "application/xml"})
+    except httpx.TimeoutException:
+        raise budget.expired("login", f"Timeout en login GEDE ({base_url}). El concentrador no respondió a tiempo.")
 
     if r.status_code not in (200, 201):
         raise HTTPException(status_code=502, detail=f"Login GEDE falló ({r.status_code}): {r.text[:300]}")
@@ -293,7 +351,6 @@ async def _gede_login(base_url: str) -> str:
     if not token:
         raise HTTPException(status_code=502, detail="No se pudo leer el token del concentrador (respuesta de /login).")
 
-    _TOKEN_CACHE[base_url] = {"token": token, "exp": now + 600}
     return token
 
 
@@ -312,8 +369,11 @@ async def _gede_logout(base_url: str, token: str) -> None:
 async def _gede_scale(base_url: str, token: str) -> None:
     """Escala privilegios del token actual (necesario para algunas órdenes como B03)."""
     url = base_url.rstrip("/") + "/scale"
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(url, headers={"Authorization": f"Bearer {token}"})
+    try:
+        async with httpx.AsyncClient(timeout=budget.timeout("scale")) as client:
+            r = await client.post(url, headers={"Authorization": f"Bearer {token}"})
+    except httpx.TimeoutException:
+        raise budget.expired("scale", f"Timeout en scale GEDE ({base_url}). El concentrador no respondió a tiempo.")
     if r.status_code != 200:
         raise HTTPException(status_code=502, detail=f"Scale GEDE falló ({r.status_code}): {r.text[:300]}")
 
@@ -343,6 +403,8 @@ def _extract_eacti(data: Any) -> Optional[Any]:
     """Busca el campo Eacti (estado del relé) en distintos formatos."""
     if data is None:
         return None
+    if isinstance(data, Table):
+        data = data.rows(0, 1)
     # Lista de filas (dicts)
     if isinstance(data, list) and data:
         row = data[0]
@@ -362,200 +424,88 @@ def _extract_eacti(data: Any) -> Optional[Any]:
                 return v
     return None
 
-def _try_parse_csv(text: str) -> Optional[list[dict[str, Any]]]:
-    # intenta parsear CSV con separador ',' o ';'
-    for delim in [",", ";", "	"]:
-        try:
-            f = io.StringIO(text)
-            reader = csv.DictReader(f, delimiter=delim)
-            rows = list(reader)
-            if rows and reader.fieldnames and len(reader.fieldnames) >= 2:
-                return rows
-        except Exception:
-            pass
-    return None
-
+def _remember_s01(
+    meter_id_int: int, conc_id: Optional[int], data: Any, source: str, partial: bool = False
+) -> Optional[Any]:
+    """Guarda la fila S01 en el último estado conocido (app.meter_state). Devuelve el Eacti.
 
-
-def _strip_ns(tag: str) -> str:
-    # '{ns}Tag' -> 'Tag'
-    if not tag:
-        return "Tag"
-    if tag.startswith("{") and "}" in tag:
-        return tag.split("}", 1)[1]
-    return tag
-
-def _xml_report_to_rows(xml_text: str) -> Optional[list[dict[str, Any]]]:
-    """Convierte el XML de GEDE a filas/columnas.
-
-    Estrategia:
-      1) Buscar un 'record tag' (elemento hoja con atributos) repetido; si no hay repetidos,
-         elegir el elemento hoja con MÁS atributos.
-      2) Para cada record, generar una fila con:
-         - atributos del root (Report)
-         - atributos de ancestros (por ejemplo Cnc.Id, Cnt.Id)
-         - atributos del record (sin prefijo si no colisiona; si colisiona, se prefija)
+    partial=True: la fila viene proyectada (sólo algunos campos); se conserva el resto.
     """
-    import xml.etree.ElementTree as ET
-    try:
-        root = ET.fromstring(xml_text)
-    except Exception:
+    rows = report_rows(data)
+    if not rows:
         return None
+    meter_state.remember(meter_id_int, conc_id, rows[0], source, merge=partial)
+    return meter_state.eacti_of(rows[0])
 
-    # Recolectar candidatos hoja con atributos o texto
-    leafs: list[ET.Element] = []
-    all_elems: list[ET.Element] = []
-
-    def walk(e: ET.Element):
-        all_elems.append(e)
-        children = list(e)
-        if not children:
-            leafs.append(e)
-        for ch in children:
-            walk(ch)
 
-    walk(root)
+def _decode_response(r: httpx.Response, fields: Optional[Sequence[str]] = None, limit: Optional[int] = None) -> Any:
+    """Decodifica la respuesta de GEDE: JSON, si no CSV, si no XML->filas (inline)."""
+    return decode.decode_text(r.text, fields, limit)
 
-    def leaf_score(e: ET.Element) -> int:
-        return len(e.attrib or {}) + (1 if (e.text or "").strip() else 0)
 
-    # Agrupar hojas por tag (sin namespace)
-    groups: dict[str, list[ET.Element]] = {}
-    for e in leafs:
-        if leaf_score(e) == 0:
-            continue
-        t = _strip_ns(e.tag)
-        groups.setdefault(t, []).append(e)
+async def _decode_response_async(r: httpx.Response, fields: Optional[Sequence[str]] = None) -> Any:
+    """Como `_decode_response`, pero las respuestas grandes se decodifican en el pool de procesos."""
+    try:
+        return await decode.decode_async(r.content, r.encoding, fields)
+    except decode.DecodeUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
-    # Elegir record group
-    record_tag = None
-    record_elems: list[ET.Element] = []
 
-    # Preferir repetidos
-    best = (0, 0)  # (count, avg_attr)
-    for t, elems in groups.items():
-        if len(elems) < 2:
-            continue
-        avg_attr = sum(len(x.attrib or {}) for x in elems) / max(1, len(elems))
-        key = (len(elems), int(avg_attr))
-        if key > best:
-            best = key
-            record_tag = t
-            record_elems = elems
-
-    if not record_elems:
-        # Elegir el hoja con más atributos (o texto)
-        best_elem = None
-        best_score = -1
-        for e in leafs:
-            sc = leaf_score(e)
-            if sc > best_score:
-                best_score = sc
-                best_elem = e
-        if best_elem is None:
-            return None
-        record_tag = _strip_ns(best_elem.tag)
-        record_elems = [best_elem]
-
-    # Necesitamos ancestros: ElementTree no da parent, así que recorremos y armamos parent map
-    parent: dict[ET.Element, ET.Element] = {}
-    for e in all_elems:
-        for ch in list(e):
-            parent[ch] = e
-
-    def ancestors(e: ET.Element):
-        cur = e
-        out = []
-        while cur in parent:
-            cur = parent[cur]
-            out.append(cur)
-        return out  # desde padre hacia root
-
-    # Root attrs (Report)
-    root_attrs = {}
-    for k, v in (root.attrib or {}).items():
-        root_attrs[_strip_ns(k)] = v
-
-    rows: list[dict[str, Any]] = []
-    for rec in record_elems:
-        row: dict[str, Any] = dict(root_attrs)
-
-        # Ancestros relevantes (hasta root)
-        for a in ancestors(rec):
-            tag = _strip_ns(a.tag)
-            for k, v in (a.attrib or {}).items():
-                col = f"{tag}.{_strip_ns(k)}"
-                # no pisar si existe
-                if col not in row:
-                    row[col] = v
-
-        # Record attrs
-        used = set(row.keys())
-        for k, v in (rec.attrib or {}).items():
-            kk = _strip_ns(k)
-            col = kk if kk not in used else f"{record_tag}.{kk}"
-            row[col] = v
-
-        # Texto del record si aplica
-        t = (rec.text or "").strip()
-        if t:
-            col = "value" if "value" not in row else f"{record_tag}.value"
-            row[col] = t
-
-        # También incluir el tag del record
-        if record_tag and "recordTag" not in row:
-            row["recordTag"] = record_tag
-
-        rows.append(row)
-
-    return rows if rows else None
-
-@router.post("/report")
-async def read_report(payload: ReadReportIn):
+def _gede_base_url(ip: str) -> str:
     s = get_settings()
-    cir, meter_id_int = _normalize_cir(payload.meter)
-
-    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int)
-
     api_base = getattr(s, "gede_api_base", "/api/v1")
-    base_url = f"http://{ip}{api_base}"
-
-    token: Optional[str] = None
-    try:
-        token = await _gede_login(base_url)
+    return f"http://{ip}{api_base}"
+
+
+async def _fetch_report(
+    ip: str,
+    cir: str,
+    report_name: str,
+    priority: int = 2,
+    fini: Optional[str] = None,
+    fend: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Sesión GEDE + GET /report/{name} + decodificación contra un concentrador.
+
+    Es el núcleo de `read_report`; también lo usan flujos internos (campañas, etc).
+    Con `fields` sólo se decodifican esas columnas (ver app.decode).
+    """
+    base_url = _gede_base_url(ip)
 
+    # Sesión compartida (broker entre workers): sin login/logout por cada lectura
+    async with gede_tokens.lease(base_url) as sess:
         params = {
             "idMeters": cir,
-            "priority": payload.priority,
+            "priority": priority,
         }
-        if payload.fini:
-            params["fini"] = payload.fini
-        if payload.fend:
-            params["fend"] = payload.fend
+        if fini:
+            params["fini"] = fini
+        if fend:
+            params["fend"] = fend
 
 
-        url = base_url.rstrip("/") + f"/report/{payload.report_name}"
+        url = base_url.rstrip("/") + f"/report/{report_name}"
 
         try:
-            async with httpx.AsyncClient(timeout=120) as client:
-                r = await client.get(url, params=params, headers={"Authorization": f"Bearer {token}"})
-        except httpx.ReadTimeout:
-            raise HTTPException(
-                status_code=504,
-                detail=f"Timeout leyendo {payload.report_name} (IP {ip}). El concentrador no respondió a tiempo.",
+            async with httpx.AsyncClient(timeout=budget.timeout("report")) as client:
+                r = await client.get(url, params=params, headers={"Authorization": f"Bearer {sess.token}"})
+        except httpx.TimeoutException:
+            raise budget.expired(
+                "report",
+                f"Timeout leyendo {report_name} (IP {ip}). El concentrador no respondió a tiempo.",
             )
 
         # Si token expiró, reintenta una vez
         if r.status_code in (401, 403):
-            _TOKEN_CACHE.pop(base_url, None)
-            token = await _gede_login(base_url)
+            await sess.refresh()
             try:
-                async with httpx.AsyncClient(timeout=120) as client:
-                    r = await client.get(url, params=params, headers={"Authorization": f"Bearer {token}"})
-            except httpx.ReadTimeout:
-                raise HTTPException(
-                    status_code=504,
-                    detail=f"Timeout leyendo {payload.report_name} (IP {ip}) en reintento. El concentrador no respondió a tiempo.",
+                async with httpx.AsyncClient(timeout=budget.timeout("report")) as client:
+                    r = await client.get(url, params=params, headers={"Authorization": f"Bearer {sess.token}"})
+            except httpx.TimeoutException:
+                raise budget.expired(
+                    "report",
+                    f"Timeout leyendo {report_name} (IP {ip}) en reintento. El concentrador no respondió a tiempo.",
                 )
 
         if r.status_code != 200:
@@ -563,193 +513,663 @@ async def read_report(payload: ReadReportIn):
 
         content_type = (r.headers.get("content-type") or "").lower()
         raw_text = r.text
-
-        # Intentar JSON
-        data: Any = None
-        try:
-            data = r.json()
-        except Exception:
-            data = None
-
-        # Intentar CSV si no es JSON
-        if data is None:
-            parsed_csv = _try_parse_csv(raw_text)
-            if parsed_csv is not None:
-                data = parsed_csv
-
-        # Intentar XML->filas si no es JSON ni CSV
-        if data is None:
-            parsed_xml = _xml_report_to_rows(raw_text)
-            if parsed_xml is not None:
-                data = parsed_xml
+        data = await _decode_response_async(r, fields)
 
         return {
-            "ip": ip,
-            "conc_id": conc_id,
             "base_url": base_url,
-            "report_name": payload.report_name,
-            "meter": cir,
             "content_type": content_type,
             "data": data,
             "raw": raw_text,
-            # "relay_eacti": relay_eacti,  # (NO) solo aplica a órdenes B03
-
         }
-    finally:
-        if token:
-            await _gede_logout(base_url, token)
-            _TOKEN_CACHE.pop(base_url, None)
 
-@router.post("/order")
-async def send_order(payload: ReadOrderIn):
-    """Envía una orden B03 (corte/reconexión)."""
-    s = get_settings()
-    cir, meter_id_int = _normalize_cir(payload.meter)
 
-    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int)
+async def _client_key(request: Request) -> str:
+    """Identidad para el reparto justo de la cola: usuario de la sesión o IP del cliente."""
+    auth = request.headers.get("authorization") or ""
+    if auth.lower().startswith("bearer "):
+        sess = await get_session_async(auth[7:].strip())
+        if sess and sess.get("username"):
+            return "user:" + str(sess["username"])
+    return "ip:" + (request.client.host if request.client else "?")
+
+
+@router.get("/queues")
+def dispatch_queues():
+    """Estado de las colas de despacho por concentrador."""
+    return dispatch.stats()
+
+
+def _forget_reads(cir: str, meter_id_int: int) -> None:
+    """El medidor recibió una B03: descartar su S01 prelecturado y las lecturas que conserva el singleflight."""
+    prefetch.invalidate(meter_id_int)
+    _REPORT_FLIGHTS.forget(lambda key: key[0] == cir)
+
+
+async def _read_meter_report(
+    meter: str,
+    report_name: str,
+    priority: int = 2,
+    fini: Optional[str] = None,
+    fend: Optional[str] = None,
+    user: str = "anon",
+    lane: int = dispatch.INTERACTIVE,
+    fields: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Lectura completa de un medidor: resolver concentrador + cola + singleflight + GEDE."""
+    cir, meter_id_int = _normalize_cir(meter)
+
+    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int, await _meter_index_async())
+
+    async def _upstream() -> Dict[str, Any]:
+        async with dispatch.slot(ip, lane, user):
+            return await _fetch_report(ip, cir, report_name, priority, fini, fend, fields)
+
+    # Varios técnicos abriendo el mismo medidor => una sola sesión contra el concentrador
+    # (quien se suma a una lectura en curso igual respeta su propio presupuesto).
+    # El carril va en la clave: un pedido interactivo nunca espera un turno BACKGROUND.
+    proj = tuple(sorted({f.strip() for f in fields if f and f.strip()})) if fields else ()
+    flight_key = (cir, report_name.upper(), fini or "", fend or "", proj, lane)
+    res, shared = await budget.within(_REPORT_FLIGHTS.do(flight_key, _upstream), "report")
+    if report_name.upper() == "S01":
+        _remember_s01(meter_id_int, conc_id, res["data"], "report", partial=bool(proj))
+
+    return {
+        "ip": ip,
+        "conc_id": conc_id,
+        "base_url": res["base_url"],
+        "report_name": report_name,
+        "meter": cir,
+        "content_type": res["content_type"],
+        "data": res["data"],
+        "raw": res["raw"],
+        "shared": shared,
+    }
+
+
+@router.get("/gede_sessions")
+def gede_sessions():
+    """Sesiones GEDE abiertas (compartidas entre workers) y sus leases."""
+    return {"sessions": gede_tokens.stats()}
+
+
+@router.get("/concentrators")
+def list_concentrators():
+    """Concentradores de concentradores.xlsx con IP y cantidad de medidores."""
+    index = _meter_index()
+    return {
+        "count": len(index.conc_ids),
+        "meters": len(index),
+        "concentrators": [{"conc_id": c, "ip": ip, "meters": n} for c, ip, n in index.concentrators()],
+    }
+
+
+@router.get("/concentrators/{conc_id}/meters")
+def list_concentrator_meters(conc_id: int, offset: int = 0, limit: int = 1000):
+    """Medidores que atiende un concentrador (paginado)."""
+    index = _meter_index()
+    total = index.meter_count(conc_id)
+    if not total and conc_id not in index.conc_to_ip:
+        raise HTTPException(status_code=404, detail=f"No se encontró el concentrador {conc_id} en concentradores.xlsx.")
+    limit = max(1, min(limit, 10000))
+    return {
+        "conc_id": conc_id,
+        "ip": index.conc_to_ip.get(conc_id),
+        "total": total,
+        "offset": offset,
+        "meters": index.meters_of(conc_id, offset, limit),
+    }
+
+
+@router.get("/concentrators/state")
+def concentrators_state(conc_id: Optional[int] = None):
+    """Conectados/desconectados por concentrador según el último S01 conocido (sin consultar equipos)."""
+    return {"meters": meter_state.store().count(), "concentrators": meter_state.summary(conc_id)}
+
+
+# medidor -> relectura S01 en segundo plano (una por medidor)
+_STATE_REFRESH: Dict[int, asyncio.Task] = {}
+
+
+async def _refresh_state(meter: str, priority: int, user: str) -> None:
+    with budget.scope(budget.start("S01")):
+        await _read_meter_report(meter, "S01", priority, user=user, lane=dispatch.BACKGROUND)
+
+
+def _spawn_state_refresh(meter_id_int: int, meter: str, priority: int, user: str) -> None:
+    task = _STATE_REFRESH.get(meter_id_int)
+    if task is not None and not task.done():
+        return
+    task = asyncio.get_running_loop().create_task(_refresh_state(meter, priority, user))
+    _STATE_REFRESH[meter_id_int] = task
 
-    api_base = getattr(s, "gede_api_base", "/api/v1")
-    base_url = f"http://{ip}{api_base}"
+    def _done(t: asyncio.Task) -> None:
+        _STATE_REFRESH.pop(meter_id_int, None)
+        if not t.cancelled() and t.exception() is not None:
+            log.warning("No se pudo refrescar el S01 de %s: %s", meter_id_int, getattr(t.exception(), "detail", t.exception()))
 
-    token: Optional[str] = None
-    try:
-        token = await _gede_login(base_url)
-
-        # Escalado del token (requerido para B03 según Postman)
-        await _gede_scale(base_url, token)
-
-        from datetime import datetime, timezone, timedelta
-        fini_ts = _to_stg_ts(payload.fini)
-        fend_ts = _to_stg_ts(payload.fend)
-
-        # UX B03: si el frontend envía una única fecha, usamos la misma para Fini y Ffin
-        if fini_ts and not fend_ts:
-            fend_ts = fini_ts
-
-        if not fini_ts:
-            fini_ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S") + "000W"
-        if not fend_ts:
-            fend_ts = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y%m%d%H%M%S") + "000W"
-
-        xml_body = (
-            f'<Order xmlns="http://stgdc/ws/B03" IdReq="B03" IdPet="{payload.id_pet}" Version="4.0">'
-            f'<Cnc Id="CIR{conc_id}">'
-            f'<Cnt Id="{cir}">'
-            f'<B03 Fini="{fini_ts}" Ffin="{fend_ts}" Order="{payload.order}"/>'
-            f'</Cnt></Cnc></Order>'
-        )
+    task.add_done_callback(_done)
 
-        params = {"priority": payload.priority}
-        url = base_url.rstrip("/") + "/order"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/xml"
-        }
+@router.get("/state/{meter}")
+async def meter_last_state(
+    meter: str,
+    request: Request,
+    max_age_s: Optional[float] = Query(None, ge=0, description="Antigüedad aceptada (def. METER_STATE_MAX_AGE_S)"),
+    priority: int = Query(2, ge=0, le=9),
+    wait: bool = Query(False, description="Si está viejo, esperar la relectura en vez de refrescar en segundo plano"),
+):
+    """Último S01 conocido del medidor con su antigüedad (stale-while-revalidate).
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.put(url, params=params, content=xml_body, headers=headers)
-            if r.status_code == 405:
-                r = await client.post(url, params=params, content=xml_body, headers=headers)
+    - Dentro de max_age_s: se devuelve tal cual.
+    - Más viejo: se devuelve igual con refreshing=true y se relee en segundo plano
+      (con wait=true se espera la relectura).
+    - Sin dato: se lee el S01 ahora.
+    """
+    _, meter_id_int = _normalize_cir(meter)
+    max_age = get_settings().meter_state_max_age_s if max_age_s is None else max_age_s
+    user = await _client_key(request)
+    st = meter_state.get(meter_id_int)
+    if st is not None and st["age_s"] <= max_age:
+        return {**st, "stale": False, "refreshing": False}
+    if st is not None and not wait:
+        _spawn_state_refresh(meter_id_int, meter, priority, user)
+        return {**st, "stale": True, "refreshing": True}
+
+    with budget.scope(budget.start("S01", request)):
+        await disconnect.guard(request, _read_meter_report(meter, "S01", priority, user=user), "state")
+    st = meter_state.get(meter_id_int)
+    if st is None:
+        raise HTTPException(status_code=502, detail=f"El S01 del medidor {meter_id_int} no trajo filas.")
+    return {**st, "stale": False, "refreshing": False}
+
+
+class ResolveIn(BaseModel):
+    meters: List[str] = Field(..., description="Medidores (con o sin prefijo CIR)")
+
+
+@router.post("/resolve")
+def resolve_meters(payload: ResolveIn):
+    """Resuelve una lista de medidores a concentrador/IP en una sola búsqueda."""
+    if len(payload.meters) > MAX_RESOLVE_METERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_RESOLVE_METERS} medidores por consulta.")
+    index = _meter_index()
+    parsed = [_parse_meter_cell(m) for m in payload.meters]
+    concs = index.resolve_many([p for p in parsed if p is not None])
+    it = iter(concs)
+    results = []
+    not_found = 0
+    for raw, mid in zip(payload.meters, parsed):
+        conc_id = next(it) if mid is not None else None
+        if conc_id is None:
+            not_found += 1
+        results.append({
+            "input": raw,
+            "meter": mid,
+            "conc_id": conc_id,
+            "ip": index.conc_to_ip.get(conc_id) if conc_id is not None else None,
+        })
+    return {"count": len(results), "not_found": not_found, "results": results}
 
-        # Si token expiró, reintenta una vez (incluye scale)
-        if r.status_code in (401, 403):
-            _TOKEN_CACHE.pop(base_url, None)
-            token = await _gede_login(base_url)
-            await _gede_scale(base_url, token)
-            headers["Authorization"] = f"Bearer {token}"
-            async with httpx.AsyncClient(timeout=120) as client:
-                r = await client.put(url, params=params, content=xml_body, headers=headers)
-                if r.status_code == 405:
-                    r = await client.post(url, params=params, content=xml_body, headers=headers)
 
-        if r.status_code != 200:
-            raise HTTPException(status_code=502, detail=f"GEDE order B03 falló ({r.status_code}): {r.text[:400]}")
+@router.post("/report")
+async def read_report(payload: ReadReportIn, request: Request):
+    # Ventana larga (S02 de meses, etc.): por tramos, ver app.chunking
+    windows = chunking.plan(payload.report_name, payload.fini, payload.fend)
+    if windows:
+        return await _read_report_chunked(payload, request, windows)
+
+    # S01 tras una búsqueda en Técnica: puede estar prelecturado o en vuelo (app.prefetch)
+    res = None
+    with budget.scope(budget.start(payload.report_name, request)):
+        if payload.report_name.upper() == "S01" and not (payload.fini or payload.fend or payload.fields):
+            _, meter_id_int = _normalize_cir(payload.meter)
+            res = await disconnect.guard(request, budget.within(prefetch.join(meter_id_int), "report"), "report")
+            if res is not None:
+                res = {**res, "shared": True, "prefetched": True}
+        # "relay_eacti" (NO) solo aplica a órdenes B03
+        if res is None:
+            res = await disconnect.guard(
+                request,
+                _read_meter_report(
+                    payload.meter,
+                    payload.report_name,
+                    payload.priority,
+                    payload.fini,
+                    payload.fend,
+                    user=await _client_key(request),
+                    fields=payload.fields,
+                ),
+                "report",
+            )
+    if not payload.page_size:
+        return {**res, "data": plain(res["data"])}
+    return _paged_response(res, payload.page_size)
 
-        raw_text = r.text
-        content_type = (r.headers.get("content-type") or "").lower()
 
-        data: Any = None
-        try:
-            data = r.json()
-        except Exception:
-            data = None
+def _as_table(data: Any) -> Table:
+    return data if isinstance(data, Table) else Table.from_rows(report_rows(data))
 
-        if data is None:
-            parsed_csv = _try_parse_csv(raw_text)
-            if parsed_csv is not None:
-                data = parsed_csv
 
-        if data is None:
-            parsed_xml = _xml_report_to_rows(raw_text)
-            if parsed_xml is not None:
-                data = parsed_xml
+def _paged_response(res: Dict[str, Any], page_size: int) -> Dict[str, Any]:
+    """Paginado: las filas quedan en app.result_store y se manda sólo la primera página."""
+    meta = {k: res[k] for k in ("ip", "conc_id", "report_name", "meter")}
+    result = result_store.Result(_as_table(res["data"]), meta, res["raw"])
+    cursor = result_store.store().put(result)
+    first = result_store.page(result, 0, page_size)
+    return {
+        **{k: v for k, v in res.items() if k not in ("data", "raw")},
+        "cursor": cursor,
+        "cols": result.cols,
+        "page": {k: v for k, v in first.items() if k != "rows"},
+        "data": first["rows"],
+    }
 
 
-        # Luego de ejecutar B03, interrogamos S01 para leer el estado del relé (Eacti)
-        relay_eacti = None
-        try:
-            import asyncio
-            await asyncio.sleep(1.5)  # pequeña espera para que el estado se estabilice
-            url_s01 = base_url.rstrip("/") + "/report/S01"
-            params_s01 = {"idMeters": cir, "priority": payload.priority}
-            async with httpx.AsyncClient(timeout=120) as client:
-                r2 = await client.get(url_s01, params=params_s01, headers={"Authorization": f"Bearer {token}"})
-            if r2.status_code == 200:
-                raw2 = r2.text
-                data2: Any = None
-                try:
-                    data2 = r2.json()
-                except Exception:
-                    data2 = None
-                if data2 is None:
-                    parsed_csv2 = _try_parse_csv(raw2)
-                    if parsed_csv2 is not None:
-                        data2 = parsed_csv2
-                if data2 is None:
-                    parsed_xml2 = _xml_report_to_rows(raw2)
-                    if parsed_xml2 is not None:
-                        data2 = parsed_xml2
-                relay_eacti = _extract_eacti(data2)
-        except Exception:
-            relay_eacti = None
+async def _chunk_fetcher(
+    request: Request, meter: str, report_name: str, priority: int, fields: Optional[Sequence[str]] = None
+):
+    user = await _client_key(request)
+    # cada tramo tiene su presupuesto, sin pasarse del deadline del cliente
+    client_deadline = budget.client_deadline(request)
+
+    async def fetch(fini: str, fend: str) -> Dict[str, Any]:
+        with budget.scope(budget.start(report_name, deadline=client_deadline)):
+            return await _read_meter_report(meter, report_name, priority, fini, fend, user=user, fields=fields)
+
+    return fetch
+
+
+async def _read_chunked(
+    request: Request,
+    meter: str,
+    report_name: str,
+    priority: int,
+    windows: List[chunking.Window],
+    endpoint: str,
+    fields: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Lee todos los tramos y une las filas en orden; los rangos que fallaron van en "chunks"."""
+    # medidor inexistente => un 404, no uno por tramo
+    cir, meter_id_int = _normalize_cir(meter)
+    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int, await _meter_index_async())
+    fetch = await _chunk_fetcher(request, meter, report_name, priority, fields)
+
+    async def collect():
+        parts, failed = [], []
+        async for _, (fini, fend), res, err in chunking.run(windows, fetch):
+            if err is not None:
+                failed.append({"fini": fini, "fend": fend, "error": err})
+            else:
+                parts.append(res)
+        return parts, failed
+
+    parts, failed = await disconnect.guard(request, collect(), endpoint)
+    if not parts:
+        raise HTTPException(status_code=502, detail=f"Fallaron los {len(windows)} tramos. Primero: {failed[0]['error']}")
+
+    return {
+        "ip": ip,
+        "conc_id": conc_id,
+        "base_url": parts[0]["base_url"],
+        "report_name": report_name,
+        "meter": cir,
+        "content_type": parts[0]["content_type"],
+        "data": Table.concat([_as_table(p["data"]) for p in parts]),
+        # respuestas originales de cada tramo, una tras otra
+        "raw": "\n".join(p["raw"] or "" for p in parts),
+        "shared": any(p["shared"] for p in parts),
+        "chunks": {"days": chunking.chunk_days(report_name), "count": len(windows), "ok": len(parts), "failed": failed},
+    }
+
+
+async def _read_report_chunked(payload: ReadReportIn, request: Request, windows: List[chunking.Window]):
+    if not payload.stream:
+        res = await _read_chunked(
+            request, payload.meter, payload.report_name, payload.priority, windows, "report", payload.fields
+        )
+        if not payload.page_size:
+            return {**res, "data": plain(res["data"])}
+        return _paged_response(res, payload.page_size)
 
-        return {
-            "ip": ip,
-            "conc_id": conc_id,
-            "base_url": base_url,
-            "report_name": "B03",
-            "meter": cir,
-            "order": payload.order,
-            "content_type": content_type,
-            "data": data,
-            "raw": raw_text,
-        }
-    finally:
-        if token:
-            await _gede_logout(base_url, token)
-            _TOKEN_CACHE.pop(base_url, None)
+    # NDJSON: cada tramo sale apenas están listos él y los anteriores
+    cir, meter_id_int = _normalize_cir(payload.meter)
+    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int, await _meter_index_async())
+    fetch = await _chunk_fetcher(request, payload.meter, payload.report_name, payload.priority, payload.fields)
+    head = {
+        "type": "meta",
+        "ip": ip,
+        "conc_id": conc_id,
+        "report_name": payload.report_name,
+        "meter": cir,
+        "chunk_days": chunking.chunk_days(payload.report_name),
+        "chunks": len(windows),
+    }
+
+    def line(obj: Dict[str, Any]) -> bytes:
+        return (json.dumps(obj, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    async def lines():
+        yield line(head)
+        failed = []
+        async for i, (fini, fend), res, err in chunking.run(windows, fetch):
+            if err is not None:
+                failed.append({"fini": fini, "fend": fend, "error": err})
+                yield line({"type": "error", "i": i, "fini": fini, "fend": fend, "error": err})
+            else:
+                yield line({"type": "chunk", "i": i, "fini": fini, "fend": fend, "rows": report_rows(res["data"])})
+        yield line({"type": "done", "ok": len(windows) - len(failed), "failed": failed})
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _cursor_result(cursor: str) -> result_store.Result:
+    result = result_store.store().get(cursor)
+    if result is None:
+        raise HTTPException(status_code=404, detail="El resultado venció o no existe; vuelva a leer el reporte.")
+    return result
+
+
+@router.get("/report/{cursor}")
+async def report_page(
+    cursor: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_PAGE_ROWS),
+    sort: Optional[str] = Query(None, description="Columna para ordenar"),
+    desc: bool = False,
+    q: str = Query("", max_length=200, description="Texto a buscar (en todas las columnas o en `col`)"),
+    col: Optional[str] = None,
+):
+    """Página de un resultado guardado por /report (page_size)."""
+    result = _cursor_result(cursor)
+    if sort and sort not in result.cols:
+        raise HTTPException(status_code=400, detail=f"Columna inexistente: {sort}")
+    if col and col not in result.cols:
+        raise HTTPException(status_code=400, detail=f"Columna inexistente: {col}")
+    # ordenar/filtrar decenas de miles de filas: fuera del loop
+    pg = await loaders.run(result_store.page, result, offset, limit, sort, desc, q.strip(), col)
+    return {**result.meta, "cursor": cursor, "cols": result.cols, **pg}
+
+
+@router.get("/report/{cursor}/raw")
+def report_raw(cursor: str):
+    """Respuesta original del concentrador (para "Descargar XML")."""
+    result = _cursor_result(cursor)
+    return Response(result.raw or "", media_type="application/xml; charset=utf-8")
+
+
+@router.get("/report/{cursor}/csv")
+async def report_csv(cursor: str, translate: bool = False):
+    """Todas las filas del resultado en CSV (sin volver a leer el medidor)."""
+    result = _cursor_result(cursor)
+    sig = await load_significados_async() if translate else None
+
+    async def items():
+        yield result.meta["meter"], result.table.rows(), None
+
+    name = f"{result.meta['report_name']}_{result.meta['meter']}"
+    return StreamingResponse(
+        export_csv_stream(items(), False, sig),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{name}.csv"'},
+    )
+
+
+@router.post("/analytics")
+async def report_analytics(payload: AnalyticsIn, request: Request):
+    """Resumen de la curva de carga (energía diaria/mensual, demanda máx., huecos, tensiones).
+
+    Lee el reporte igual que /report pero devuelve sólo el resumen (ver app.analytics).
+    """
+    if not analytics.available():
+        raise HTTPException(status_code=500, detail="Falta NumPy en el servidor (pip install numpy).")
+    windows = chunking.plan(payload.report_name, payload.fini, payload.fend)
+    if windows:
+        res = await _read_chunked(request, payload.meter, payload.report_name, payload.priority, windows, "analytics")
+    else:
+        with budget.scope(budget.start(payload.report_name, request)):
+            res = await disconnect.guard(
+                request,
+                _read_meter_report(
+                    payload.meter,
+                    payload.report_name,
+                    payload.priority,
+                    payload.fini,
+                    payload.fend,
+                    user=await _client_key(request),
+                ),
+                "analytics",
+            )
+    try:
+        sig = await load_significados_async()
+    except HTTPException:
+        sig = None
+    summary = await loaders.run(analytics.summarize, report_rows(res["data"]), payload.report_name, sig)
+    return {
+        "ip": res["ip"],
+        "conc_id": res["conc_id"],
+        "meter": res["meter"],
+        "fini": payload.fini,
+        "fend": payload.fend,
+        "shared": res["shared"],
+        "chunks": res.get("chunks"),
+        **summary,
+    }
+
+
+@router.post("/export")
+async def export_report(payload: ExportIn, request: Request):
+    """Exporta filas de un reporte (uno o varios medidores) a CSV o XLSX.
+
+    CSV se envía por partes a medida que se lee cada medidor; XLSX se arma en
+    modo write_only en disco. En masivo, los errores por medidor van como fila.
+    """
+    meters = list(payload.meters or [])
+    if payload.meter:
+        meters.insert(0, payload.meter)
+    seen = set()
+    meters = [m.strip() for m in meters if m and m.strip() and not (m.strip() in seen or seen.add(m.strip()))]
+    if not meters:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un medidor.")
+    if len(meters) > MAX_EXPORT_METERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_EXPORT_METERS} medidores por exportación.")
 
+    bulk = len(meters) > 1
+    user = await _client_key(request)
+    # masivo por el carril de fondo: no frena a los /report interactivos
+    lane = dispatch.BACKGROUND if bulk else dispatch.INTERACTIVE
+    sig = await load_significados_async() if payload.translate else None
 
-@router.post("/order_massive")
-async def send_order_massive(
-    order: int = Form(..., description="0=corte, 1=reconexion"),
-    actdate: str = Form(..., description="Fecha ISO (ActDate)"),
-    priority: int = Form(2),
-    id_pet: int = Form(0),
-    file: UploadFile = File(..., description="Excel con lista de medidores"),
-):
-    """Envía B03 masivo leyendo un Excel de medidores, y luego interroga S01 para obtener Eacti por cada uno.
+    async def read(m: str) -> Dict[str, Any]:
+        return await _read_meter_report(m, payload.report_name, payload.priority, payload.fini, payload.fend, user=user, lane=lane)
 
-    Devuelve una tabla con NIS/Nombre/Medidor/Estado para dar visibilidad de la tarea.
-    """
-    import openpyxl
-    import asyncio
+    # Exportación simple: si la lectura falla, error HTTP normal (no un archivo vacío)
+    first: Optional[Dict[str, Any]] = None
+    if not bulk:
+        first = await read(meters[0])
 
-    # --- Cargar catálogo NIS/Nombre/Medidor (provisorio: Excel) ---
+    def label(m: str) -> str:
+        try:
+            return _normalize_cir(m)[0]
+        except HTTPException:
+            return m
+
+    async def items():
+        for m in meters:
+            if first is not None:
+                yield first["meter"], report_rows(first["data"]), None
+                continue
+            try:
+                res = await read(m)
+            except HTTPException as e:
+                yield label(m), None, str(e.detail)
+                continue
+            except Exception as e:
+                yield label(m), None, str(e)
+                continue
+            yield res["meter"], report_rows(res["data"]), None
+
+    from datetime import datetime
+    stamp = datetime.now().strftime("%Y%m%d_%H%M")
+    base_name = f"{payload.report_name}_{meters[0] if not bulk else 'masivo'}_{stamp}"
+
+    if payload.format == "xlsx":
+        # si el operador se va, se cortan las lecturas que faltan y el hilo no guarda
+        path = await disconnect.guard(request, export_xlsx_file(items(), bulk, sig, title=payload.report_name), "export")
+        return FileResponse(
+            path,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename=base_name + ".xlsx",
+            background=BackgroundTask(os.unlink, path),
+        )
+
+    return StreamingResponse(
+        export_csv_stream(items(), bulk, sig),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{base_name}.csv"'},
+    )
+
+
+@router.post("/order")
+async def send_order(payload: ReadOrderIn, request: Request):
+    """Envía una orden B03 (corte/reconexión)."""
     s = get_settings()
-    cat_path = getattr(s, "cadena_electrica_xlsx_path", None) or os.path.join(os.path.dirname(__file__), "..", "..", "data", "cadena_electrica_georreferenciacion.xlsx")
-    cat_path = os.path.abspath(cat_path)
+    cir, meter_id_int = _normalize_cir(payload.meter)
+
+    conc_id, ip = _resolve_conc_and_ip_for_meter(meter_id_int, await _meter_index_async())
+
+    api_base = getattr(s, "gede_api_base", "/api/v1")
+    base_url = f"http://{ip}{api_base}"
+
+    # bitácora de órdenes (app.order_journal): se registra también si falla
+    user = await _client_key(request)
+    entry: Dict[str, Any] = {
+        "meter": meter_id_int,
+        "conc_id": conc_id,
+        "ip": ip,
+        "action": "corte" if payload.order == 0 else "reconexion",
+        "order_value": payload.order,
+        "source": "order",
+        "user": user,
+        "id_pet": payload.id_pet,
+        "ok": False,
+    }
+    started = time.monotonic()
+    # lo leído antes de la orden (prelectura, lecturas recientes) deja de valer
+    _forget_reads(cir, meter_id_int)
+    try:
+        with budget.scope(budget.start("B03", request)):
+            async with dispatch.slot(ip, dispatch.INTERACTIVE, user):
+                async with gede_tokens.lease(base_url) as sess:
+                    # Escalado del token (requerido para B03 según Postman; una vez por sesión)
+                    await sess.ensure_scaled()
+
+                    from datetime import datetime, timezone, timedelta
+                    fini_ts = _to_stg_ts(payload.fini)
+                    fend_ts = _to_stg_ts(payload.fend)
+
+                    # UX B03: si el frontend envía una única fecha, usamos la misma para Fini y Ffin
+                    if fini_ts and not fend_ts:
+                        fend_ts = fini_ts
+
+                    if not fini_ts:
+                        fini_ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S") + "000W"
+                    if not fend_ts:
+                        fend_ts = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y%m%d%H%M%S") + "000W"
+
+                    xml_body = (
+                        f'<Order xmlns="http://stgdc/ws/B03" IdReq="B03" IdPet="{payload.id_pet}" Version="4.0">'
+                        f'<Cnc Id="CIR{conc_id}">'
+                        f'<Cnt Id="{cir}">'
+                        f'<B03 Fini="{fini_ts}" Ffin="{fend_ts}" Order="{payload.order}"/>'
+                        f'</Cnt></Cnc></Order>'
+                    )
+
+                    params = {"priority": payload.priority}
+                    url = base_url.rstrip("/") + "/order"
+
+                    headers = {
+                        "Authorization": f"Bearer {sess.token}",
+                        "Content-Type": "application/xml"
+                    }
+
+                    t_order = time.monotonic()
+                    try:
+                        async with httpx.AsyncClient(timeout=budget.timeout("order")) as client:
+                            r = await client.put(url, params=params, content=xml_body, headers=headers)
+                            if r.status_code == 405:
+                                r = await client.post(url, params=params, content=xml_body, headers=headers)
+
+                        # Si token expiró, reintenta una vez (incluye scale)
+                        if r.status_code in (401, 403):
+                            await sess.refresh()
+                            await sess.ensure_scaled()
+                            headers["Authorization"] = f"Bearer {sess.token}"
+                            async with httpx.AsyncClient(timeout=budget.timeout("order")) as client:
+                                r = await client.put(url, params=params, content=xml_body, headers=headers)
+                                if r.status_code == 405:
+                                    r = await client.post(url, params=params, content=xml_body, headers=headers)
+                    except httpx.TimeoutException:
+                        raise budget.expired("order", f"Timeout enviando B03 (IP {ip}). El concentrador no respondió a tiempo.")
+
+                    entry.update(status_code=r.status_code, latency_ms=(time.monotonic() - t_order) * 1000, fini=fini_ts, ffin=fend_ts)
+                    if r.status_code != 200:
+                        raise HTTPException(status_code=502, detail=f"GEDE order B03 falló ({r.status_code}): {r.text[:400]}")
+
+                    raw_text = r.text
+                    content_type = (r.headers.get("content-type") or "").lower()
+
+                    data = _decode_response(r)
+                    entry["ok"] = True
+                    events.publish("order", meter=meter_id_int, conc_id=conc_id, action=entry["action"], ok=True, source="order")
+
+
+                    # Luego de ejecutar B03, interrogamos S01 para leer el estado del relé (Eacti)
+                    relay_eacti = None
+                    t_confirm = time.monotonic()
+                    try:
+                        import asyncio
+                        await asyncio.sleep(1.5)  # pequeña espera para que el estado se estabilice
+                        url_s01 = base_url.rstrip("/") + "/report/S01"
+                        params_s01 = {"idMeters": cir, "priority": payload.priority}
+                        async with httpx.AsyncClient(timeout=budget.timeout("poll")) as client:
+                            r2 = await client.get(url_s01, params=params_s01, headers={"Authorization": f"Bearer {sess.token}"})
+                        if r2.status_code == 200:
+                            s01 = _decode_response(r2, S01_CONFIRM_FIELDS, limit=1)
+                            relay_eacti = _extract_eacti(s01)
+                            _remember_s01(meter_id_int, conc_id, s01, "order", partial=True)
+                    except Exception:
+                        relay_eacti = None
+                    entry.update(eacti=relay_eacti, confirm_ms=(time.monotonic() - t_confirm) * 1000)
+                    if relay_eacti is not None:
+                        events.publish("relay", meter=meter_id_int, conc_id=conc_id, eacti=relay_eacti, source="order")
+
+                    return {
+                        "ip": ip,
+                        "conc_id": conc_id,
+                        "base_url": base_url,
+                        "report_name": "B03",
+                        "meter": cir,
+                        "order": payload.order,
+                        "content_type": content_type,
+                        "data": plain(data),
+                        "raw": raw_text,
+                        "relay_eacti": relay_eacti,
+                        "estado": events.estado(relay_eacti),
+                    }
+    except Exception as e:
+        entry["error"] = str(getattr(e, "detail", e))
+        events.publish("order", meter=meter_id_int, conc_id=conc_id, action=entry["action"], ok=False, error=entry["error"], source="order")
+        raise
+    finally:
+        # lo que se leyó mientras la orden estaba en vuelo tampoco vale
+        _forget_reads(cir, meter_id_int)
+        entry["total_ms"] = (time.monotonic() - started) * 1000
+        order_journal.record(entry)
+
+
+def _load_catalog_map(cat_path: str) -> Dict[int, Dict[str, Any]]:
+    """Catálogo NIS/Nombre por medidor (provisorio: Excel). Bloqueante: corre en el pool de carga."""
+    import openpyxl
 
     cat_map: Dict[int, Dict[str, Any]] = {}
     if os.path.exists(cat_path):
@@ -785,9 +1205,19 @@ async def send_order_massive(
                     }
         except Exception:
             cat_map = {}
+    return cat_map
+
+
+# Catálogo cadena_electrica_georreferenciacion.xlsx (se recarga si cambia)
+_CATALOG: Reloadable[Dict[int, Dict[str, Any]]] = Reloadable(
+    "cadena_electrica", lambda: get_settings().cadena_electrica_xlsx_path, _load_catalog_map
+)
+
+
+def _parse_uploaded_meters(content: bytes) -> List[int]:
+    """Medidores del Excel subido (columna medidor/meter/... o la primera). Bloqueante."""
+    import openpyxl
 
-    # --- Leer archivo subido con lista de medidores ---
-    content = await file.read()
     try:
         wb2 = openpyxl.load_workbook(io.BytesIO(content), data_only=True)
     except Exception:
@@ -821,6 +1251,13 @@ async def send_order_massive(
         if mid is None:
             continue
         meters.append(mid)
+    return meters
+
+
+async def _read_massive_upload(file: UploadFile) -> List[int]:
+    """Medidores del Excel subido, sin repetidos y en el orden del archivo."""
+    content = await file.read()
+    meters = await loaders.run(_parse_uploaded_meters, content)
 
     # dedup manteniendo orden
     seen = set()
@@ -828,31 +1265,62 @@ async def send_order_massive(
 
     if not meters:
         raise HTTPException(status_code=400, detail="El archivo no contiene medidores válidos.")
+    return meters
 
-    act_ts = _to_stg_ts(actdate)
-    if not act_ts:
-        raise HTTPException(status_code=400, detail="Fecha inválida (ActDate).")
 
-    results: List[Dict[str, Any]] = []
+async def _run_massive(
+    request: Request,
+    lanes: List[List[int]],
+    order: int,
+    act_ts: str,
+    priority: int,
+    id_pet: int,
+    batch_id: str,
+) -> List[Dict[str, Any]]:
+    """Ejecuta B03 + S01 por medidor. Cada carril va en secuencia; los carriles, en paralelo.
+
+    Los resultados vuelven en el orden de los carriles (carril 0 primero).
+    """
+    # --- Catálogo NIS/Nombre/Medidor: parseo fuera del loop ---
+    s = get_settings()
+    cat_map = await _CATALOG.get()
+    index = await _meter_index_async()
+
+    user = await _client_key(request)
+    # cada medidor tiene su presupuesto B03, sin pasarse del deadline del cliente
+    client_deadline = budget.client_deadline(request)
 
-    # --- secuencial para no saturar sesiones del concentrador ---
-    for mid in meters:
+    accion = "corte" if order == 0 else "reconexion"
+    total = sum(len(l) for l in lanes)
+    results: Dict[int, Dict[str, Any]] = {}
+    progress = {"done": 0}
+
+    async def _one(mid: int) -> Dict[str, Any]:
         cir, mid_int = _normalize_cir(str(mid))
         conc_id = None
         ip = None
         base_url = None
-        token: Optional[str] = None
         relay_eacti = None
         ok = False
         err = None
+        status_code = None
+        latency_ms = None
+        confirm_ms = None
+        started = time.monotonic()
+        turn = AsyncExitStack()
+        _forget_reads(cir, mid_int)
 
         try:
-            conc_id, ip = _resolve_conc_and_ip_for_meter(mid_int)
+            turn.enter_context(budget.scope(budget.start("B03", deadline=client_deadline)))
+            conc_id, ip = _resolve_conc_and_ip_for_meter(mid_int, index)
             api_base = getattr(s, "gede_api_base", "/api/v1")
             base_url = f"http://{ip}{api_base}"
 
-            token = await _gede_login(base_url)
-            await _gede_scale(base_url, token)
+            # carril de fondo: un /report u /order interactivo al mismo concentrador pasa primero
+            await turn.enter_async_context(dispatch.slot(ip, dispatch.BACKGROUND, user))
+
+            sess = await turn.enter_async_context(gede_tokens.lease(base_url))
+            await sess.ensure_scaled()
 
             xml_body = (
                 f'<Order xmlns="http://stgdc/ws/B03" IdReq="B03" IdPet="{id_pet}" Version="4.0">'
@@ -864,39 +1332,34 @@ async def send_order_massive(
 
             url = base_url.rstrip("/") + "/order"
             params = {"priority": priority}
-            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/xml"}
+            headers = {"Authorization": f"Bearer {sess.token}", "Content-Type": "application/xml"}
 
-            async with httpx.AsyncClient(timeout=120) as client:
+            t_order = time.monotonic()
+            async with httpx.AsyncClient(timeout=budget.timeout("order")) as client:
                 r = await client.put(url, params=params, content=xml_body, headers=headers)
                 if r.status_code == 405:
                     r = await client.post(url, params=params, content=xml_body, headers=headers)
+            status_code = r.status_code
+            latency_ms = (time.monotonic() - t_order) * 1000
 
             if r.status_code != 200:
                 raise Exception(f"B03 falló ({r.status_code}): {r.text[:200]}")
 
             # --- luego S01 para leer Eacti ---
+            t_confirm = time.monotonic()
             await asyncio.sleep(1.5)
             url_s01 = base_url.rstrip("/") + "/report/S01"
             params_s01 = {"idMeters": cir, "priority": priority}
-            async with httpx.AsyncClient(timeout=120) as client:
-                r2 = await client.get(url_s01, params=params_s01, headers={"Authorization": f"Bearer {token}"})
+            async with httpx.AsyncClient(timeout=budget.timeout("poll")) as client:
+                r2 = await client.get(url_s01, params=params_s01, headers={"Authorization": f"Bearer {sess.token}"})
 
             if r2.status_code == 200:
-                raw2 = r2.text
-                data2: Any = None
-                try:
-                    data2 = r2.json()
-                except Exception:
-                    data2 = None
-                if data2 is None:
-                    parsed_csv2 = _try_parse_csv(raw2)
-                    if parsed_csv2 is not None:
-                        data2 = parsed_csv2
-                if data2 is None:
-                    parsed_xml2 = _xml_report_to_rows(raw2)
-                    if parsed_xml2 is not None:
-                        data2 = parsed_xml2
-                relay_eacti = _extract_eacti(data2)
+                s01 = _decode_response(r2, S01_CONFIRM_FIELDS, limit=1)
+                relay_eacti = _extract_eacti(s01)
+                _remember_s01(mid_int, conc_id, s01, "order_massive", partial=True)
+            confirm_ms = (time.monotonic() - t_confirm) * 1000
+            if relay_eacti is not None:
+                events.publish("relay", meter=mid_int, conc_id=conc_id, eacti=relay_eacti, source="order_massive")
 
             ok = True
 
@@ -904,26 +1367,168 @@ async def send_order_massive(
             ok = False
             err = str(e)
 
+        except asyncio.CancelledError:
+            # lote cortado (operador cerró la página): la orden igual pudo haber salido
+            err = "cancelado"
+            raise
+
         finally:
-            if token and base_url:
-                try:
-                    await _gede_logout(base_url, token)
-                except Exception:
-                    pass
-                _TOKEN_CACHE.pop(base_url, None)
+            _forget_reads(cir, mid_int)
+            try:
+                await turn.aclose()
+            finally:
+                order_journal.record({
+                    "meter": mid_int,
+                    "conc_id": conc_id,
+                    "ip": ip,
+                    "action": accion,
+                    "order_value": order,
+                    "source": "order_massive",
+                    "user": user,
+                    "id_pet": id_pet,
+                    "fini": act_ts,
+                    "ffin": act_ts,
+                    "status_code": status_code,
+                    "ok": status_code == 200,
+                    "error": err,
+                    "eacti": relay_eacti,
+                    "latency_ms": latency_ms,
+                    "confirm_ms": confirm_ms,
+                    "total_ms": (time.monotonic() - started) * 1000,
+                })
 
         info = cat_map.get(mid_int, {})
-        results.append({
+        return {
             "nis": info.get("nis"),
             "nombre": info.get("nombre"),
             "medidor": mid_int,
-            "accion": "corte" if order == 0 else "reconexion",
+            "accion": accion,
             "eacti": relay_eacti,
-            "estado": ("Conectado" if str(relay_eacti) == "1" else "Desconectado" if str(relay_eacti) == "0" else None),
+            "estado": events.estado(relay_eacti),
             "ok": ok,
             "error": err,
             "ip": ip,
             "concentrador": conc_id,
-        })
+        }
+
+    async def _lane(items: List[Tuple[int, int]]) -> None:
+        # --- secuencial dentro del carril para no saturar sesiones del concentrador ---
+        for pos, mid in items:
+            row = await _one(mid)
+            results[pos] = row
+            progress["done"] += 1
+            events.publish(
+                "batch", meter=row["medidor"], conc_id=row["concentrador"], batch=batch_id or None, phase="progress",
+                action=accion, done=progress["done"], total=total, ok=row["ok"], error=row["error"], eacti=row["eacti"],
+            )
+
+    positions = iter(range(total))
+    numbered = [[(next(positions), mid) for mid in lane] for lane in lanes]
+
+    async def _run_all() -> None:
+        events.publish("batch", batch=batch_id or None, phase="start", action=accion, total=total)
+        await asyncio.gather(*(_lane(items) for items in numbered if items))
+        events.publish(
+            "batch", batch=batch_id or None, phase="end", action=accion,
+            total=total, ok=sum(1 for x in results.values() if x["ok"]),
+        )
+
+    # si el operador cierra la página se corta el lote (medidores en curso incluidos)
+    await disconnect.guard(request, _run_all(), "order_massive")
+
+    return [results[i] for i in sorted(results)]
+
+
+@router.post("/order_massive")
+async def send_order_massive(
+    request: Request,
+    order: int = Form(..., description="0=corte, 1=reconexion"),
+    actdate: str = Form(..., description="Fecha ISO (ActDate)"),
+    priority: int = Form(2),
+    id_pet: int = Form(0),
+    batch_id: str = Form("", max_length=64, description="Id para seguir el avance por /api/live/ws?batch="),
+    file: UploadFile = File(..., description="Excel con lista de medidores"),
+):
+    """Envía B03 masivo leyendo un Excel de medidores, y luego interroga S01 para obtener Eacti por cada uno.
+
+    Devuelve una tabla con NIS/Nombre/Medidor/Estado para dar visibilidad de la tarea.
+    Para estimar la duración y repartir por concentrador antes de enviar: /order_massive/plan.
+    """
+    meters = await _read_massive_upload(file)
+
+    act_ts = _to_stg_ts(actdate)
+    if not act_ts:
+        raise HTTPException(status_code=400, detail="Fecha inválida (ActDate).")
+
+    results = await _run_massive(request, [meters], order, act_ts, priority, id_pet, batch_id)
+    return {"count": len(results), "results": results}
 
-    return {"count": len(results), "results": results}
\ No newline at end of file
+
+@router.post("/order_massive/plan")
+async def plan_order_massive(
+    order: int = Form(..., description="0=corte, 1=reconexion"),
+    actdate: str = Form(..., description="Fecha ISO (ActDate)"),
+    priority: int = Form(2),
+    id_pet: int = Form(0),
+    parallel: int = Form(1, ge=1, description="Concentradores atendidos a la vez (tope ORDER_MASSIVE_MAX_PARALLEL)"),
+    window: str = Form("", description="Ventana de mantenimiento HH:MM-HH:MM (opcional): indica si el plan entra"),
+    file: UploadFile = File(..., description="Excel con lista de medidores"),
+):
+    """Corrida en seco de /order_massive: no envía nada.
+
+    Resuelve concentradores, lista los medidores desconocidos, estima la duración
+    con la bitácora de órdenes y reparte los concentradores en carriles (app.order_plan).
+    El plan se ejecuta tal cual con POST /order_massive/plan/{plan_id}/run.
+    """
+    s = get_settings()
+    meters = await _read_massive_upload(file)
+    act_ts = _to_stg_ts(actdate)
+    if not act_ts:
+        raise HTTPException(status_code=400, detail="Fecha inválida (ActDate).")
+
+    index = await _meter_index_async()
+    since = time.time() - s.order_plan_history_days * 86400
+    stats = await loaders.run(order_journal.latency_stats, since)
+    try:
+        plan = order_plan.build(meters, index, stats, min(parallel, max(1, s.order_massive_max_parallel)), window.strip() or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    plan.update(
+        order=order,
+        accion="corte" if order == 0 else "reconexion",
+        actdate=actdate,
+        priority=priority,
+        id_pet=id_pet,
+        created_at=time.time(),
+        expires_at=time.time() + s.order_plan_ttl_s,
+        _act_ts=act_ts,
+    )
+    plan_id = order_plan.store().put(plan)
+    return {"plan_id": plan_id, **order_plan.public(plan)}
+
+
+@router.get("/order_massive/plan/{plan_id}")
+def get_order_massive_plan(plan_id: str):
+    plan = order_plan.store().get(plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="El plan no existe, venció o ya se ejecutó.")
+    return {"plan_id": plan_id, **order_plan.public(plan)}
+
+
+@router.post("/order_massive/plan/{plan_id}/run")
+async def run_order_massive_plan(
+    plan_id: str,
+    request: Request,
+    batch_id: str = Form("", max_length=64, description="Id para seguir el avance por /api/live/ws?batch="),
+):
+    """Ejecuta un plan de /order_massive/plan: mismos medidores, carriles y orden (una sola vez)."""
+    plan = order_plan.store().take(plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="El plan no existe, venció o ya se ejecutó.")
+    # los desconocidos no llegan a ningún concentrador: se informan como error al principio
+    lanes = [list(lane) for lane in plan["_lanes"]]
+    lanes[0] = list(plan["unknown"]) + lanes[0]
+    results = await _run_massive(
+        request, lanes, plan["order"], plan["_act_ts"], plan["priority"], plan["id_pet"], batch_id
+    )
+    return {"plan_id": plan_id, "est_s": plan["est_s"], "count": len(results), "results": results}
\ No newline at end of file
@@ -0,0 +1,91 @@
+import functools
+import logging
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app import loaders, order_journal as journal
+from app.routers.meters import _normalize_cir
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/orders", tags=["orders"])
+
+_ACTIONS = {"corte": "corte", "0": "corte", "reconexion": "reconexion", "reconexión": "reconexion", "1": "reconexion"}
+
+
+def _parse_when(v: Optional[str], name: str) -> Optional[float]:
+    """'2024-05-01' o '2024-05-01T13:00[:00]' (hora local del servidor) -> epoch."""
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(v.strip()).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida en '{name}': {v}")
+
+
+def _meter_id(meter: str) -> int:
+    return _normalize_cir(meter)[1]
+
+
+async def _flush() -> None:
+    """Graba lo pendiente antes de consultar. Si falla se consulta igual (lo pendiente se reintenta)."""
+    try:
+        await journal.flush()
+    except Exception:
+        log.warning("No se pudo grabar la bitácora de órdenes antes de consultarla", exc_info=True)
+
+
+@router.get("")
+async def list_orders(
+    meter: Optional[str] = None,
+    conc_id: Optional[int] = None,
+    action: Optional[str] = Query(None, description="corte | reconexion"),
+    since: Optional[str] = Query(None, description="Desde (ISO, incluido)"),
+    until: Optional[str] = Query(None, description="Hasta (ISO, excluido)"),
+    ok: Optional[bool] = None,
+    limit: int = Query(100, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
+):
+    """Órdenes registradas (más nuevas primero). Ej.: cortes del concentrador X ayer:
+    ?conc_id=X&action=corte&since=2024-05-01&until=2024-05-02
+    """
+    act = None
+    if action:
+        act = _ACTIONS.get(action.strip().lower())
+        if act is None:
+            raise HTTPException(status_code=400, detail="action debe ser 'corte' o 'reconexion'.")
+    query = functools.partial(
+        journal.search,
+        meter=_meter_id(meter) if meter else None,
+        conc_id=conc_id,
+        action=act,
+        since=_parse_when(since, "since"),
+        until=_parse_when(until, "until"),
+        ok=ok,
+        limit=limit,
+        offset=offset,
+    )
+    await _flush()
+    rows = await loaders.run(query)
+    return {"count": len(rows), "offset": offset, "limit": limit, "orders": rows}
+
+
+@router.get("/last/{meter}")
+async def last_order(meter: str):
+    """Última orden enviada a un medidor."""
+    mid = _meter_id(meter)
+    await _flush()
+    row = await loaders.run(journal.last_for_meter, mid)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No hay órdenes registradas para el medidor {mid}.")
+    return row
+
+
+@router.get("/stats")
+async def order_stats(since: Optional[str] = None, until: Optional[str] = None):
+    """Cantidad, % ok y latencias por concentrador."""
+    t0, t1 = _parse_when(since, "since"), _parse_when(until, "until")
+    await _flush()
+    return {"concentrators": await loaders.run(journal.latency_stats, t0, t1)}
@@ -4,11 +4,13 @@ import json
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
 import openpyxl
 
+from app import loaders, prefetch
+from app.table import Table, TableBuilder
 
 router = APIRouter(prefix="/api/tecnica", tags=["tecnica"])
 
@@ -25,20 +27,20 @@ def _safe_str(v: Any) -> str:
     return str(v).strip()
 
 
-def _load_facturacion_rows() -> List[Dict[str, Any]]:
-    """Carga Facturacion.xlsx a memoria.
+def _load_facturacion_rows() -> Table:
+    """Carga Facturacion.xlsx a memoria (tabla compacta por columnas, ver app.table).
 
     Se usa como fuente provisional hasta integrar Postgres.
     """
     if not FACTURACION_XLSX.exists():
-        return []
+        return Table((), {}, {}, 0)
     wb = openpyxl.load_workbook(str(FACTURACION_XLSX), data_only=True)
     ws = wb[wb.sheetnames[0]]
 
     headers = [ws.cell(row=1, column=c).value for c in range(1, ws.max_column + 1)]
     norm_headers = [_safe_str(h) for h in headers]
 
-    out: List[Dict[str, Any]] = []
+    out = TableBuilder()
     for r in range(2, ws.max_row + 1):
         row = {}
         empty = True
@@ -49,15 +51,15 @@ def _load_facturacion_rows() -> List[Dict[str, Any]]:
                 empty = False
             row[key] = val
         if not empty:
-            out.append(row)
-    return out
+            out.add(row)
+    return out.build()
 
 
 # Cache simple en memoria
-_FACT_ROWS: Optional[List[Dict[str, Any]]] = None
+_FACT_ROWS: Optional[Table] = None
 
 
-def _get_fact_rows() -> List[Dict[str, Any]]:
+def _get_fact_rows() -> Table:
     global _FACT_ROWS
     if _FACT_ROWS is None:
         _FACT_ROWS = _load_facturacion_rows()
@@ -68,31 +70,34 @@ def _norm_q(q: str) -> str:
     return " ".join(q.lower().strip().split())
 
 
-def _match_row(row: Dict[str, Any], q: str) -> bool:
-    # Campos comunes
-    nis = _safe_str(row.get("NIS"))
-    med = _safe_str(row.get("Medidor"))
-    nombre = _safe_str(row.get("Nombre"))
-    return q in _norm_q(nis) or q in _norm_q(med) or q in _norm_q(nombre)
+def _match_indices(rows: Table, q: str) -> List[int]:
+    # Campos comunes (por columna, sin armar un dict por fila)
+    fields = [rows.column(c) for c in ("NIS", "Medidor", "Nombre")]
+    return [i for i in range(len(rows)) if any(q in _norm_q(_safe_str(col[i])) for col in fields)]
 
 
 @router.get("/lookup")
-def lookup(query: str):
+async def lookup(query: str, request: Request):
     q = _norm_q(query)
     if not q:
         raise HTTPException(status_code=400, detail="query vacío")
 
-    rows = _get_fact_rows()
-    matches = [r for r in rows if _match_row(r, q)]
+    rows = await loaders.run(_get_fact_rows)
+    hits = await loaders.run(_match_indices, rows, q)
 
-    if not matches:
+    if not hits:
         return {"found": False, "matches": []}
+    matches = rows.take(hits[:25])
+
+    # Un único cliente: casi seguro el próximo paso es su S01, se adelanta en segundo plano
+    prefetching = len(hits) == 1 and await prefetch.schedule(matches[0].get("Medidor"), request)
 
     # Devuelve el primer match y además una lista acotada
     return {
         "found": True,
         "match": matches[0],
         "matches": matches[:25],
+        "prefetch": prefetching,
     }
 
 
@@ -0,0 +1,211 @@
+"""Sesiones de la app (login local) con backend intercambiable.
+
+- "sqlite" (por defecto): archivo compartido por todos los procesos de
+  `uvicorn --workers N`, así un token emitido por un worker vale en los demás.
+- "memory": dict en el proceso (un solo worker / pruebas).
+
+Ambos expiran sesiones por TTL (deslizante: cada uso la renueva) y, si se
+supera SESSION_MAX, desalojan las menos usadas (LRU).
+
+Encima hay un cache de lectura en el proceso con TTL corto (SESSION_CACHE_TTL_S)
+para que /api/auth/me no vaya al archivo en cada llamada. Un logout hecho en
+otro worker puede tardar hasta ese TTL en verse acá.
+
+El store SQLite espera hasta 10 s por el lock entre workers: desde código
+async se usa `lookup_async` (cache en el loop; si hay que ir al archivo, en un
+hilo).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.config import get_settings
+
+
+class MemorySessionStore:
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # token -> (expira, data); orden = uso (LRU al principio)
+        self._data: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, token: str, data: dict) -> None:
+        with self._lock:
+            self._data[token] = (time.time() + self.ttl_s, data)
+            self._data.move_to_end(token)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, token: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(token)
+            if hit is None:
+                return None
+            exp, data = hit
+            if exp <= now:
+                self._data.pop(token, None)
+                return None
+            self._data[token] = (now + self.ttl_s, data)
+            self._data.move_to_end(token)
+            return data
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._data.pop(token, None)
+
+    def purge(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [t for t, (exp, _) in self._data.items() if exp <= now]
+            for t in dead:
+                self._data.pop(t, None)
+            return len(dead)
+
+    def count(self) -> int:
+        return len(self._data)
+
+
+class SqliteSessionStore:
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        token TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires_at);
+    CREATE INDEX IF NOT EXISTS ix_sessions_last_seen ON sessions (last_seen);
+    """
+
+    def __init__(self, path: str, ttl_s: float, max_entries: int):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # renovar el vencimiento como mucho cada esto (evita una escritura por request)
+        self.touch_every_s = min(60.0, ttl_s / 10)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._SCHEMA)
+
+    def put(self, token: str, data: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, data, created_at, last_seen, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (token, json.dumps(data, ensure_ascii=False), now, now, now + self.ttl_s),
+            )
+            n = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            if n > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE token IN (SELECT token FROM sessions ORDER BY last_seen ASC LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+
+    def get(self, token: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, last_seen, expires_at FROM sessions WHERE token = ?", (token,)
+            ).fetchone()
+            if row is None:
+                return None
+            data, last_seen, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+                return None
+            if now - last_seen >= self.touch_every_s:
+                self._conn.execute(
+                    "UPDATE sessions SET last_seen = ?, expires_at = ? WHERE token = ?",
+                    (now, now + self.ttl_s, token),
+                )
+        try:
+            return json.loads(data)
+        except Exception:
+            return None
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def purge(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            return cur.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+_STORE: Dict[str, object] = {"store": None, "key": None}
+# token -> (vence_cache, data | None)
+_READ_CACHE: Dict[str, Tuple[float, Optional[dict]]] = {}
+_READ_CACHE_MAX = 10000
+
+
+def get_store():
+    s = get_settings()
+    key = (s.session_backend, s.session_db_path, s.session_ttl_s, s.session_max)
+    if _STORE["store"] is None or _STORE["key"] != key:
+        if s.session_backend == "memory":
+            _STORE["store"] = MemorySessionStore(s.session_ttl_s, s.session_max)
+        else:
+            _STORE["store"] = SqliteSessionStore(s.session_db_path, s.session_ttl_s, s.session_max)
+        _STORE["key"] = key
+        _READ_CACHE.clear()
+    return _STORE["store"]
+
+
+def create(token: str, data: dict) -> None:
+    store = get_store()
+    # los logins son poco frecuentes: buen momento para limpiar vencidas
+    store.purge()
+    store.put(token, data)
+    _READ_CACHE.pop(token, None)
+
+
+def _cached(token: str) -> Optional[Tuple[float, Optional[dict]]]:
+    hit = _READ_CACHE.get(token)
+    if hit is not None and hit[0] > time.monotonic() and get_settings().session_cache_ttl_s > 0:
+        return hit
+    return None
+
+
+def lookup(token: str, cached: bool = True) -> Optional[dict]:
+    """Sesión del token (o None). Con `cached`, usa el cache de lectura del proceso."""
+    store = get_store()
+    ttl = get_settings().session_cache_ttl_s
+    now = time.monotonic()
+    if cached:
+        hit = _cached(token)
+        if hit is not None:
+            return hit[1]
+    data = store.get(token)
+    if cached and ttl > 0:
+        if len(_READ_CACHE) >= _READ_CACHE_MAX:
+            _READ_CACHE.clear()
+        _READ_CACHE[token] = (now + ttl, data)
+    return data
+
+
+async def lookup_async(token: str) -> Optional[dict]:
+    """`lookup` para el event loop: el cache se consulta acá; el store, en un hilo."""
+    hit = _cached(token)
+    if hit is not None:
+        return hit[1]
+    return await asyncio.to_thread(lookup, token)
+
+
+def remove(token: str) -> None:
+    get_store().delete(token)
+    _READ_CACHE.pop(token, None)
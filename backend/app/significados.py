@@ -1,35 +1,34 @@
+import hashlib
+import json
 import os
 from typing import Dict
 
 from fastapi import HTTPException
 
 from app.config import get_settings
+from app.loaders import Reloadable
 
-_SIG_CACHE = {"mtime": None, "map": {}}  # type: ignore
+_SIG_CACHE = {"key": None, "etag": None}  # type: ignore
 
 
-def load_significados() -> Dict[str, str]:
+def _significados_path() -> str:
+    s = get_settings()
+    xlsx_path = getattr(s, "significados_xlsx_path", None) or os.path.join(os.path.dirname(__file__), "..", "data", "Biblioteca Significados.xlsx")
+    return os.path.abspath(xlsx_path)
+
+
+def _read_significados(xlsx_path: str) -> Dict[str, str]:
     """Carga el diccionario de significados desde un XLSX.
 
     Estructura esperada (Hoja 1):
       Col A: Denominación (ej: Vf, L1v, Pimp, ...)
       Col B: Significado
-
-    Cachea por mtime.
     """
     import openpyxl
 
-    s = get_settings()
-    xlsx_path = getattr(s, "significados_xlsx_path", None) or os.path.join(os.path.dirname(__file__), "..", "data", "Biblioteca Significados.xlsx")
-    xlsx_path = os.path.abspath(xlsx_path)
-
     if not os.path.exists(xlsx_path):
         raise HTTPException(status_code=500, detail=f"No se encontró el archivo de significados: {xlsx_path}")
 
-    mtime = os.path.getmtime(xlsx_path)
-    if _SIG_CACHE["mtime"] == mtime and _SIG_CACHE["map"]:
-        return _SIG_CACHE["map"]
-
     wb = openpyxl.load_workbook(xlsx_path, data_only=True)
     ws = wb.active
 
@@ -44,7 +43,51 @@ def load_significados() -> Dict[str, str]:
         if not k or not v:
             continue
         mapping[k] = v
-
-    _SIG_CACHE["mtime"] = mtime
-    _SIG_CACHE["map"] = mapping
     return mapping
+
+
+# Cacheado por mtime; la recarga corre en el pool de carga (ver app.loaders)
+_SIGNIFICADOS: Reloadable[Dict[str, str]] = Reloadable("Biblioteca Significados", _significados_path, _read_significados)
+
+
+def load_significados() -> Dict[str, str]:
+    """Mapping {código: significado} para código sync (endpoints `def`)."""
+    return _SIGNIFICADOS.get_sync()
+
+
+async def load_significados_async() -> Dict[str, str]:
+    """Igual que `load_significados` sin bloquear el loop."""
+    return await _SIGNIFICADOS.get()
+
+
+def significados_etag() -> str:
+    """ETag fuerte del mapping actual (mtime del XLSX + hash del contenido).
+
+    Se recalcula sólo cuando cambia el archivo (misma invalidación que el mapping).
+    """
+    mapping = load_significados()
+    key = _SIGNIFICADOS.key
+    if not _SIG_CACHE.get("etag") or _SIG_CACHE["key"] != key:
+        body = json.dumps(mapping, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        _SIG_CACHE["etag"] = f'"sig-{int(key[1] or 0)}-{digest}"'
+        _SIG_CACHE["key"] = key
+    return _SIG_CACHE["etag"]
+
+
+# Claves básicas que no están en el Excel (mismo criterio que medidores.js)
+_EXTRA_MEANINGS = {"Cnc.Id": "ID del concentrador", "Cnt.Id": "ID del medidor"}
+
+
+def meaning_for(code: str, mapping: Dict[str, str]) -> str:
+    """Significado de una columna de reporte (igual que `_fieldMeaning` del frontend).
+
+    Prueba la clave completa y, si viene con prefijo ('Cnt.Vf'), la parte final;
+    tolera la confusión I/l del Excel (AIa vs Ala).
+    """
+    base = code.split(".")[-1] if "." in code else code
+    for k in (code, base):
+        for cand in (k, k.replace("I", "l"), k.replace("l", "I")):
+            if cand in mapping:
+                return mapping[cand]
+    return _EXTRA_MEANINGS.get(code, "")
@@ -0,0 +1,81 @@
+"""Coalescencia de llamadas idénticas en vuelo ("singleflight").
+
+Si llegan varias lecturas iguales (misma clave) mientras la primera todavía
+está hablando con el concentrador, todas esperan ese mismo resultado en lugar
+de abrir otra sesión. Después de terminar, el resultado se conserva unos
+segundos (`grace_s`) para absorber doble-clicks. Los errores no se conservan.
+Si todos los que esperaban una llamada se van (cancelados), la llamada se cancela.
+`forget` descarta lo conservado (y lo que está en vuelo) cuando el dato dejó de
+valer, p.ej. tras una orden al medidor.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set, Tuple
+
+
+class SingleFlight:
+    def __init__(self, grace_s: float = 0.0):
+        self.grace_s = grace_s
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # por llamada (no por clave: tras `forget` puede haber dos llamadas con la misma clave)
+        self._waiters: Dict[asyncio.Task, int] = {}
+        # clave -> (vence, resultado)
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        # llamadas en vuelo olvidadas: terminan para quien ya espera, pero no se conservan
+        self._stale: Set[asyncio.Task] = set()
+
+    def _purge(self, now: float) -> None:
+        for k in [k for k, (exp, _) in self._recent.items() if exp <= now]:
+            self._recent.pop(k, None)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Ejecuta `fn()` una sola vez por clave. Devuelve (resultado, compartido)."""
+        now = time.monotonic()
+        self._purge(now)
+        hit = self._recent.get(key)
+        if hit is not None:
+            return hit[1], True
+
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.get_running_loop().create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        # shield: si el cliente que inició la llamada se va, el resto sigue esperando
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if self._waiters.get(task, 0) <= 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            n = self._waiters.get(task, 0) - 1
+            if n > 0:
+                self._waiters[task] = n
+            else:
+                self._waiters.pop(task, None)
+
+    def forget(self, match: Callable[[Hashable], bool]) -> int:
+        """Olvida las claves para las que `match(clave)` es True. Devuelve cuántas."""
+        keys = [k for k in self._recent if match(k)]
+        for k in keys:
+            self._recent.pop(k, None)
+        # una llamada en vuelo pudo leer antes del cambio: los nuevos pedidos no se suman a ella
+        flying = [k for k in self._inflight if match(k)]
+        for k in flying:
+            self._stale.add(self._inflight.pop(k))
+        return len(keys) + len(flying)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if task in self._stale:
+            self._stale.discard(task)
+            return
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key, None)
+        if self.grace_s > 0 and not task.cancelled() and task.exception() is None:
+            self._recent[key] = (time.monotonic() + self.grace_s, task.result())
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "recent": len(self._recent)}
@@ -0,0 +1,173 @@
+"""Tabla compacta para filas de reportes y de Facturacion.
+
+Una lista de dicts repite en cada fila las mismas claves y, en los reportes
+XML, los mismos atributos de Report/Cnc/Cnt. `Table` guarda:
+
+- los nombres de columna una sola vez (internados);
+- los valores por columna (una lista por columna, no un dict por fila);
+- aparte, las columnas que valen lo mismo en todas las filas (`consts`):
+  Cnc.Id, Cnt.Id, recordTag, ... ocupan un valor y no N.
+
+Adentro del backend se trabaja con la tabla (cursores, caches, pool de
+decodificación); al responder se materializa con `plain()` / `rows()`.
+Claves ausentes en alguna fila se marcan con MISSING y no aparecen al
+materializar (no se inventan None).
+"""
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self) -> str:
+        # al desempaquetar en otro proceso vuelve a ser el mismo objeto
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class Table:
+    __slots__ = ("cols", "consts", "data", "n")
+
+    def __init__(self, cols: Sequence[str], consts: Dict[str, Any], data: Dict[str, List[Any]], n: int):
+        self.cols = tuple(cols)
+        self.consts = consts
+        self.data = data
+        self.n = n
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "Table":
+        b = TableBuilder()
+        for r in rows:
+            b.add(r)
+        return b.build()
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __bool__(self) -> bool:
+        return self.n > 0
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Table):
+            return NotImplemented
+        return self.n == other.n and self.rows() == other.rows()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.n):
+            yield self.row(i)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for c in self.cols:
+            col = self.data.get(c)
+            v = self.consts[c] if col is None else col[i]
+            if v is not MISSING:
+                out[c] = v
+        return out
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in range(*slice(start, stop).indices(self.n))]
+
+    def take(self, indices: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in indices]
+
+    def column(self, name: str) -> List[Any]:
+        """Valores de una columna (None donde falta la clave)."""
+        if name in self.consts:
+            return [self.consts[name]] * self.n
+        col = self.data.get(name)
+        if col is None:
+            return [None] * self.n
+        return [None if v is MISSING else v for v in col]
+
+    def value(self, i: int, name: str) -> Any:
+        if name in self.consts:
+            return self.consts[name]
+        col = self.data.get(name)
+        if col is None or col[i] is MISSING:
+            return None
+        return col[i]
+
+    @classmethod
+    def concat(cls, tables: Sequence["Table"]) -> "Table":
+        """Une tablas (p.ej. tramos de una misma lectura) en orden."""
+        tables = [t for t in tables if t.n]
+        if len(tables) == 1:
+            return tables[0]
+        cols: List[str] = []
+        seen = set()
+        for t in tables:
+            for c in t.cols:
+                if c not in seen:
+                    seen.add(c)
+                    cols.append(c)
+        n = sum(t.n for t in tables)
+        consts: Dict[str, Any] = {}
+        data: Dict[str, List[Any]] = {}
+        for c in cols:
+            vals = [t.consts[c] if c in t.consts else MISSING for t in tables]
+            if all(c in t.consts for t in tables) and _all_same(vals, vals[0]):
+                consts[c] = vals[0]
+                continue
+            col: List[Any] = []
+            for t in tables:
+                if c in t.consts:
+                    col.extend([t.consts[c]] * t.n)
+                elif c in t.data:
+                    col.extend(t.data[c])
+                else:
+                    col.extend([MISSING] * t.n)
+            data[c] = col
+        return cls(cols, consts, data, n)
+
+
+def _all_same(vals: Sequence[Any], first: Any) -> bool:
+    """Todos iguales a `first` y del mismo tipo (1, 1.0 y True no se confunden)."""
+    t = type(first)
+    return all(type(v) is t and v == first for v in vals)
+
+
+class TableBuilder:
+    """Arma una `Table` fila por fila sin conservar los dicts."""
+
+    def __init__(self) -> None:
+        self._cols: Dict[str, List[Any]] = {}
+        self._n = 0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        n = self._n
+        cols = self._cols
+        for k, v in row.items():
+            col = cols.get(k)
+            if col is None:
+                col = cols[sys.intern(k) if type(k) is str else k] = [MISSING] * n
+            col.append(v)
+        self._n = n + 1
+        if len(row) != len(cols):
+            for col in cols.values():
+                if len(col) == n:
+                    col.append(MISSING)
+
+    def build(self) -> Table:
+        consts: Dict[str, Any] = {}
+        data: Dict[str, List[Any]] = {}
+        for c, col in self._cols.items():
+            first = col[0] if col else MISSING
+            if self._n > 1 and first is not MISSING and _all_same(col, first):
+                consts[c] = first
+            else:
+                data[c] = col
+        return Table(list(self._cols), consts, data, self._n)
+
+
+def plain(data: Any) -> Any:
+    """Para responder: Table -> lista de dicts; lo demás tal cual."""
+    return data.rows() if isinstance(data, Table) else data
@@ -46,7 +46,7 @@ function setBrand(title, subtitle){
 
 async function loadBrand(){
   try{
-    const r = await fetch('/api/config', {cache:'no-store'});
+    const r = await fetch('/api/config', {cache:'no-cache'});
     if(r.ok){
       const c = await r.json();
       setBrand(c.appTitle, c.appSubtitle);
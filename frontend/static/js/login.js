@@ -1,7 +1,7 @@
 async function loadBrand(){
   // 1) desde backend (.env)
   try{
-    const r = await fetch('/api/config', {cache:'no-store'});
+    const r = await fetch('/api/config', {cache:'no-cache'});
     if(r.ok){
       const c = await r.json();
       if(c.appTitle) document.getElementById('appTitle').textContent = c.appTitle;
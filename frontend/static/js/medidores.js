@@ -13,7 +13,7 @@ function setBrand(title, subtitle){
 
 async function loadBrand(){
   try{
-    const r = await fetch('/api/config', {cache:'no-store'});
+    const r = await fetch('/api/config', {cache:'no-cache'});
     if(r.ok){
       const c = await r.json();
       setBrand(c.appTitle, c.appSubtitle);
@@ -31,7 +31,7 @@ async function loadBrand(){
 
 async function loadSignificados(){
   try{
-    const r = await fetch('/api/significados', {cache:'no-store'});
+    const r = await fetch('/api/significados', {cache:'no-cache'});
     if(r.ok){
       _sigMap = await r.json();
       return;
@@ -73,6 +73,11 @@ let _lastRows = null;
 let _lastRaw = null;
 let _sigMap = {};
 
+// Resultado paginado en el servidor (/api/meters/report con page_size)
+const PAGE_SIZE = 500;
+let _cursor = null;
+let _page = {offset:0, limit:PAGE_SIZE, sort:null, desc:false, q:'', matched:0, total:0};
+
 
 function renderMethodSelect(){
   const sel = document.getElementById('methodSelect');
@@ -171,6 +176,9 @@ function clearTable(){
 
   _lastRows = null;
   _lastRaw = null;
+  _cursor = null;
+  const pager = document.getElementById('pager');
+  if(pager) pager.style.display = 'none';
 }
 
 function _pick(obj, keys){
@@ -525,7 +533,65 @@ function renderJson(obj){
   _lastRows = null;
 }
 
+function renderPager(){
+  const pager = document.getElementById('pager');
+  if(!pager) return;
+  // Formulario (1 fila) no necesita paginador
+  if(!_cursor || _page.total <= 1){ pager.style.display = 'none'; return; }
+  pager.style.display = '';
+  const from = _page.matched ? _page.offset + 1 : 0;
+  const to = Math.min(_page.offset + _page.limit, _page.matched);
+  const filtered = _page.matched !== _page.total ? ` (filtradas de ${_page.total})` : '';
+  document.getElementById('pagerInfo').textContent = `Filas ${from}–${to} de ${_page.matched}${filtered}`;
+  document.getElementById('pagerPrev').disabled = _page.offset <= 0;
+  document.getElementById('pagerNext').disabled = to >= _page.matched;
+
+  // Orden por columna: click en el encabezado (otra vez = descendente)
+  document.querySelectorAll('#resultTable thead th').forEach(th => {
+    const col = th.textContent;
+    th.classList.add('sortable');
+    if(col === _page.sort) th.textContent = col + (_page.desc ? ' ▼' : ' ▲');
+    th.onclick = () => {
+      _page.desc = (_page.sort === col) ? !_page.desc : false;
+      _page.sort = col;
+      loadPage(0);
+    };
+  });
+}
+
+async function loadPage(offset){
+  if(!_cursor) return;
+  const qs = new URLSearchParams({offset:String(Math.max(0, offset)), limit:String(_page.limit), desc:String(_page.desc)});
+  if(_page.sort) qs.set('sort', _page.sort);
+  if(_page.q) qs.set('q', _page.q);
+  try{
+    const r = await fetch(`/api/meters/report/${encodeURIComponent(_cursor)}?${qs}`);
+    const data = await r.json().catch(() => ({}));
+    if(!r.ok){
+      setMsg((data && data.detail) ? String(data.detail) : ('HTTP ' + r.status), 'err');
+      return;
+    }
+    Object.assign(_page, {offset:data.offset, matched:data.matched, total:data.total});
+    if(data.rows && data.rows.length) renderTableFromObjects(data.rows);
+    else document.getElementById('resultTable').innerHTML = '<tbody><tr><td class="muted">Sin coincidencias</td></tr></tbody>';
+    renderPager();
+  }catch(e){
+    setMsg(e?.message || String(e), 'err');
+  }
+}
+
+function _downloadUrl(url, name){
+  const a = document.createElement('a');
+  a.href = url;
+  a.download = name;
+  document.body.appendChild(a);
+  a.click();
+  a.remove();
+}
+
 function downloadCsv(){
+  // Paginado: el CSV completo lo arma el servidor
+  if(_cursor){ _downloadUrl(`/api/meters/report/${encodeURIComponent(_cursor)}/csv`, 'resultado.csv'); return; }
   if(!_lastRows) return;
   const {rows, cols} = _lastRows;
   const lines = [];
@@ -545,6 +611,7 @@ function downloadCsv(){
   URL.revokeObjectURL(url);
 }
 function downloadXml(){
+  if(_cursor){ _downloadUrl(`/api/meters/report/${encodeURIComponent(_cursor)}/raw`, 'resultado.xml'); return; }
   if(!_lastRaw) return;
   const blob = new Blob([_lastRaw], {type:'application/xml;charset=utf-8'});
   const url = URL.createObjectURL(blob);
@@ -559,6 +626,27 @@ function downloadXml(){
 
 
 
+// Avance del B03 masivo por WebSocket (/api/live/ws?batch=...), sin repetir consultas
+function watchBatch(batchId){
+  let ws = null;
+  try{
+    const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    ws = new WebSocket(`${proto}//${location.host}/api/live/ws?batch=${encodeURIComponent(batchId)}`);
+  }catch(e){
+    return () => {};
+  }
+  ws.onmessage = (ev) => {
+    let e = null;
+    try{ e = JSON.parse(ev.data); }catch(_){ return; }
+    if(e && e.type === 'batch' && e.phase === 'progress'){
+      const estado = e.estado ? ` (${e.estado})` : (e.ok ? '' : ' (error)');
+      setMsg(`Procesando ${e.done}/${e.total}… último: ${e.meter}${estado}`, 'ok');
+    }
+  };
+  ws.onerror = () => {};
+  return () => { try{ ws.close(); }catch(_){} };
+}
+
 async function onLeer(){
   clearTable();
   setMsg('', '');
@@ -592,6 +680,8 @@ async function onLeer(){
     const btn = document.getElementById('btnLeer');
     btn.disabled = true;
     setMsg('Enviando…', 'ok');
+    const batchId = Date.now().toString(36) + Math.random().toString(36).slice(2, 8);
+    const stopWatch = watchBatch(batchId);
 
     try{
       const order = Number(document.getElementById('orderSelect')?.value || 0);
@@ -602,6 +692,7 @@ async function onLeer(){
       fd.append('actdate', act);
       fd.append('priority', String(priority));
       fd.append('id_pet', '0');
+      fd.append('batch_id', batchId);
 
       const r = await fetch('/api/meters/order_massive', { method:'POST', body: fd });
       const data = await r.json().catch(() => ({}));
@@ -627,6 +718,7 @@ async function onLeer(){
     }catch(e){
       setMsg(e?.message || String(e), 'err');
     }finally{
+      stopWatch();
       btn.disabled = false;
     }
     return;
@@ -654,7 +746,7 @@ async function onLeer(){
 
   try{
     let endpoint = '/api/meters/report';
-    let bodyObj = { meter, report_name: method, priority, fini, fend };
+    let bodyObj = { meter, report_name: method, priority, fini, fend, page_size: PAGE_SIZE };
 
     if(method === 'B03'){
       endpoint = '/api/meters/order';
@@ -676,6 +768,14 @@ async function onLeer(){
       return;
     }
 
+    // Resultado grande: sólo llega la primera página; el resto se pide con el cursor
+    _cursor = (data && data.cursor) ? data.cursor : null;
+    if(_cursor){
+      _page = {offset:0, limit:PAGE_SIZE, sort:null, desc:false, q:'', matched:data.page.matched, total:data.page.total};
+      const pf = document.getElementById('pagerFilter');
+      if(pf) pf.value = '';
+    }
+
     // Guardar raw para descarga XML cuando corresponda
     if(data && data.raw != null) _lastRaw = data.raw;
     else if(data && data.xml != null) _lastRaw = data.xml;
@@ -720,10 +820,24 @@ async function onLeer(){
       setMsg('OK.', 'ok');
     }
 
+    // Ventana larga leída por tramos: avisar qué rangos faltan
+    if(data && data.chunks && data.chunks.failed && data.chunks.failed.length){
+      const f = data.chunks.failed;
+      const rangos = f.slice(0, 3).map(x => `${x.fini} → ${x.fend}`).join('; ');
+      setMsg(`Lectura parcial: ${data.chunks.ok}/${data.chunks.count} tramos. Fallaron: ${rangos}${f.length > 3 ? '…' : ''}`, 'err');
+    }
+
+    // B03: estado del relé confirmado por el S01 posterior
+    if(method === 'B03' && data && data.estado){
+      setMsg(`OK. Relé: ${data.estado} (Eacti=${data.relay_eacti}).`, 'ok');
+    }
+
+    renderPager();
+
     // botones
-    document.getElementById('btnCsv').disabled = !_lastRows;
+    document.getElementById('btnCsv').disabled = !_lastRows && !_cursor;
     const bx = document.getElementById('btnXml');
-    if(bx) bx.disabled = !_lastRaw;
+    if(bx) bx.disabled = !_lastRaw && !_cursor;
 
   }catch(e){
     setMsg(e?.message || String(e), 'err');
@@ -754,4 +868,12 @@ function requireLogin(){
   document.getElementById('btnCsv').addEventListener('click', downloadCsv);
   const bx = document.getElementById('btnXml');
   if(bx) bx.addEventListener('click', downloadXml);
+
+  document.getElementById('pagerPrev').addEventListener('click', () => loadPage(_page.offset - _page.limit));
+  document.getElementById('pagerNext').addEventListener('click', () => loadPage(_page.offset + _page.limit));
+  let filterTimer = null;
+  document.getElementById('pagerFilter').addEventListener('input', (ev) => {
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(() => { _page.q = ev.target.value.trim(); loadPage(0); }, 300);
+  });
 })();
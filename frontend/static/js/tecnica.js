@@ -30,7 +30,7 @@ function setBrand(title, subtitle){
 
 async function loadBrand(){
   try{
-    const r = await fetch('/api/config', {cache:'no-store'});
+    const r = await fetch('/api/config', {cache:'no-cache'});
     if(r.ok){
       const c = await r.json();
       setBrand(c.appTitle, c.appSubtitle);
@@ -48,7 +48,7 @@ async function loadBrand(){
 
 async function loadSignificados(){
   try{
-    const r = await fetch('/api/significados', {cache:'no-store'});
+    const r = await fetch('/api/significados', {cache:'no-cache'});
     if(r.ok){
       _sigMap = await r.json();
       return;